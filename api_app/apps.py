@@ -0,0 +1,18 @@
+# api_app/apps.py
+from django.apps import AppConfig
+
+
+class ApiAppConfig(AppConfig):
+    name = 'api_app'
+
+    def ready(self):
+        from firebase_admin import firestore
+
+        from . import deadlines, snapshot, writebehind
+
+        # Las llamadas a Firestore heredan el plazo de la petición
+        deadlines.instrumentar(firestore.client())
+        # Calienta las cachés del worker desde el snapshot local (si existe)
+        snapshot.iniciar()
+        # Reenvía lo que haya quedado en la cola local de una ejecución anterior
+        writebehind.iniciar()
@@ -0,0 +1,146 @@
+# api_app/archive.py
+"""
+Archivo de las sesiones de asistencia de periodos cerrados.
+
+El comando ``archivar_asistencias`` empaqueta las sesiones anteriores al corte
+(inicio del periodo actual, ver ARCHIVO_MESES_PERIODO) en un documento por mes:
+
+    courses/{id}[/groups/{gid}]/assistancesArchive/{YYYY-MM}
+        = {mes, registros, fechas: {fecha: {cédula: datos}}}
+
+Si un mes supera ARCHIVO_MAX_BYTES se parte en ``{YYYY-MM}~1``, ``~2``...
+(las entradas de una fecha pueden quedar en varias partes y se combinan al
+leer). El curso guarda el corte en 'archivadoHasta'; los originales se borran
+después de escribirlo.
+
+leer_sesiones solo consulta el archivo cuando el rango pedido empieza antes del
+corte, así que los listados del periodo actual no leen nada del pasado. Los
+periodos archivados son de solo lectura: un registro posterior sobre una fecha
+archivada queda en la colección viva (se sigue leyendo) y el siguiente
+archivado lo incorpora. localizar_archivada sirve las consultas por ID de un
+registro que ya solo está en el archivo; editarlo o borrarlo responde 409.
+"""
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+
+from . import metrics
+from .ingestion import ZONA_COLOMBIA
+from .sharding import SEPARADOR_SHARD, coleccion_asistencias, consulta_fechas, entradas_por_fecha
+
+COLECCION_ARCHIVO = "assistancesArchive"
+CAMPO_ARCHIVADO = "archivadoHasta"
+
+
+def coleccion_archivo(course_id, group_id=None):
+    return coleccion_asistencias(course_id, group_id).parent.collection(COLECCION_ARCHIVO)
+
+
+def inicio_periodo(dia):
+    """Primer día del periodo académico que contiene el día (date)"""
+    meses = sorted(settings.ARCHIVO_MESES_PERIODO)
+    anteriores = [mes for mes in meses if mes <= dia.month]
+    if anteriores:
+        return date(dia.year, anteriores[-1], 1)
+    return date(dia.year - 1, meses[-1], 1)
+
+
+def corte_actual():
+    """'YYYY-MM-DD' del inicio del periodo actual (hora de Colombia)"""
+    return inicio_periodo(datetime.now(ZONA_COLOMBIA).date()).isoformat()
+
+
+def _tamano(fecha, campo, valor):
+    # Estimación por exceso del tamaño en Firestore (nombres + valores)
+    return len(fecha) + len(json.dumps({campo: valor}, default=str, ensure_ascii=False).encode())
+
+
+def empaquetar(por_fecha, max_bytes=None):
+    """
+    Sesiones de un mes o más (entradas_por_fecha) -> documentos de archivo.
+
+    Returns:
+        dict: doc_id -> {mes, registros, fechas}
+    """
+    max_bytes = max_bytes or settings.ARCHIVO_MAX_BYTES
+    documentos = {}
+    actual = {}  # mes -> (doc_id, tamaño acumulado)
+    for fecha in sorted(por_fecha):
+        mes = fecha[:7]
+        for campo, valor in por_fecha[fecha].items():
+            tamano = _tamano(fecha, campo, valor)
+            doc_id, acumulado = actual.get(mes, (None, 0))
+            if doc_id is None or (acumulado + tamano > max_bytes and documentos[doc_id]['fechas']):
+                parte = 0 if doc_id is None else int(doc_id.partition(SEPARADOR_SHARD)[2] or 0) + 1
+                doc_id = f"{mes}{SEPARADOR_SHARD}{parte}" if parte else mes
+                documentos[doc_id] = {'mes': mes, 'registros': 0, 'fechas': {}}
+                acumulado = 0
+            documento = documentos[doc_id]
+            documento['fechas'].setdefault(fecha, {})[campo] = valor
+            if isinstance(valor, dict):
+                documento['registros'] += 1
+            actual[mes] = (doc_id, acumulado + tamano)
+    return documentos
+
+
+def entradas_archivadas(documentos, desde=None, hasta=None):
+    """
+    Combina documentos de archivo (y sus partes) por fecha, filtrando el rango.
+
+    Returns:
+        dict: fecha -> {cédula: datos}, en orden de fecha
+    """
+    por_fecha = {}
+    for doc in documentos:
+        for fecha, campos in ((doc.to_dict() or {}).get('fechas') or {}).items():
+            if (desde and fecha < desde) or (hasta and fecha > hasta):
+                continue
+            por_fecha.setdefault(fecha, {}).update(campos)
+    return dict(sorted(por_fecha.items()))
+
+
+def leer_sesiones(course_id, group_id=None, archivado_hasta=None, desde=None, hasta=None):
+    """
+    Sesiones de una colección de asistencias entre dos fechas (inclusivas).
+
+    El archivo solo se consulta si el curso tiene corte y el rango empieza
+    antes de él. Lo vivo se lee después y gana: durante el archivado (y con
+    registros tardíos) una fecha puede estar en ambos lados.
+
+    Returns:
+        dict: fecha -> {cédula: datos}
+    """
+    por_fecha = {}
+    if archivado_hasta and (not desde or desde < archivado_hasta):
+        limite = min(hasta, archivado_hasta) if hasta else archivado_hasta
+        documentos = consulta_fechas(
+            coleccion_archivo(course_id, group_id), desde[:7] if desde else None, limite[:7]
+        ).stream()
+        por_fecha = entradas_archivadas(documentos, desde, hasta)
+        metrics.incrementar('archivo.lecturas')
+
+    vivas = entradas_por_fecha(consulta_fechas(coleccion_asistencias(course_id, group_id), desde, hasta).stream())
+    for fecha, entradas in vivas.items():
+        por_fecha.setdefault(fecha, {}).update(entradas)
+    return por_fecha
+
+
+def localizar_archivada(course_id, group_id, fecha, cedula, archivado_hasta):
+    """
+    Busca la entrada de la cédula en el archivo del mes (todas sus partes).
+
+    Returns:
+        tuple: (existe_sesion archivada, datos | None); sin consultar nada si
+               la fecha no es anterior al corte
+    """
+    if not archivado_hasta or fecha >= archivado_hasta:
+        return False, None
+    mes = fecha[:7]
+    documentos = consulta_fechas(coleccion_archivo(course_id, group_id), mes, mes).stream()
+    entradas = entradas_archivadas(documentos, fecha, fecha).get(fecha)
+    metrics.incrementar('archivo.lecturas')
+    if entradas is None:
+        return False, None
+    datos = entradas.get(cedula)
+    return True, datos if isinstance(datos, dict) else None
@@ -0,0 +1,182 @@
+# api_app/batch.py
+"""
+Sub-peticiones de /api/batch/ despachadas dentro del proceso.
+
+Cada sub-petición es {method, path, body?, headers?} sobre una ruta de
+api_app/urls.py ('/api/horarios/cursos/<id>/', 'asistencias/<id>/'...). Se
+arma un HttpRequest con los headers de identidad de la petición externa
+(X-User-UID, X-User-Email, X-User-Name) y se llama a la vista sin pasar otra
+vez por el middleware.
+
+- Todas comparten una caché de lecturas (request_cache.py): la persona y los
+  documentos de curso se leen una sola vez para el lote.
+- Las lecturas (GET) consecutivas corren en paralelo; una escritura espera a
+  las anteriores, corre sola y vacía la caché, así que el orden del lote
+  define el de los efectos.
+- Un error en una sub-petición es su propia respuesta; el lote sigue.
+"""
+import io
+import json
+import logging
+from urllib.parse import urlsplit
+
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .concurrency import en_paralelo
+from .request_cache import cache_peticion
+
+logger = logging.getLogger(__name__)
+
+URLCONF = 'api_app.urls'
+PREFIJO = '/api/'
+METODOS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+METODOS_LECTURA = ('GET',)
+# Headers que cada sub-petición puede fijar; los demás vienen de la petición externa
+HEADERS_PERMITIDOS = {'if-none-match': 'HTTP_IF_NONE_MATCH', 'if-modified-since': 'HTTP_IF_MODIFIED_SINCE'}
+HEADERS_RESPUESTA = ('ETag', 'Last-Modified', 'Location')
+# Rutas que no se pueden anidar en un lote
+RUTAS_EXCLUIDAS = ('batch',)
+
+
+class SubPeticion:
+    """Sub-petición ya validada y resuelta"""
+
+    def __init__(self, metodo, ruta, consulta, cuerpo, headers, coincidencia):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.consulta = consulta
+        self.cuerpo = cuerpo
+        self.headers = headers
+        self.coincidencia = coincidencia
+
+    @property
+    def es_lectura(self):
+        return self.metodo in METODOS_LECTURA
+
+
+def preparar(item):
+    """
+    Valida una sub-petición del lote y resuelve su vista.
+
+    Raises:
+        ValueError: Si la sub-petición no es válida o la ruta no existe
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Cada sub-petición debe ser un objeto {method, path, body?, headers?}")
+    metodo = str(item.get('method', 'GET')).upper()
+    if metodo not in METODOS:
+        raise ValueError(f"Método no soportado: {metodo}")
+
+    partes = urlsplit(str(item.get('path') or ''))
+    ruta = partes.path
+    if ruta.startswith(PREFIJO):
+        ruta = ruta[len(PREFIJO):]
+    ruta = ruta.lstrip('/')
+    try:
+        coincidencia = resolve('/' + ruta, urlconf=URLCONF)
+    except Resolver404:
+        raise ValueError(f"Ruta no encontrada: {item.get('path')}")
+    if coincidencia.url_name in RUTAS_EXCLUIDAS:
+        raise ValueError(f"La ruta {item.get('path')} no se puede usar dentro de un lote")
+
+    headers = {}
+    for nombre, valor in (item.get('headers') or {}).items():
+        clave = HEADERS_PERMITIDOS.get(str(nombre).lower())
+        if clave is None:
+            raise ValueError(f"Header no permitido en una sub-petición: {nombre}")
+        headers[clave] = str(valor)
+
+    cuerpo = item.get('body')
+    return SubPeticion(metodo, PREFIJO + ruta, partes.query, cuerpo, headers, coincidencia)
+
+
+def construir_request(externa, sub):
+    """HttpRequest de la sub-petición con la identidad de la petición externa"""
+    request = HttpRequest()
+    request.method = sub.metodo
+    request.path = request.path_info = sub.ruta
+    request.GET = QueryDict(sub.consulta)
+    request.resolver_match = sub.coincidencia
+
+    cuerpo = json.dumps(sub.cuerpo).encode() if sub.cuerpo is not None else b''
+    request._stream = io.BytesIO(cuerpo)
+    request._read_started = False
+
+    meta = {clave: valor for clave, valor in externa.META.items()
+            if clave.startswith('HTTP_') or clave in ('REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'wsgi.url_scheme')}
+    for clave in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_CONTENT_ENCODING'):
+        meta.pop(clave, None)
+    meta.update(sub.headers)
+    meta.update({
+        'REQUEST_METHOD': sub.metodo,
+        'PATH_INFO': sub.ruta,
+        'QUERY_STRING': sub.consulta,
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+    })
+    request.META = meta
+    request.content_type = 'application/json'
+    if hasattr(externa, 'user'):
+        request.user = externa.user
+    return request
+
+
+def ejecutar(externa, sub):
+    """Llama a la vista de la sub-petición y resume su respuesta"""
+    coincidencia = sub.coincidencia
+    try:
+        respuesta = coincidencia.func(construir_request(externa, sub), *coincidencia.args, **coincidencia.kwargs)
+    except Exception as e:
+        logger.error(f"❌ Error en sub-petición {sub.metodo} {sub.ruta}: {str(e)}")
+        return {'status': 500, 'body': {'error': str(e)}}
+
+    resultado = {'status': respuesta.status_code, 'body': getattr(respuesta, 'data', None)}
+    headers = {nombre: respuesta[nombre] for nombre in HEADERS_RESPUESTA if respuesta.has_header(nombre)}
+    if headers:
+        resultado['headers'] = headers
+    return resultado
+
+
+def ejecutar_lote(externa, items):
+    """
+    Ejecuta las sub-peticiones en orden de efectos: lecturas consecutivas en
+    paralelo, escrituras de una en una.
+
+    Returns:
+        list: Una respuesta {status, body, headers?} por sub-petición, en orden
+    """
+    resultados = [None] * len(items)
+    lecturas = []  # (posición, SubPeticion) pendientes
+
+    def correr_lecturas():
+        respuestas = en_paralelo([(ejecutar, externa, sub) for _, sub in lecturas])
+        for (posicion, _), respuesta in zip(lecturas, respuestas):
+            resultados[posicion] = respuesta
+        lecturas.clear()
+
+    with cache_peticion() as cache:
+        for posicion, item in enumerate(items):
+            try:
+                sub = preparar(item)
+            except ValueError as e:
+                resultados[posicion] = {'status': 400, 'body': {'error': str(e)}}
+                continue
+
+            if sub.es_lectura:
+                lecturas.append((posicion, sub))
+                continue
+
+            correr_lecturas()
+            resultados[posicion] = ejecutar(externa, sub)
+            # Lo que se leyó antes de la escritura puede haber cambiado
+            cache.vaciar()
+
+        correr_lecturas()
+
+    metrics.incrementar('batch.subpeticiones', len(items))
+    metrics.incrementar('batch.cache_aciertos', cache.aciertos)
+    logger.info(f"📦 Lote de {len(items)} sub-peticiones: {cache.lecturas} lecturas, {cache.aciertos} desde caché")
+    return resultados
@@ -0,0 +1,184 @@
+# api_app/coalescing.py
+"""
+Coalescencia de escrituras merge sobre un mismo documento.
+
+Durante el llamado a lista, todos los registros de una clase van al mismo
+documento de asistencias del día. Firestore sostiene alrededor de una
+escritura por segundo por documento; con decenas de set(merge=True)
+concurrentes aparecen contención y reintentos.
+
+El primer llamador de un documento abre una ventana de unos milisegundos; los
+que llegan durante la ventana agregan sus campos al mismo buffer. Al cerrarse,
+se hace un único set(merge=True) y todos los llamadores reciben su resultado
+(o la excepción) del mismo commit: nadie responde antes de que su dato esté escrito.
+Las escrituras adicionales de cada llamador (p. ej. el historial del
+estudiante) van en el mismo WriteBatch que el documento.
+Los commits de un mismo documento van de uno en uno; mientras uno está en
+vuelo, el buffer siguiente sigue acumulando.
+
+La agrupación es dentro del proceso: solo sirve con workers con hilos
+(gunicorn gthread, como en render.yaml). Con workers sync hay que poner
+COALESCENCIA_VENTANA_MS en 0.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from . import metrics
+from .writes import MAX_OPERACIONES_LOTE
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+LIMITES_TAMANO = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def fusionar_campos(destino, origen):
+    """Mezcla origen en destino como lo haría set(merge=True) (mapas anidados incluidos)"""
+    for clave, valor in origen.items():
+        actual = destino.get(clave)
+        if isinstance(valor, dict):
+            # Copia: el buffer nunca modifica los dicts de los llamadores
+            destino[clave] = fusionar_campos(actual if isinstance(actual, dict) else {}, valor)
+        else:
+            destino[clave] = valor
+    return destino
+
+
+def _agregar_escritura(pendiente, campos, adicionales):
+    fusionar_campos(pendiente.campos, campos)
+    for referencia, extra in adicionales:
+        _, acumulado = pendiente.adicionales.setdefault(referencia.path, (referencia, {}))
+        fusionar_campos(acumulado, extra)
+
+
+def _escribir(pendiente):
+    """Un set(merge=True), o un WriteBatch si hay escrituras adicionales"""
+    if not pendiente.adicionales:
+        return pendiente.referencia.set(pendiente.campos, merge=True)
+    batch = db.batch()
+    batch.set(pendiente.referencia, pendiente.campos, merge=True)
+    for referencia, campos in pendiente.adicionales.values():
+        batch.set(referencia, campos, merge=True)
+    return batch.commit()[0]
+
+
+class _Pendiente:
+    """Buffer de un documento mientras su ventana está abierta"""
+    __slots__ = ('referencia', 'campos', 'adicionales', 'encolados', 'cerrado', 'listo', 'resultado', 'error')
+
+    def __init__(self, referencia):
+        self.referencia = referencia
+        self.campos = {}
+        self.adicionales = {}  # ruta -> (referencia, campos)
+        self.encolados = []
+        self.cerrado = threading.Event()  # buffer lleno: el líder no espera la ventana completa
+        self.listo = threading.Event()    # commit terminado (con resultado o error)
+        self.resultado = None
+        self.error = None
+
+
+class CoalescedorEscrituras:
+    """Agrupa set(merge=True) concurrentes sobre el mismo documento; thread-safe"""
+
+    def __init__(self, ventana_ms, max_escrituras):
+        self.ventana = ventana_ms / 1000
+        # Cada llamador puede sumar una escritura adicional al WriteBatch (límite 500)
+        self.max_escrituras = min(max_escrituras, MAX_OPERACIONES_LOTE // 2 - 1)
+        self._lock = threading.Lock()
+        self._pendientes = {}  # ruta -> buffer abierto
+        self._en_vuelo = {}    # ruta -> buffer cuyo commit está en curso
+
+    def fusionar(self, referencia, campos, adicionales=()):
+        """
+        Escribe ``campos`` con merge en el documento, compartiendo el commit con
+        otras llamadas concurrentes sobre el mismo documento.
+
+        Args:
+            adicionales: [(referencia, campos)] escritos con merge en el mismo commit
+
+        Returns:
+            WriteResult: Resultado del commit compartido
+        """
+        if self.ventana <= 0:
+            pendiente = _Pendiente(referencia)
+            _agregar_escritura(pendiente, campos, adicionales)
+            return _escribir(pendiente)
+
+        encolado = time.perf_counter()
+        ruta = referencia.path
+        with self._lock:
+            pendiente = self._pendientes.get(ruta)
+            lider = pendiente is None
+            if lider:
+                pendiente = self._pendientes[ruta] = _Pendiente(referencia)
+            _agregar_escritura(pendiente, campos, adicionales)
+            pendiente.encolados.append(encolado)
+            if len(pendiente.encolados) >= self.max_escrituras:
+                # Las llamadas siguientes abren un buffer nuevo
+                del self._pendientes[ruta]
+                pendiente.cerrado.set()
+
+        if lider:
+            pendiente.cerrado.wait(self.ventana)
+            # Esperar el commit anterior del mismo documento; el buffer sigue abierto mientras tanto
+            while True:
+                with self._lock:
+                    anterior = self._en_vuelo.get(ruta)
+                    if anterior is None:
+                        if self._pendientes.get(ruta) is pendiente:
+                            del self._pendientes[ruta]
+                        self._en_vuelo[ruta] = pendiente
+                        break
+                anterior.listo.wait()
+
+            try:
+                self._confirmar(pendiente)
+            finally:
+                with self._lock:
+                    del self._en_vuelo[ruta]
+                pendiente.listo.set()
+        else:
+            pendiente.listo.wait()
+
+        if pendiente.error is not None:
+            raise pendiente.error
+        return pendiente.resultado
+
+    def _confirmar(self, pendiente):
+        inicio = time.perf_counter()
+        try:
+            pendiente.resultado = _escribir(pendiente)
+        except Exception as e:
+            pendiente.error = e
+            metrics.incrementar('coalescencia.errores')
+            logger.error(f"❌ Escritura agrupada fallida en {pendiente.referencia.path}: {str(e)}")
+
+        fin = time.perf_counter()
+        tamano = len(pendiente.encolados)
+        metrics.incrementar('coalescencia.flushes')
+        metrics.incrementar('coalescencia.escrituras', tamano)
+        metrics.observar('coalescencia.tamano_flush', tamano, LIMITES_TAMANO)
+        metrics.observar('coalescencia.commit_ms', (fin - inicio) * 1000)
+        for encolado in pendiente.encolados:
+            # Latencia que agrega la espera en el buffer (sin contar el commit)
+            metrics.observar('coalescencia.espera_ms', (inicio - encolado) * 1000)
+
+
+_coalescedor = None
+_lock_global = threading.Lock()
+
+
+def obtener_coalescedor():
+    global _coalescedor
+    if _coalescedor is None:
+        with _lock_global:
+            if _coalescedor is None:
+                _coalescedor = CoalescedorEscrituras(
+                    settings.COALESCENCIA_VENTANA_MS,
+                    settings.COALESCENCIA_MAX_ESCRITURAS
+                )
+    return _coalescedor
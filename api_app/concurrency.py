@@ -0,0 +1,60 @@
+# api_app/concurrency.py
+"""
+Sub-consultas concurrentes dentro de una petición.
+
+Las lecturas a Firestore son RPCs bloqueantes; cuando una vista necesita
+varias independientes (p. ej. /api/bootstrap/) se lanzan en un
+ThreadPoolExecutor compartido por el proceso (CONSULTAS_HILOS hilos) y la
+petición espera a todas. Cada tarea corre en una copia del contexto de la
+petición (contextvars), así que ve el mismo estado por petición.
+
+Una llamada anidada (una tarea del pool que a su vez llama a en_paralelo, p.
+ej. /api/bootstrap/ dentro de /api/batch/) corre sus tareas en el mismo hilo:
+si esperara a otros hilos del pool, con todos ocupados esperando, el proceso
+quedaría bloqueado para siempre.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_pool = None
+_lock_global = threading.Lock()
+_hilo = threading.local()
+
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        with _lock_global:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.CONSULTAS_HILOS, thread_name_prefix='consulta')
+    return _pool
+
+
+def en_paralelo(tareas):
+    """
+    Ejecuta las tareas concurrentemente y espera a todas.
+
+    Args:
+        tareas: Lista de (función, *argumentos)
+
+    Returns:
+        list: Resultados en el mismo orden; si una tarea falla se relanza su excepción
+    """
+    if len(tareas) <= 1 or getattr(_hilo, 'en_pool', False):
+        return [funcion(*argumentos) for funcion, *argumentos in tareas]
+
+    pool = obtener_pool()
+    futuros = [pool.submit(contextvars.copy_context().run, _en_pool, funcion, *argumentos)
+               for funcion, *argumentos in tareas]
+    return [futuro.result() for futuro in futuros]
+
+
+def _en_pool(funcion, *argumentos):
+    _hilo.en_pool = True
+    try:
+        return funcion(*argumentos)
+    finally:
+        _hilo.en_pool = False
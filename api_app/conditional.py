@@ -0,0 +1,93 @@
+# api_app/conditional.py
+"""
+Validadores HTTP (ETag / Last-Modified) para GET condicionales.
+
+Los validadores se derivan de los ``update_time`` que Firestore asigna a cada
+documento, por lo que cualquier escritura sobre un curso los cambia sin
+necesidad de llevar un contador de versiones aparte.
+"""
+import hashlib
+from datetime import datetime
+
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _marca_tiempo(update_time):
+    """Representación exacta (con nanosegundos si existen) de un update_time"""
+    if hasattr(update_time, 'rfc3339'):
+        return update_time.rfc3339()
+    return update_time.isoformat()
+
+
+def calcular_validadores(versiones, *extra):
+    """
+    Calcula el ETag fuerte y la fecha Last-Modified de una respuesta.
+
+    Args:
+        versiones: Dict {doc_id: update_time} de los documentos que forman la respuesta
+        *extra: Valores adicionales que también alteran el cuerpo (usuario, tipo,
+            formato de la representación, etc.)
+
+    Returns:
+        tuple: (etag, last_modified) - last_modified es None si no hay documentos
+    """
+    partes = [f"{doc_id}@{_marca_tiempo(ts)}" for doc_id, ts in sorted(versiones.items()) if ts]
+    partes.extend(str(valor) for valor in extra)
+
+    digest = hashlib.sha256("|".join(partes).encode('utf-8')).hexdigest()[:32]
+    etag = quote_etag(digest)
+
+    tiempos = [ts for ts in versiones.values() if ts]
+    last_modified = max(tiempos) if tiempos else None
+
+    return etag, last_modified
+
+
+def _etag_coincide(etag, if_none_match):
+    """Comparación débil (RFC 9110 §13.1.2), la que corresponde a If-None-Match"""
+    etags = parse_etags(if_none_match)
+    if etags == ['*']:
+        return True
+    limpio = etag.removeprefix('W/')
+    return any(candidato.removeprefix('W/') == limpio for candidato in etags)
+
+
+def respuesta_no_modificada(request, etag, last_modified):
+    """
+    Evalúa If-None-Match / If-Modified-Since.
+
+    Returns:
+        Response | None: Respuesta 304 si el cliente ya tiene la versión actual
+    """
+    if_none_match = request.headers.get('If-None-Match')
+
+    if if_none_match:
+        # Si viene If-None-Match, If-Modified-Since se ignora (RFC 9110 §13.1.3)
+        vigente = _etag_coincide(etag, if_none_match)
+    else:
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        vigente = (
+            if_modified_since is not None
+            and last_modified is not None
+            and int(last_modified.timestamp()) <= if_modified_since
+        )
+
+    if not vigente:
+        return None
+
+    return aplicar_validadores(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+
+def aplicar_validadores(response, etag, last_modified):
+    """Agrega ETag, Last-Modified y cabeceras de caché a la respuesta"""
+    response['ETag'] = etag
+    if isinstance(last_modified, datetime):
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+
+    # El contenido depende del usuario: solo cachés privadas y siempre revalidando
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Accept', 'X-User-UID'])
+    return response
@@ -0,0 +1,473 @@
+# api_app/deadlines.py
+"""
+Plazo por petición para las llamadas a Firestore y lecturas cubiertas (hedged).
+
+PlazoMiddleware fija al empezar cada petición un plazo de
+PLAZO_PETICION_SEGUNDOS en un ContextVar. ``instrumentar(db)`` (desde
+ApiAppConfig.ready) envuelve los métodos RPC del cliente de Firestore del
+proceso, así que toda llamada hecha durante la petición (desde views.py o
+desde los módulos que usa, también en las tareas de concurrency.en_paralelo,
+que copian el contexto) recibe como timeout, reintentos incluidos, el tiempo
+que le queda al plazo. Con el plazo agotado la llamada no se hace y se lanza
+PlazoAgotado; también cuando una llamada vence porque se acabó el plazo de
+la petición. No es un DeadlineExceeded de Firestore a propósito: una petición
+lenta no indica que Firestore esté caído y no debe activar el modo degradado
+(snapshot.ERRORES_CONEXION).
+
+Lecturas cubiertas: las lecturas idempotentes (BatchGetDocuments, RunQuery y
+RunAggregationQuery fuera de una transacción) corren en un pool propio; si la
+primera no responde dentro del percentil COBERTURA_PERCENTIL de las latencias
+recientes del método (contado desde que la lectura empieza, no desde que se
+encola), se lanza un duplicado y gana la primera respuesta. Si la lectura
+tuvo que esperar en cola un umbral completo, el pool está saturado y no se
+duplica. Si gana la primera, el duplicado se cancela (o no llega a empezar);
+si gana el duplicado, la primera sigue hasta terminar para medir cuánto se
+ahorró.
+
+Fuera de una petición (comandos, hilos en segundo plano) no hay plazo ni
+duplicados: las llamadas pasan sin cambios.
+
+Conteo de RPCs: dentro de ``contar_rpcs()`` cada RPC que hace el cliente
+instrumentado suma en un contador del contexto, también desde las tareas de
+en_paralelo y los intentos del pool de cobertura (duplicados incluidos). Lo
+usa ProfilingMiddleware: el perfil solo ve el hilo de la petición.
+
+Métricas por método: firestore.<método>.lecturas, .coberturas y
+.coberturas_ganadas (contadores); .ms (latencia vista por la vista) y
+.ahorro_ms (primera llamada menos latencia vista, cuando ganó el duplicado).
+``resumen()`` da la tasa de cobertura y el p99 con y sin duplicados.
+"""
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from google.api_core import gapic_v1
+from google.api_core.exceptions import DeadlineExceeded, RetryError
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_limite = contextvars.ContextVar('plazo_peticion', default=None)
+_rpcs = contextvars.ContextVar('rpcs_peticion', default=None)
+
+# Lecturas que se pueden duplicar sin efectos (fuera de una transacción)
+METODOS_LECTURA = ('batch_get_documents', 'run_query', 'run_aggregation_query')
+# Métodos que heredan el plazo; rollback no, para que una transacción fallida se libere
+METODOS_CON_PLAZO = METODOS_LECTURA + (
+    'list_documents', 'list_collection_ids', 'begin_transaction', 'commit', 'batch_write'
+)
+# Se cuentan pero no heredan el plazo
+METODOS_CONTADOS = ('rollback',)
+# Muestras nuevas antes de recalcular el umbral de un método
+RECALCULO = 20
+# Un timeout que vence con menos de esto de plazo se atribuye al plazo
+MARGEN_PLAZO = 0.05
+
+
+class PlazoAgotado(Exception):
+    """Se acabó el plazo de la petición (no es una falla de Firestore)"""
+
+
+# ============================================
+# PLAZO DE LA PETICIÓN
+# ============================================
+@contextlib.contextmanager
+def plazo(segundos):
+    """Plazo para el bloque; dentro de otro más corto se conserva el más corto"""
+    limite = time.monotonic() + segundos
+    actual = _limite.get()
+    if actual is not None:
+        limite = min(limite, actual)
+    token = _limite.set(limite)
+    try:
+        yield
+    finally:
+        _limite.reset(token)
+
+
+def restante():
+    """Segundos que le quedan al plazo actual (None si no hay plazo)"""
+    limite = _limite.get()
+    if limite is None:
+        return None
+    return limite - time.monotonic()
+
+
+class PlazoMiddleware:
+    """Fija el plazo de la petición; PLAZO_PETICION_SEGUNDOS = 0 lo desactiva"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.segundos = settings.PLAZO_PETICION_SEGUNDOS
+
+    def __call__(self, request):
+        if self.segundos <= 0:
+            return self.get_response(request)
+        with plazo(self.segundos):
+            return self.get_response(request)
+
+
+# ============================================
+# CONTEO DE RPCS
+# ============================================
+class ContadorRPC:
+    """RPCs hechos dentro de un contar_rpcs(), desde cualquier hilo con su contexto"""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def sumar(self):
+        with self._lock:
+            self.total += 1
+
+
+@contextlib.contextmanager
+def contar_rpcs():
+    """Cuenta los RPCs a Firestore del bloque (y de las tareas que copian su contexto)"""
+    contador = ContadorRPC()
+    token = _rpcs.set(contador)
+    try:
+        yield contador
+    finally:
+        _rpcs.reset(token)
+
+
+def _contar_rpc():
+    contador = _rpcs.get()
+    if contador is not None:
+        contador.sumar()
+
+
+def _retry_por_defecto(api, nombre):
+    # El mismo Retry que usaría el cliente GAPIC sin argumentos
+    transporte = api._transport
+    envuelto = transporte._wrapped_methods.get(getattr(transporte, nombre))
+    return getattr(envuelto, '_retry', None)
+
+
+def _verificar_plazo(nombre):
+    """Segundos restantes; PlazoAgotado si ya no queda nada"""
+    tiempo = restante()
+    if tiempo <= 0:
+        metrics.incrementar('plazo.agotados')
+        raise PlazoAgotado(f"Plazo de la petición agotado antes de {nombre}")
+    return tiempo
+
+
+def _con_plazo(api, nombre, kwargs):
+    """kwargs de la llamada con timeout y reintentos limitados al plazo restante"""
+    tiempo = _verificar_plazo(nombre)
+
+    kwargs = dict(kwargs)
+    timeout = kwargs.get('timeout', gapic_v1.method.DEFAULT)
+    if isinstance(timeout, (int, float)):
+        tiempo = min(tiempo, timeout)
+    kwargs['timeout'] = tiempo
+
+    retry = kwargs.get('retry', gapic_v1.method.DEFAULT)
+    if retry is gapic_v1.method.DEFAULT:
+        retry = _retry_por_defecto(api, nombre)
+    if retry is not None:
+        kwargs['retry'] = retry.with_timeout(tiempo)
+    return kwargs
+
+
+def _traducir_vencimiento(nombre, error):
+    """
+    DeadlineExceeded (o RetryError por uno) al acabarse el plazo -> PlazoAgotado.
+    Un RetryError por otra causa (p. ej. 503 repetidos) sí es una falla de Firestore.
+    """
+    causa = error.cause if isinstance(error, RetryError) else error
+    tiempo = restante()
+    if isinstance(causa, DeadlineExceeded) and tiempo is not None and tiempo <= MARGEN_PLAZO:
+        metrics.incrementar('plazo.agotados')
+        raise PlazoAgotado(f"Plazo de la petición agotado durante {nombre}") from error
+    raise error
+
+
+def _iterar_con_plazo(nombre, respuestas):
+    # Los streams fallan al iterarlos, no al llamarlos
+    try:
+        yield from respuestas
+    except (DeadlineExceeded, RetryError) as e:
+        _traducir_vencimiento(nombre, e)
+
+
+def _en_transaccion(args, kwargs):
+    peticion = kwargs.get('request', args[0] if args else None)
+    if isinstance(peticion, dict):
+        return bool(peticion.get('transaction') or peticion.get('new_transaction'))
+    return bool(getattr(peticion, 'transaction', None))
+
+
+# ============================================
+# LECTURAS CUBIERTAS
+# ============================================
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(int(p / 100 * len(ordenados)), len(ordenados) - 1)]
+
+
+class LatenciasMetodo:
+    """
+    Latencias recientes de un método: las de la primera llamada (fijan el
+    umbral y son las que habría sin duplicados) y las vistas por la vista.
+    """
+
+    def __init__(self, ventana, percentil, minimo_muestras, minimo_ms):
+        self.percentil = percentil
+        self.minimo_muestras = minimo_muestras
+        self.minimo_ms = minimo_ms
+        self.primeras = deque(maxlen=ventana)
+        self.vistas = deque(maxlen=ventana)
+        self._umbral = None
+        self._nuevas = 0
+        self._lock = threading.Lock()
+
+    def umbral(self):
+        """Segundos tras los que se lanza el duplicado (None mientras no haya muestras)"""
+        return self._umbral
+
+    def observar_primera(self, ms):
+        with self._lock:
+            self.primeras.append(ms)
+            self._nuevas += 1
+            if len(self.primeras) >= self.minimo_muestras and (self._umbral is None or self._nuevas >= RECALCULO):
+                self._umbral = max(_percentil(self.primeras, self.percentil), self.minimo_ms) / 1000
+                self._nuevas = 0
+
+    def observar_vista(self, ms):
+        with self._lock:
+            self.vistas.append(ms)
+
+    def p99(self):
+        with self._lock:
+            return _percentil(self.primeras, 99), _percentil(self.vistas, 99)
+
+
+def _intento(api, nombre, metodo, args, kwargs, llamada):
+    """
+    Hace la lectura completa. El timeout se calcula al empezar (no al encolar) y
+    en 'llamada' quedan el momento de inicio y el iterador, para poder cancelarlo.
+    Si el otro intento ya respondió mientras este esperaba en cola, no se hace.
+    """
+    if llamada['resuelta'].is_set():
+        raise CancelledError()
+    llamada['inicio'] = inicio = time.perf_counter()
+    llamada['empezo'].set()
+    _contar_rpc()
+    respuestas = metodo(*args, **_con_plazo(api, nombre, kwargs))
+    llamada['iterador'] = respuestas
+    resultado = list(respuestas)
+    llamada['resuelta'].set()
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def _llamada(resuelta=None):
+    """Estado de un intento; 'resuelta' se comparte entre la primera y el duplicado"""
+    return {'empezo': threading.Event(), 'resuelta': resuelta or threading.Event()}
+
+
+def _cancelar(llamada):
+    iterador = llamada.get('iterador')
+    if iterador is not None and hasattr(iterador, 'cancel'):
+        iterador.cancel()
+
+
+class LectorCubierto:
+    """Lecturas con duplicado tras el umbral de latencia de cada método"""
+
+    def __init__(self, hilos, ventana, percentil, minimo_muestras, minimo_ms):
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='cobertura')
+        self._parametros = (ventana, percentil, minimo_muestras, minimo_ms)
+        self._latencias = {}
+        self._lock = threading.Lock()
+
+    def latencias(self, nombre):
+        with self._lock:
+            if nombre not in self._latencias:
+                self._latencias[nombre] = LatenciasMetodo(*self._parametros)
+            return self._latencias[nombre]
+
+    def leer(self, api, nombre, metodo, args, kwargs):
+        """
+        Lectura con plazo y, si tarda más que el umbral, con duplicado.
+
+        Returns:
+            iterator: Las respuestas del stream, ya leídas
+        """
+        latencias = self.latencias(nombre)
+        umbral = latencias.umbral()
+        metrics.incrementar(f'firestore.{nombre}.lecturas')
+        inicio = time.perf_counter()
+
+        if umbral is None:
+            # Sin muestras suficientes todavía: sin duplicado, en el mismo hilo
+            respuestas, ms = _intento(api, nombre, metodo, args, kwargs, _llamada())
+            latencias.observar_primera(ms)
+            return self._entregar(latencias, nombre, respuestas, inicio)
+
+        _verificar_plazo(nombre)
+        primera = _llamada()
+        futuro = self._enviar(api, nombre, metodo, args, kwargs, primera)
+        vista = {}
+        futuro.add_done_callback(functools.partial(self._primera_terminada, latencias, nombre, vista))
+
+        # El umbral cuenta desde que la lectura empieza, no desde que se encola
+        if not primera['empezo'].wait(timeout=max(restante(), 0)):
+            if futuro.cancel():
+                metrics.incrementar('plazo.agotados')
+                raise PlazoAgotado(f"Plazo de la petición agotado esperando un hilo para {nombre}")
+        cola = primera.get('inicio', inicio) - inicio
+        espera = max(umbral - (time.perf_counter() - primera.get('inicio', inicio)), 0)
+        hechos, _ = wait([futuro], timeout=espera)
+        if hechos or restante() < umbral or cola >= umbral:
+            # Respondió a tiempo, ya no queda plazo para que el duplicado ayude o
+            # el pool está saturado (la lectura esperó en cola): un duplicado solo
+            # agregaría carga
+            respuestas, _ = futuro.result()
+            return self._entregar(latencias, nombre, respuestas, inicio)
+
+        metrics.incrementar(f'firestore.{nombre}.coberturas')
+        segunda = _llamada(primera['resuelta'])
+        duplicado = self._enviar(api, nombre, metodo, args, kwargs, segunda)
+
+        pendientes = {futuro, duplicado}
+        error = None
+        while pendientes:
+            hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for hecho in hechos:
+                if hecho.exception() is not None:
+                    error = error or hecho.exception()
+                    continue
+                respuestas, _ = hecho.result()
+                if hecho is duplicado:
+                    metrics.incrementar(f'firestore.{nombre}.coberturas_ganadas')
+                    vista['ms'] = (time.perf_counter() - inicio) * 1000
+                else:
+                    # Si el duplicado sigue en cola no llega a ejecutarse
+                    duplicado.cancel()
+                    _cancelar(segunda)
+                return self._entregar(latencias, nombre, respuestas, inicio)
+        raise error
+
+    def _enviar(self, api, nombre, metodo, args, kwargs, llamada):
+        # Con el contexto de la petición: el plazo se lee al empezar el intento
+        return self._pool.submit(contextvars.copy_context().run, _intento, api, nombre, metodo, args, kwargs, llamada)
+
+    def _entregar(self, latencias, nombre, respuestas, inicio):
+        ms = (time.perf_counter() - inicio) * 1000
+        latencias.observar_vista(ms)
+        metrics.observar(f'firestore.{nombre}.ms', ms)
+        return iter(respuestas)
+
+    @staticmethod
+    def _primera_terminada(latencias, nombre, vista, futuro):
+        if futuro.cancelled() or futuro.exception() is not None:
+            return
+        _, ms = futuro.result()
+        latencias.observar_primera(ms)
+        if 'ms' in vista:
+            metrics.observar(f'firestore.{nombre}.ahorro_ms', max(ms - vista['ms'], 0))
+
+    def resumen(self):
+        with self._lock:
+            latencias = dict(self._latencias)
+        contadores = metrics.instantanea()['contadores']
+        resultado = {}
+        for nombre, metodo in sorted(latencias.items()):
+            lecturas = contadores.get(f'firestore.{nombre}.lecturas', 0)
+            coberturas = contadores.get(f'firestore.{nombre}.coberturas', 0)
+            p99_sin, p99_con = metodo.p99()
+            umbral = metodo.umbral()
+            resultado[nombre] = {
+                'lecturas': lecturas,
+                'coberturas': coberturas,
+                'ganadas': contadores.get(f'firestore.{nombre}.coberturas_ganadas', 0),
+                'tasa': round(coberturas / lecturas, 4) if lecturas else None,
+                'umbral_ms': round(umbral * 1000, 3) if umbral is not None else None,
+                'p99_sin_cobertura_ms': round(p99_sin, 3) if p99_sin is not None else None,
+                'p99_ms': round(p99_con, 3) if p99_con is not None else None,
+                'p99_ahorro_ms': round(p99_sin - p99_con, 3) if None not in (p99_sin, p99_con) else None,
+            }
+        return resultado
+
+
+_lector = None
+_lock_global = threading.Lock()
+
+
+def obtener_lector():
+    global _lector
+    if _lector is None:
+        with _lock_global:
+            if _lector is None:
+                _lector = LectorCubierto(
+                    settings.COBERTURA_HILOS,
+                    settings.COBERTURA_VENTANA,
+                    settings.COBERTURA_PERCENTIL,
+                    settings.COBERTURA_MIN_MUESTRAS,
+                    settings.COBERTURA_MIN_MS,
+                )
+    return _lector
+
+
+def resumen():
+    """Tasa de cobertura y p99 con y sin duplicados, por método"""
+    return obtener_lector().resumen()
+
+
+# ============================================
+# INSTRUMENTACIÓN DEL CLIENTE
+# ============================================
+def _envolver(api, nombre, original):
+    lectura = nombre in METODOS_LECTURA
+
+    @functools.wraps(original)
+    def llamada(*args, **kwargs):
+        if _limite.get() is None:
+            _contar_rpc()
+            return original(*args, **kwargs)
+        try:
+            if lectura and settings.COBERTURA_ACTIVA and not _en_transaccion(args, kwargs):
+                # Cada intento (y su duplicado) se cuenta en _intento
+                return obtener_lector().leer(api, nombre, original, args, kwargs)
+            _contar_rpc()
+            respuesta = original(*args, **_con_plazo(api, nombre, kwargs))
+        except (DeadlineExceeded, RetryError) as e:
+            _traducir_vencimiento(nombre, e)
+        return _iterar_con_plazo(nombre, respuesta) if lectura else respuesta
+
+    return llamada
+
+
+def _envolver_conteo(original):
+    @functools.wraps(original)
+    def llamada(*args, **kwargs):
+        _contar_rpc()
+        return original(*args, **kwargs)
+
+    return llamada
+
+
+def instrumentar(cliente):
+    """Envuelve los métodos RPC del cliente GAPIC de Firestore (una vez por cliente)"""
+    api = cliente._firestore_api
+    if getattr(api, '_con_plazo', False):
+        return
+    for nombre in METODOS_CON_PLAZO:
+        setattr(api, nombre, _envolver(api, nombre, getattr(api, nombre)))
+    for nombre in METODOS_CONTADOS:
+        setattr(api, nombre, _envolver_conteo(getattr(api, nombre)))
+    api._con_plazo = True
+    logger.info("⏱️ Cliente de Firestore con plazo por petición")
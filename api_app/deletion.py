@@ -0,0 +1,139 @@
+# api_app/deletion.py
+"""
+Borrado en cascada de documentos con todas sus subcolecciones.
+
+Firestore no borra subcolecciones al borrar el documento padre: sin esto,
+'groups' y 'assistances' de un curso eliminado quedan huérfanas.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from firebase_admin import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from .jobs import TrabajoCancelado
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+
+def contar_descendientes(referencias, limite):
+    """
+    Cuenta documentos bajo las subcolecciones de las referencias, deteniéndose
+    al pasar el límite (una agregación count por subcolección).
+
+    Returns:
+        int: Número de documentos descendientes (como máximo limite + 1)
+    """
+    total = 0
+    for doc_ref in referencias:
+        for col_ref in doc_ref.collections():
+            restante = limite + 1 - total
+            if restante <= 0:
+                return total
+            resultado = col_ref.recursive().limit(restante).count().get()
+            total += int(resultado[0][0].value)
+    return total
+
+
+class BorradorRecursivo:
+    """
+    Borra documentos y todos sus descendientes con un BulkWriter.
+
+    - Las subcolecciones se recorren en paralelo (una consulta recursiva cada una).
+    - El BulkWriter limita las operaciones por segundo (regla 500/50/5).
+    - ``progreso(borrados, encolados)`` se llama a medida que se confirman escrituras.
+    - ``cancelado()`` (opcional) detiene el recorrido; los documentos padre no se
+      borran si el trabajo se cancela, así que el borrado se puede repetir.
+    """
+
+    def __init__(self, progreso=None, cancelado=None, hilos=None, ops_por_segundo=None,
+                 max_ops_por_segundo=None):
+        self.progreso = progreso
+        self.cancelado = cancelado
+        self.hilos = hilos or settings.BORRADO_HILOS
+        self.ops_por_segundo = ops_por_segundo or settings.BORRADO_OPS_POR_SEGUNDO
+        self.max_ops_por_segundo = max_ops_por_segundo or settings.BORRADO_MAX_OPS_POR_SEGUNDO
+
+        self.encolados = 0
+        self.borrados = 0
+        self.fallidos = 0
+        self._lock = threading.Lock()
+        # BulkWriter no es thread-safe; lock aparte para no bloquear los callbacks
+        # de resultados mientras delete() espera al limitador de velocidad
+        self._lock_writer = threading.Lock()
+
+    def _al_escribir(self, referencia, resultado, writer):
+        with self._lock:
+            self.borrados += 1
+            borrados, encolados = self.borrados, self.encolados
+        if self.progreso and borrados % 100 == 0:
+            self.progreso(borrados, encolados)
+
+    def _al_fallar(self, fallo, writer):
+        # Reintentar errores transitorios; BulkWriter aplica backoff entre intentos
+        if fallo.attempts < 10:
+            return True
+        with self._lock:
+            self.fallidos += 1
+        logger.error(f"❌ No se pudo borrar {fallo.operation.reference.path}: {fallo.message}")
+        return False
+
+    def _encolar(self, writer, referencia):
+        with self._lock_writer:
+            writer.delete(referencia)
+        with self._lock:
+            self.encolados += 1
+
+    def _borrar_coleccion(self, writer, col_ref):
+        """Encola todos los documentos bajo una subcolección (a cualquier profundidad)"""
+        query = col_ref.recursive().select([FieldPath.document_id()])
+        for doc in query.stream():
+            if self._cancelado():
+                raise TrabajoCancelado()
+            self._encolar(writer, doc.reference)
+
+    def _cancelado(self):
+        return bool(self.cancelado and self.cancelado())
+
+    def borrar(self, referencias):
+        """
+        Borra las referencias de documento y todas sus subcolecciones.
+
+        Returns:
+            int: Documentos borrados (padres incluidos)
+        """
+        writer = db.bulk_writer(BulkWriterOptions(
+            initial_ops_per_second=self.ops_por_segundo,
+            max_ops_per_second=self.max_ops_por_segundo
+        ))
+        writer.on_write_result(self._al_escribir)
+        writer.on_write_error(self._al_fallar)
+
+        try:
+            colecciones = [col_ref for doc_ref in referencias for col_ref in doc_ref.collections()]
+            logger.info(f"🗑️ Borrado en cascada: {len(referencias)} documentos, {len(colecciones)} subcolecciones")
+
+            with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='borrado') as pool:
+                for futuro in [pool.submit(self._borrar_coleccion, writer, col) for col in colecciones]:
+                    futuro.result()
+
+            # Los padres al final: si algo falla a mitad, el curso sigue visible
+            # y el borrado se puede repetir
+            if self._cancelado():
+                raise TrabajoCancelado()
+            for doc_ref in referencias:
+                self._encolar(writer, doc_ref)
+        finally:
+            writer.close()
+
+        if self.progreso:
+            self.progreso(self.borrados, self.encolados)
+
+        logger.info(f"✅ Borrado en cascada: {self.borrados} borrados, {self.fallidos} fallidos")
+        if self.fallidos:
+            raise RuntimeError(f"{self.fallidos} documentos no se pudieron borrar")
+        return self.borrados
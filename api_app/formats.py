@@ -0,0 +1,85 @@
+# api_app/formats.py
+"""
+Formatos alternativos de la respuesta de AsistenciaList (?format=).
+
+En la lista plana cada registro repite asignatura, courseId, groupId,
+fechaYhora, fechaDocId, hasGroups y un id compuesto. Los dos formatos de aquí
+guardan cada dato una sola vez; la lista plana se reconstruye en el cliente:
+
+grouped — curso -> grupo -> fecha -> estudiantes:
+
+    {"formato": "grouped", "total": N, "cursos": {
+        "<courseId>": {"hasGroups": true, "grupos": {
+            "<groupId>": {"asignatura": "...", "fechas": {
+                "<fecha>": {"<cedula>": {"estadoAsistencia", "horaRegistro", "late"}}}}}},
+        "<courseId sin grupos>": {"hasGroups": false, "asignatura": "...", "fechas": {...}}}}
+
+columnar — un arreglo por campo; 'clase' es el índice en 'clases':
+
+    {"formato": "columnar", "total": N,
+     "clases": [{"courseId", "groupId", "asignatura", "hasGroups"}],
+     "columnas": {"clase": [...], "fechaYhora": [...], "estudiante": [...],
+                  "estadoAsistencia": [...], "horaRegistro": [...], "late": [...]}}
+
+En ambos, id = courseId[_groupId]_fecha_cedula y fechaDocId = fechaYhora.
+"""
+FORMATO_PLANO = 'flat'
+
+
+def _datos_estudiante(asistencia):
+    return {
+        'estadoAsistencia': asistencia['estadoAsistencia'],
+        'horaRegistro': asistencia['horaRegistro'],
+        'late': asistencia['late'],
+    }
+
+
+def agrupar_asistencias(asistencias):
+    """Lista plana (obtener_asistencias_curso) -> formato grouped"""
+    cursos = {}
+    for asistencia in asistencias:
+        curso = cursos.setdefault(asistencia['courseId'], {'hasGroups': asistencia['hasGroups']})
+        if asistencia['hasGroups']:
+            destino = curso.setdefault('grupos', {}).setdefault(
+                asistencia['groupId'], {'asignatura': asistencia['asignatura'], 'fechas': {}}
+            )
+        else:
+            destino = curso
+            curso.setdefault('asignatura', asistencia['asignatura'])
+            curso.setdefault('fechas', {})
+        destino['fechas'].setdefault(asistencia['fechaYhora'], {})[asistencia['estudiante']] = \
+            _datos_estudiante(asistencia)
+
+    return {'formato': 'grouped', 'total': len(asistencias), 'cursos': cursos}
+
+
+def columnas_asistencias(asistencias):
+    """Lista plana (obtener_asistencias_curso) -> formato columnar"""
+    clases = []
+    indices = {}
+    columnas = {campo: [] for campo in
+                ('clase', 'fechaYhora', 'estudiante', 'estadoAsistencia', 'horaRegistro', 'late')}
+
+    for asistencia in asistencias:
+        clave = (asistencia['courseId'], asistencia.get('groupId'))
+        indice = indices.get(clave)
+        if indice is None:
+            indice = indices[clave] = len(clases)
+            clases.append({
+                'courseId': asistencia['courseId'],
+                'groupId': asistencia.get('groupId'),
+                'asignatura': asistencia['asignatura'],
+                'hasGroups': asistencia['hasGroups'],
+            })
+        columnas['clase'].append(indice)
+        for campo in ('fechaYhora', 'estudiante', 'estadoAsistencia', 'horaRegistro', 'late'):
+            columnas[campo].append(asistencia[campo])
+
+    return {'formato': 'columnar', 'total': len(asistencias), 'clases': clases, 'columnas': columnas}
+
+
+FORMATOS_ASISTENCIA = {
+    FORMATO_PLANO: None,
+    'grouped': agrupar_asistencias,
+    'columnar': columnas_asistencias,
+}
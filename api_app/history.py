@@ -0,0 +1,119 @@
+# api_app/history.py
+"""
+Índice de historial de asistencia por estudiante.
+
+Las sesiones se guardan por fecha con la cédula como nombre de campo, así que
+ninguna consulta puede seleccionar a un estudiante. Este índice desnormaliza
+cada entrada en la persona:
+
+    person/{cedula}/attendance/{courseId}_{groupId}_{fecha}   (o {courseId}_{fecha})
+        = {courseId, groupId, asignatura, fecha, estadoAsistencia, horaRegistro, late}
+
+El ID es el de la asistencia sin la cédula. Crear, actualizar y borrar una
+asistencia escriben la entrada en el mismo lote que la sesión, borrar un
+curso borra sus entradas, y el comando ``reconstruir_historial`` lo
+reconstruye desde las sesiones.
+"""
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+db = firestore.client()
+
+COLECCION_HISTORIAL = "attendance"
+
+
+def id_historial(course_id, group_id, fecha):
+    return f"{course_id}_{group_id}_{fecha}" if group_id else f"{course_id}_{fecha}"
+
+
+def coleccion_historial(cedula):
+    return db.collection("person").document(str(cedula)).collection(COLECCION_HISTORIAL)
+
+
+def referencia_historial(cedula, course_id, group_id, fecha):
+    return coleccion_historial(cedula).document(id_historial(course_id, group_id, fecha))
+
+
+def entrada_historial(course_id, group_id, fecha, datos, nombre_curso=None):
+    entrada = {
+        'courseId': course_id,
+        'groupId': group_id or None,
+        'fecha': fecha,
+        'estadoAsistencia': datos.get('estadoAsistencia', 'Presente'),
+        'horaRegistro': datos.get('horaRegistro', ''),
+        'late': datos.get('late', False),
+    }
+    if nombre_curso:
+        entrada['asignatura'] = nombre_curso
+    return entrada
+
+
+def escrituras_historial(course_id, group_id, fecha, estudiantes, nombre_curso=None):
+    """
+    Entradas del índice para {cédula: datos} de una sesión.
+
+    Returns:
+        list: [(referencia, entrada)] para escribir con merge
+    """
+    return [
+        (referencia_historial(cedula, course_id, group_id, fecha),
+         entrada_historial(course_id, group_id, fecha, datos, nombre_curso))
+        for cedula, datos in estudiantes.items()
+        if isinstance(datos, dict)
+    ]
+
+
+def registrar_historial(batch, cedula, course_id, group_id, fecha, datos, nombre_curso=None):
+    """Agrega al lote la escritura de la entrada del estudiante"""
+    batch.set(
+        referencia_historial(cedula, course_id, group_id, fecha),
+        entrada_historial(course_id, group_id, fecha, datos, nombre_curso),
+        merge=True
+    )
+
+
+def borrar_historial(batch, cedula, course_id, group_id, fecha):
+    """Agrega al lote el borrado de la entrada del estudiante"""
+    batch.delete(referencia_historial(cedula, course_id, group_id, fecha))
+
+
+def entradas_curso(cedula, course_id):
+    """Referencias del historial del estudiante que pertenecen al curso (rango de ID)"""
+    coleccion = coleccion_historial(cedula)
+    consulta = (coleccion
+                .where(filter=firestore.FieldFilter(
+                    FieldPath.document_id(), ">=", coleccion.document(f"{course_id}_")))
+                .where(filter=firestore.FieldFilter(
+                    FieldPath.document_id(), "<=", coleccion.document(f"{course_id}_\uf8ff")))
+                .select([FieldPath.document_id()]))
+    return [doc.reference for doc in consulta.stream()]
+
+
+def pagina_historial(cedula, limite, cursor=None, desde=None, hasta=None):
+    """
+    Una página del historial, de la fecha más reciente a la más antigua.
+
+    Args:
+        cursor (str): ID de la última entrada de la página anterior
+        desde, hasta (str): fechas 'YYYY-MM-DD' inclusivas
+
+    Returns:
+        tuple: ([(doc_id, entrada)], cursor siguiente | None)
+    """
+    consulta = coleccion_historial(cedula)
+    if desde:
+        consulta = consulta.where(filter=firestore.FieldFilter('fecha', '>=', desde))
+    if hasta:
+        consulta = consulta.where(filter=firestore.FieldFilter('fecha', '<=', hasta))
+    consulta = (consulta
+                .order_by('fecha', direction=firestore.Query.DESCENDING)
+                .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING))
+    if cursor:
+        # El ID termina en la fecha, así que basta para reanudar el orden
+        consulta = consulta.start_after({'fecha': cursor.rsplit('_', 1)[-1], '__name__': cursor})
+
+    # Un documento de más para saber si hay página siguiente
+    docs = list(consulta.limit(limite + 1).stream())
+    pagina = [(doc.id, doc.to_dict()) for doc in docs[:limite]]
+    siguiente = pagina[-1][0] if len(docs) > limite else None
+    return pagina, siguiente
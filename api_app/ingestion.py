@@ -0,0 +1,372 @@
+# api_app/ingestion.py
+"""
+Ingesta por lotes de eventos de asistencia de los dispositivos de reconocimiento.
+
+- Cada evento trae una clave de idempotencia; un reintento del dispositivo con
+  la misma clave no vuelve a escribir y devuelve el resultado original.
+- 'late' se calcula contra el horario del curso con un HorarioCompacto en caché
+  (sin leer Firestore por evento).
+- Solo se aceptan cédulas inscritas en el curso o grupo (listas en caché, ver
+  roster.py).
+- Los eventos se agrupan por documento de fecha (o por shard, ver sharding.py):
+  una escritura merge por documento, más la entrada del historial de cada
+  estudiante (ver history.py), en un mismo LoteEscrituras.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache
+from django.conf import settings
+from firebase_admin import firestore
+
+from .schedule import Franja, HorarioCompacto
+from .history import escrituras_historial
+from .roster import obtener_listas
+from .sharding import CAMPO_SHARDS, coleccion_asistencias, fecha_de_documento, id_documento_fecha, shards_curso
+from .writes import LoteEscrituras
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+ZONA_COLOMBIA = timezone(timedelta(hours=-5))
+ESTADOS_VALIDOS = ("Presente", "Ausente", "Tiene Excusa")
+
+CREADO = "creado"
+DUPLICADO = "duplicado"
+ERROR = "error"
+
+
+# ============================================
+# CLAVES DE IDEMPOTENCIA RECIENTES
+# ============================================
+class RegistroIdempotencia:
+    """
+    Claves vistas recientemente -> resultado del evento. Acotado en tamaño y
+    tiempo (TTLCache): las claves más viejas se descartan solas.
+    """
+
+    def __init__(self, maximo, ttl):
+        self._cache = TTLCache(maxsize=maximo, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def reservar(self, clave):
+        """
+        Returns:
+            tuple: (True, None) si la clave es nueva (queda reservada), o
+                   (False, resultado previo | None si sigue en proceso)
+        """
+        with self._lock:
+            if clave in self._cache:
+                return False, self._cache[clave]
+            self._cache[clave] = None
+            return True, None
+
+    def confirmar(self, clave, resultado):
+        with self._lock:
+            self._cache[clave] = resultado
+
+    def liberar(self, clave):
+        """La escritura falló: el dispositivo puede reintentar con la misma clave"""
+        with self._lock:
+            self._cache.pop(clave, None)
+
+
+# ============================================
+# HORARIOS DE CURSOS PARA CALCULAR TARDANZAS
+# ============================================
+def es_tarde(horario, dia, minuto):
+    """
+    True si el registro llega después de la tolerancia de la clase en curso
+    (o de la que empieza dentro de la ventana de anticipación).
+    Sin clase en ese momento no se puede decir que sea tarde.
+    """
+    ventana = Franja(dia, minuto, minuto + settings.ASISTENCIA_ANTICIPACION_MINUTOS + 1)
+    clase = horario.conflicto(ventana)
+    if clase is None:
+        return False
+    _, inicio, _ = clase
+    return minuto > inicio + settings.ASISTENCIA_TOLERANCIA_MINUTOS
+
+
+class CalendarioCursos:
+    """Caché con TTL de curso -> (nombre, HorarioCompacto, shards) y de nombre -> curso"""
+
+    CAMPOS = ['nameCourse', 'schedule', CAMPO_SHARDS]
+
+    def __init__(self, maximo, ttl):
+        self._horarios = TTLCache(maxsize=maximo, ttl=ttl)
+        self._nombres = TTLCache(maxsize=maximo, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def registrar(self, course_id, course_data):
+        horario = HorarioCompacto.desde_cursos([{'id': course_id, 'schedule': course_data.get('schedule', [])}])
+        with self._lock:
+            self._horarios[course_id] = (course_data.get('nameCourse', ''), horario, shards_curso(course_data))
+            if course_data.get('nameCourse'):
+                self._nombres[course_data['nameCourse']] = course_id
+        return horario
+
+    def cargar(self, course_ids):
+        """
+        Asegura en caché los cursos indicados (un solo get_all para los que faltan).
+
+        Returns:
+            set: IDs de cursos que no existen
+        """
+        with self._lock:
+            faltantes = [course_id for course_id in set(course_ids) if course_id not in self._horarios]
+        if not faltantes:
+            return set()
+
+        refs = [db.collection("courses").document(course_id) for course_id in faltantes]
+        inexistentes = set(faltantes)
+        for doc in db.get_all(refs, field_paths=self.CAMPOS):
+            if doc.exists:
+                self.registrar(doc.id, doc.to_dict())
+                inexistentes.discard(doc.id)
+        return inexistentes
+
+    def resolver_nombre(self, nombre):
+        """ID del curso con ese nameCourse, o None"""
+        with self._lock:
+            if nombre in self._nombres:
+                return self._nombres[nombre]
+
+        query = (db.collection("courses")
+                 .where(filter=firestore.FieldFilter("nameCourse", "==", nombre))
+                 .select(self.CAMPOS)
+                 .limit(1))
+        for doc in query.stream():
+            self.registrar(doc.id, doc.to_dict())
+            return doc.id
+
+        with self._lock:
+            self._nombres[nombre] = None
+        return None
+
+    def nombre(self, course_id):
+        with self._lock:
+            entrada = self._horarios.get(course_id)
+        return entrada[0] if entrada else ''
+
+    def shards(self, course_id):
+        with self._lock:
+            entrada = self._horarios.get(course_id)
+        return entrada[2] if entrada else 0
+
+    def es_tarde(self, course_id, dia, minuto):
+        with self._lock:
+            entrada = self._horarios.get(course_id)
+        return es_tarde(entrada[1], dia, minuto) if entrada else False
+
+
+_registro = None
+_calendario = None
+_lock_global = threading.Lock()
+
+
+def obtener_registro_idempotencia():
+    global _registro
+    if _registro is None:
+        with _lock_global:
+            if _registro is None:
+                _registro = RegistroIdempotencia(
+                    settings.ASISTENCIA_IDEMPOTENCIA_MAX,
+                    settings.ASISTENCIA_IDEMPOTENCIA_TTL
+                )
+    return _registro
+
+
+def obtener_calendario():
+    global _calendario
+    if _calendario is None:
+        with _lock_global:
+            if _calendario is None:
+                _calendario = CalendarioCursos(settings.CALENDARIO_CURSOS_MAX, settings.CALENDARIO_CURSOS_TTL)
+    return _calendario
+
+
+# ============================================
+# INGESTA
+# ============================================
+def momento_evento(valor):
+    """
+    Hora de captura del evento en Colombia. Acepta ISO 8601 con o sin zona
+    (sin zona se asume hora de Colombia); si falta, la hora actual.
+
+    Raises:
+        ValueError: Si el timestamp no es válido
+    """
+    if not valor:
+        return datetime.now(ZONA_COLOMBIA)
+    try:
+        momento = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Timestamp inválido: {valor}. Use ISO 8601")
+    if momento.tzinfo is None:
+        return momento.replace(tzinfo=ZONA_COLOMBIA)
+    return momento.astimezone(ZONA_COLOMBIA)
+
+
+def id_asistencia(course_id, group_id, fecha, cedula):
+    return f"{course_id}_{group_id}_{fecha}_{cedula}" if group_id else f"{course_id}_{fecha}_{cedula}"
+
+
+def _validar_evento(evento):
+    """Devuelve un mensaje de error, o None si el evento es válido"""
+    if not isinstance(evento, dict):
+        return "El evento debe ser un objeto"
+    if not evento.get('idempotencyKey'):
+        return "Falta idempotencyKey"
+    if not evento.get('estudiante'):
+        return "Falta estudiante"
+    if evento.get('estadoAsistencia', 'Presente') not in ESTADOS_VALIDOS:
+        return f"Estado inválido. Debe ser uno de: {', '.join(ESTADOS_VALIDOS)}"
+    if not evento.get('courseId') and not evento.get('asignatura'):
+        return "Falta courseId o asignatura"
+    return None
+
+
+def _escribir_eventos(aceptados, calendario, registro, resultados):
+    """
+    Resuelve cursos, calcula tardanzas, agrupa por documento de fecha y hace el commit.
+
+    Returns:
+        tuple: ([(posición, clave, resultado, escrito)] de los eventos aceptados,
+            LoteEscrituras). escrito es False si otro evento del mismo estudiante
+            en el lote ocupó su lugar; su resultado trae entonces los valores guardados.
+    """
+    # 2. Cursos: nombres -> IDs (en caché tras la primera consulta) y un get_all
+    #    para los horarios que no estén en caché
+    cursos = [evento.get('courseId') or calendario.resolver_nombre(evento['asignatura'])
+              for _, _, evento in aceptados]
+    inexistentes = calendario.cargar(course_id for course_id in cursos if course_id)
+    listas = obtener_listas()
+
+    # 3. Agrupar por documento de fecha
+    documentos = {}  # (course_id, group_id, documento de la fecha o su shard) -> {cedula: datos}
+    pendientes = []
+    for (posicion, clave, evento), course_id in zip(aceptados, cursos):
+        try:
+            if not course_id or course_id in inexistentes:
+                raise ValueError(f"No se encontró el curso: {course_id or evento.get('asignatura')}")
+            momento = momento_evento(evento.get('timestamp'))
+            group_id = evento.get('groupId') or None
+            cedula = str(evento['estudiante'])
+            fecha = momento.strftime("%Y-%m-%d")
+            if not listas.sesion(course_id, group_id, fecha).admite(cedula):
+                raise ValueError(f"El estudiante {cedula} no está inscrito en el curso {course_id}")
+        except ValueError as e:
+            registro.liberar(clave)
+            resultados[posicion] = {'idempotencyKey': evento['idempotencyKey'], 'estado': ERROR, 'error': str(e)}
+            continue
+
+        datos = {
+            'estadoAsistencia': evento.get('estadoAsistencia', 'Presente'),
+            'horaRegistro': momento.strftime("%H:%M:%S"),
+            'late': calendario.es_tarde(course_id, momento.weekday(), momento.hour * 60 + momento.minute),
+        }
+
+        # Dos eventos del mismo estudiante en el lote: se queda el primero en el tiempo
+        doc_id = id_documento_fecha(fecha, cedula, calendario.shards(course_id))
+        estudiantes = documentos.setdefault((course_id, group_id, doc_id), {})
+        if cedula not in estudiantes or datos['horaRegistro'] < estudiantes[cedula]['horaRegistro']:
+            estudiantes[cedula] = datos
+
+        pendientes.append((posicion, clave, estudiantes, cedula, datos, {
+            'idempotencyKey': evento['idempotencyKey'],
+            'id': id_asistencia(course_id, group_id, fecha, cedula),
+            'estudiante': cedula,
+            'courseId': course_id,
+            'asignatura': calendario.nombre(course_id),
+            'groupId': group_id,
+            'fechaYhora': fecha,
+        }))
+
+    # 4. Una escritura merge por documento de fecha (más el historial de cada
+    #    estudiante), en el mismo lote
+    lote = LoteEscrituras()
+    for (course_id, group_id, doc_id), estudiantes in documentos.items():
+        lote.set(coleccion_asistencias(course_id, group_id).document(doc_id), estudiantes, merge=True)
+        for referencia, entrada in escrituras_historial(
+            course_id, group_id, fecha_de_documento(doc_id), estudiantes, calendario.nombre(course_id)
+        ):
+            lote.set(referencia, entrada, merge=True)
+    lote.commit()
+
+    # El resultado de cada evento lleva lo que quedó guardado para su estudiante
+    return [
+        (posicion, clave, {**resultado, **estudiantes[cedula]}, estudiantes[cedula] is datos)
+        for posicion, clave, estudiantes, cedula, datos, resultado in pendientes
+    ], lote
+
+
+def ingerir_eventos(eventos, ambito):
+    """
+    Procesa un lote de eventos de asistencia.
+
+    Args:
+        eventos: Lista de dicts {idempotencyKey, estudiante, courseId | asignatura,
+                 groupId?, estadoAsistencia?, timestamp?}
+        ambito: Prefijo de las claves de idempotencia (UID del dispositivo/usuario)
+
+    Returns:
+        dict: Resumen y un resultado por evento, en el mismo orden
+    """
+    registro = obtener_registro_idempotencia()
+    calendario = obtener_calendario()
+
+    resultados = [None] * len(eventos)
+    aceptados = []  # (posición, clave, evento)
+    repetidos = []  # (posición, clave) de claves repetidas dentro del mismo lote
+
+    # 1. Validación y deduplicación
+    for posicion, evento in enumerate(eventos):
+        error = _validar_evento(evento)
+        if error:
+            clave_cliente = evento.get('idempotencyKey') if isinstance(evento, dict) else None
+            resultados[posicion] = {'idempotencyKey': clave_cliente, 'estado': ERROR, 'error': error}
+            continue
+
+        clave = f"{ambito}:{evento['idempotencyKey']}"
+        nueva, previo = registro.reservar(clave)
+        if not nueva and previo is None:
+            repetidos.append((posicion, clave))
+        if not nueva:
+            resultados[posicion] = {**(previo or {'idempotencyKey': evento['idempotencyKey']}),
+                                    'estado': DUPLICADO}
+            continue
+        aceptados.append((posicion, clave, evento))
+
+    try:
+        pendientes, lote = _escribir_eventos(aceptados, calendario, registro, resultados)
+    except Exception:
+        # Nada quedó escrito: los dispositivos pueden reintentar con las mismas claves
+        for _, clave, _ in aceptados:
+            registro.liberar(clave)
+        raise
+
+    escritos = {}
+    for posicion, clave, resultado, escrito in pendientes:
+        # Un segundo evento del mismo estudiante en el lote no se escribió: es
+        # duplicado y se informa con los valores que sí se guardaron
+        registro.confirmar(clave, resultado)
+        resultados[posicion] = {**resultado, 'estado': CREADO if escrito else DUPLICADO}
+        escritos[clave] = resultado
+    for posicion, clave in repetidos:
+        if clave in escritos:
+            resultados[posicion] = {**escritos[clave], 'estado': DUPLICADO}
+
+    resumen = {estado: sum(1 for r in resultados if r['estado'] == estado) for estado in (CREADO, DUPLICADO, ERROR)}
+    logger.info(f"📥 Lote de {len(eventos)} eventos: {resumen[CREADO]} creados, {resumen[DUPLICADO]} duplicados, "
+                f"{resumen[ERROR]} con error, {lote.operaciones} documentos escritos")
+
+    return {
+        'total': len(eventos),
+        'creados': resumen[CREADO],
+        'duplicados': resumen[DUPLICADO],
+        'errores': resumen[ERROR],
+        'documentosEscritos': lote.operaciones,
+        'resultados': resultados,
+    }
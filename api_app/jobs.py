@@ -0,0 +1,333 @@
+# api_app/jobs.py
+"""
+Trabajos en segundo plano dentro del proceso.
+
+Para operaciones que no caben en una petición HTTP (borrados grandes,
+exportaciones, importaciones, reconstrucción de agregados): la vista encola
+el trabajo, responde 202 con el ID y el cliente consulta /api/jobs/<id>/.
+
+- Ejecución: ThreadPoolExecutor con TRABAJOS_MAX_CONCURRENCIA hilos por proceso.
+- Registros: SQLite local (TRABAJOS_DB_PATH), compartido por todos los workers
+  de gunicorn de la máquina, así que cualquier worker responde el estado.
+- Cancelación cooperativa: la función consulta ``contexto.cancelado()``.
+- Si el proceso dueño de un trabajo muere, el trabajo queda 'interrumpido'.
+
+No depende de ningún broker externo.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+FALLIDO = "fallido"
+CANCELADO = "cancelado"
+INTERRUMPIDO = "interrumpido"
+
+ESTADOS_ACTIVOS = (PENDIENTE, EN_CURSO)
+
+# Evita escribir el progreso en SQLite en cada llamada a reportar()
+INTERVALO_PROGRESO = 0.5
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    uid TEXT,
+    estado TEXT NOT NULL,
+    hechos INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    mensaje TEXT,
+    resultado TEXT,
+    error TEXT,
+    cancelar INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    creado REAL NOT NULL,
+    iniciado REAL,
+    terminado REAL,
+    actualizado REAL NOT NULL
+)
+"""
+
+_HOST = socket.gethostname()
+
+
+class TrabajoCancelado(Exception):
+    """La función del trabajo la lanza (vía verificar_cancelacion) para detenerse"""
+
+
+# ============================================
+# ALMACÉN DE REGISTROS (SQLite)
+# ============================================
+class AlmacenTrabajos:
+    """Registros persistentes de trabajos en un archivo SQLite local"""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self._inicializado = False
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        return conexion
+
+    def _asegurar_esquema(self):
+        if self._inicializado:
+            return
+        with self._lock:
+            if self._inicializado:
+                return
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            conexion = self._conectar()
+            try:
+                conexion.execute("PRAGMA journal_mode=WAL")
+                conexion.execute(_ESQUEMA)
+            finally:
+                conexion.close()
+            self._inicializado = True
+
+    def ejecutar(self, sql, parametros=()):
+        self._asegurar_esquema()
+        conexion = self._conectar()
+        try:
+            cursor = conexion.execute(sql, parametros)
+            return cursor.rowcount
+        finally:
+            conexion.close()
+
+    def consultar(self, sql, parametros=()):
+        self._asegurar_esquema()
+        conexion = self._conectar()
+        try:
+            return [dict(fila) for fila in conexion.execute(sql, parametros).fetchall()]
+        finally:
+            conexion.close()
+
+    def crear(self, registro):
+        columnas = ", ".join(registro)
+        marcadores = ", ".join("?" for _ in registro)
+        self.ejecutar(f"INSERT INTO trabajos ({columnas}) VALUES ({marcadores})", tuple(registro.values()))
+
+    def actualizar(self, job_id, **campos):
+        campos['actualizado'] = time.time()
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        self.ejecutar(
+            f"UPDATE trabajos SET {asignaciones} WHERE id = ?",
+            tuple(campos.values()) + (job_id,)
+        )
+
+    def obtener(self, job_id):
+        filas = self.consultar("SELECT * FROM trabajos WHERE id = ?", (job_id,))
+        return filas[0] if filas else None
+
+    def purgar(self, antes_de):
+        """Borra registros terminados más antiguos que ``antes_de`` (epoch)"""
+        marcadores = ", ".join("?" for _ in ESTADOS_ACTIVOS)
+        return self.ejecutar(
+            f"DELETE FROM trabajos WHERE actualizado < ? AND estado NOT IN ({marcadores})",
+            (antes_de,) + ESTADOS_ACTIVOS
+        )
+
+
+_almacen = None
+_executor = None
+_lock_global = threading.Lock()
+
+
+def obtener_almacen():
+    global _almacen
+    if _almacen is None:
+        with _lock_global:
+            if _almacen is None:
+                _almacen = AlmacenTrabajos(settings.TRABAJOS_DB_PATH)
+    return _almacen
+
+
+def _obtener_executor():
+    global _executor
+    if _executor is None:
+        with _lock_global:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.TRABAJOS_MAX_CONCURRENCIA,
+                    thread_name_prefix='trabajo'
+                )
+    return _executor
+
+
+# ============================================
+# CONTEXTO QUE RECIBE LA FUNCIÓN DEL TRABAJO
+# ============================================
+class ContextoTrabajo:
+    """Permite a la función del trabajo informar su avance y detectar cancelaciones"""
+
+    def __init__(self, job_id, almacen):
+        self.job_id = job_id
+        self.almacen = almacen
+        self._ultimo_reporte = 0.0
+        self._ultima_consulta = 0.0
+        self._cancelado = False
+
+    def reportar(self, hechos, total=None, mensaje=None, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_reporte < INTERVALO_PROGRESO:
+            return
+        self._ultimo_reporte = ahora
+        self.almacen.actualizar(self.job_id, hechos=hechos, total=total, mensaje=mensaje)
+
+    def cancelado(self):
+        """True si alguien pidió cancelar el trabajo (consulta el almacén como mucho cada 0.5 s)"""
+        if self._cancelado:
+            return True
+        ahora = time.monotonic()
+        if ahora - self._ultima_consulta >= INTERVALO_PROGRESO:
+            self._ultima_consulta = ahora
+            filas = self.almacen.consultar("SELECT cancelar FROM trabajos WHERE id = ?", (self.job_id,))
+            self._cancelado = bool(filas and filas[0]['cancelar'])
+        return self._cancelado
+
+    def verificar_cancelacion(self):
+        if self.cancelado():
+            raise TrabajoCancelado()
+
+
+# ============================================
+# API DEL MÓDULO
+# ============================================
+def _ejecutar(job_id, funcion, args, kwargs):
+    almacen = obtener_almacen()
+    contexto = ContextoTrabajo(job_id, almacen)
+
+    if contexto.cancelado():
+        almacen.actualizar(job_id, estado=CANCELADO, terminado=time.time())
+        logger.info(f"🚫 Trabajo {job_id} cancelado antes de empezar")
+        return
+
+    almacen.actualizar(job_id, estado=EN_CURSO, iniciado=time.time())
+    try:
+        resultado = funcion(contexto, *args, **kwargs)
+        almacen.actualizar(
+            job_id,
+            estado=COMPLETADO,
+            resultado=json.dumps(resultado, default=str),
+            terminado=time.time()
+        )
+        logger.info(f"✅ Trabajo {job_id} completado")
+    except TrabajoCancelado:
+        almacen.actualizar(job_id, estado=CANCELADO, terminado=time.time())
+        logger.info(f"🚫 Trabajo {job_id} cancelado")
+    except Exception as e:
+        logger.error(f"❌ Trabajo {job_id} fallido: {str(e)}")
+        almacen.actualizar(job_id, estado=FALLIDO, error=str(e), terminado=time.time())
+
+
+def enviar_trabajo(tipo, funcion, *args, uid=None, **kwargs):
+    """
+    Encola ``funcion(contexto, *args, **kwargs)`` en el pool de trabajos.
+
+    Returns:
+        str: ID del trabajo
+    """
+    almacen = obtener_almacen()
+    job_id = uuid.uuid4().hex
+    ahora = time.time()
+
+    almacen.crear({
+        'id': job_id,
+        'tipo': tipo,
+        'uid': uid,
+        'estado': PENDIENTE,
+        'pid': os.getpid(),
+        'host': _HOST,
+        'creado': ahora,
+        'actualizado': ahora,
+    })
+    almacen.purgar(ahora - settings.TRABAJOS_RETENCION_HORAS * 3600)
+
+    _obtener_executor().submit(_ejecutar, job_id, funcion, args, kwargs)
+    logger.info(f"📤 Trabajo {tipo} encolado: {job_id}")
+    return job_id
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _formatear(registro):
+    """Registro de SQLite -> representación de la API"""
+    return {
+        'id': registro['id'],
+        'tipo': registro['tipo'],
+        'uid': registro['uid'],
+        'estado': registro['estado'],
+        'progreso': {
+            'hechos': registro['hechos'],
+            'total': registro['total'],
+            'mensaje': registro['mensaje'],
+        },
+        'cancelacionSolicitada': bool(registro['cancelar']),
+        'resultado': json.loads(registro['resultado']) if registro['resultado'] else None,
+        'error': registro['error'],
+        'creado': registro['creado'],
+        'iniciado': registro['iniciado'],
+        'terminado': registro['terminado'],
+        'actualizado': registro['actualizado'],
+    }
+
+
+def obtener_trabajo(job_id):
+    """
+    Estado actual del trabajo, o None si no existe.
+
+    Un trabajo activo cuyo proceso dueño ya no existe (reinicio o caída del
+    worker) se marca como 'interrumpido'.
+    """
+    almacen = obtener_almacen()
+    registro = almacen.obtener(job_id)
+    if not registro:
+        return None
+
+    if (registro['estado'] in ESTADOS_ACTIVOS
+            and registro['host'] == _HOST
+            and not _proceso_vivo(registro['pid'])):
+        almacen.actualizar(job_id, estado=INTERRUMPIDO, terminado=time.time(),
+                           error="El proceso que ejecutaba el trabajo terminó")
+        registro = almacen.obtener(job_id)
+
+    return _formatear(registro)
+
+
+def cancelar_trabajo(job_id):
+    """
+    Solicita la cancelación. El trabajo se detiene en su siguiente punto de
+    verificación (o antes de empezar, si sigue pendiente).
+
+    Returns:
+        bool: False si el trabajo ya había terminado
+    """
+    marcadores = ", ".join("?" for _ in ESTADOS_ACTIVOS)
+    actualizados = obtener_almacen().ejecutar(
+        f"UPDATE trabajos SET cancelar = 1, actualizado = ? WHERE id = ? AND estado IN ({marcadores})",
+        (time.time(), job_id) + ESTADOS_ACTIVOS
+    )
+    return actualizados > 0
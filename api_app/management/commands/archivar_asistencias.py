@@ -0,0 +1,189 @@
+# api_app/management/commands/archivar_asistencias.py
+"""
+Archiva las sesiones de asistencia de los periodos cerrados (ver
+api_app/archive.py): un documento por mes en 'assistancesArchive' y borrado de
+los originales por lotes.
+
+Por cada colección de asistencias (curso y grupos), mes a mes:
+1. Se leen las sesiones vivas del mes y el archivo que ya exista del mes, y
+   se combinan (lo vivo gana).
+2. Se escriben las partes del mes y se borran las partes sobrantes.
+Después se guarda 'archivadoHasta' en el curso, para que las lecturas ya
+consulten el archivo, y por último se borran los originales en lotes de --lote.
+Cada borrado lleva como precondición el update_time de la versión archivada:
+si el documento cambió entretanto (registro tardío o corrección), no se borra
+y la siguiente ejecución lo vuelve a combinar.
+
+Repetirlo es seguro: si se interrumpe, la siguiente ejecución vuelve a combinar
+lo que quede vivo antes del corte.
+
+Uso:
+    python manage.py archivar_asistencias --todos
+    python manage.py archivar_asistencias --curso <ID> --hasta 2025-07-01
+    python manage.py archivar_asistencias --todos --dry-run
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from api_app.archive import (
+    CAMPO_ARCHIVADO,
+    coleccion_archivo,
+    corte_actual,
+    empaquetar,
+    entradas_archivadas,
+)
+from api_app.sharding import coleccion_asistencias, consulta_fechas, db, entradas_por_fecha
+from api_app.writes import MAX_OPERACIONES_LOTE, LoteEscrituras
+
+
+def meses_anteriores(coleccion, corte):
+    """Meses 'YYYY-MM' con sesiones vivas anteriores al corte (solo IDs)"""
+    consulta = (coleccion
+                .where(filter=firestore.FieldFilter(FieldPath.document_id(), "<", coleccion.document(corte)))
+                .select([FieldPath.document_id()]))
+    return sorted({doc.id[:7] for doc in consulta.stream()})
+
+
+def archivar_mes(coleccion, archivo, mes, escribir):
+    """
+    Combina las sesiones vivas del mes con su archivo y escribe las partes.
+
+    Returns:
+        tuple: ([(referencia viva a borrar, update_time archivado)], fechas, registros, partes)
+    """
+    documentos = list(consulta_fechas(coleccion, f"{mes}-01", f"{mes}-31").stream())
+    existentes = list(consulta_fechas(archivo, mes, mes).stream())
+
+    por_fecha = entradas_archivadas(existentes)
+    for fecha, entradas in entradas_por_fecha(documentos).items():
+        por_fecha.setdefault(fecha, {}).update(entradas)
+    partes = empaquetar(por_fecha)
+
+    if escribir:
+        lote = LoteEscrituras()
+        for doc_id, datos in partes.items():
+            lote.set(archivo.document(doc_id), datos)
+        for doc in existentes:
+            if doc.id not in partes:
+                lote.delete(doc.reference)
+        lote.commit()
+
+    registros = sum(parte['registros'] for parte in partes.values())
+    return [(doc.reference, doc.update_time) for doc in documentos], len(por_fecha), registros, len(partes)
+
+
+def borrar_archivados(pendientes, tamano):
+    """
+    Borra los originales solo si no cambiaron desde que se archivaron.
+
+    Un WriteBatch falla entero si una precondición falla; en ese caso ese lote
+    se repite documento por documento y se omiten los que cambiaron.
+
+    Returns:
+        tuple: (borrados, omitidos)
+    """
+    borrados = omitidos = 0
+    for inicio in range(0, len(pendientes), tamano):
+        tramo = pendientes[inicio:inicio + tamano]
+        batch = db.batch()
+        for referencia, version in tramo:
+            batch.delete(referencia, option=db.write_option(last_update_time=version))
+        try:
+            batch.commit()
+            borrados += len(tramo)
+            continue
+        except FailedPrecondition:
+            pass
+        for referencia, version in tramo:
+            try:
+                referencia.delete(option=db.write_option(last_update_time=version))
+                borrados += 1
+            except FailedPrecondition:
+                omitidos += 1
+    return borrados, omitidos
+
+
+class Command(BaseCommand):
+    help = "Empaqueta las sesiones de periodos cerrados en documentos mensuales de archivo"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', action='append', default=[], help="ID del curso (repetible)")
+        parser.add_argument('--todos', action='store_true', help="Archivar todos los cursos")
+        parser.add_argument('--hasta', help="Corte YYYY-MM-01 (excluido); por defecto el inicio del periodo actual")
+        parser.add_argument('--lote', type=int, default=MAX_OPERACIONES_LOTE, help="Borrados por commit")
+        parser.add_argument('--dry-run', action='store_true', help="Solo contar, sin escribir ni borrar")
+
+    def handle(self, *args, **options):
+        corte = options['hasta'] or corte_actual()
+        try:
+            if datetime.strptime(corte, "%Y-%m-%d").day != 1:
+                raise ValueError
+        except ValueError:
+            raise CommandError(f"--hasta debe ser el primer día de un mes (YYYY-MM-01): {corte}")
+        lote = min(max(options['lote'], 1), MAX_OPERACIONES_LOTE)
+
+        if options['todos']:
+            course_ids = [ref.id for ref in db.collection("courses").list_documents()]
+        else:
+            course_ids = options['curso']
+        if not course_ids:
+            raise CommandError("Indique --curso <ID> o --todos")
+
+        escribir = not options['dry_run']
+        self.stdout.write(f"📦 Archivando sesiones anteriores a {corte}")
+        total_registros = total_partes = total_borrados = total_omitidos = 0
+        for course_id in course_ids:
+            course_ref = db.collection("courses").document(course_id)
+            course_doc = course_ref.get(field_paths=[CAMPO_ARCHIVADO])
+            if not course_doc.exists:
+                self.stdout.write(self.style.WARNING(f"⚠️ Curso {course_id} no existe, se omite"))
+                continue
+            archivado_hasta = (course_doc.to_dict() or {}).get(CAMPO_ARCHIVADO)
+
+            grupos = [None] + [group.id for group in course_ref.collection("groups").list_documents()]
+            borrar = []
+            for group_id in grupos:
+                coleccion = coleccion_asistencias(course_id, group_id)
+                archivo = coleccion_archivo(course_id, group_id)
+                for mes in meses_anteriores(coleccion, corte):
+                    referencias, fechas, registros, partes = archivar_mes(coleccion, archivo, mes, escribir)
+                    borrar += referencias
+                    total_registros += registros
+                    total_partes += partes
+                    self.stdout.write(
+                        f"   {archivo.parent.path}/{mes}: {fechas} fechas, {registros} registros, {partes} partes"
+                    )
+
+            if not escribir:
+                total_borrados += len(borrar)
+                continue
+
+            # Las lecturas consultan el archivo antes de que desaparezcan los originales
+            if not archivado_hasta or archivado_hasta < corte:
+                course_ref.update({CAMPO_ARCHIVADO: corte})
+
+            borrados, omitidos = borrar_archivados(borrar, lote)
+            total_borrados += borrados
+            total_omitidos += omitidos
+            if omitidos:
+                self.stdout.write(self.style.WARNING(
+                    f"⚠️ Curso {course_id}: {omitidos} sesiones cambiaron después de archivarse; "
+                    f"se conservan para la próxima ejecución"
+                ))
+            self.stdout.write(f"✅ Curso {course_id}: {CAMPO_ARCHIVADO}={max(archivado_hasta or corte, corte)}")
+
+        if not escribir:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ Dry run: {total_registros} registros en {total_partes} documentos de archivo, "
+                f"{total_borrados} sesiones por borrar; no se escribió nada"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total_registros} registros archivados en {total_partes} documentos, "
+            f"{total_borrados} sesiones borradas, {total_omitidos} conservadas por cambios recientes"
+        ))
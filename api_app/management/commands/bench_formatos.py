@@ -0,0 +1,156 @@
+# api_app/management/commands/bench_formatos.py
+"""
+Benchmark de los formatos de AsistenciaList (flat, grouped, columnar) con un
+semestre de datos: tamaño de la respuesta (JSON, gzip, MessagePack) y tiempo
+de transformación + serialización.
+
+También reconstruye la lista plana desde cada formato, como lo haría un
+cliente, y comprueba que sea idéntica a la original.
+
+Uso:
+    python manage.py bench_formatos
+    python manage.py bench_formatos --cursos 8 --estudiantes 40 --semanas 18 --repeticiones 5
+"""
+import gzip
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api_app.formats import FORMATO_PLANO, FORMATOS_ASISTENCIA
+from api_app.renderers import FastJSONRenderer, MessagePackRenderer
+
+ESTADOS = ["Presente", "Presente", "Presente", "Ausente", "Tiene Excusa"]
+
+
+def generar_semestre(cursos, grupos, estudiantes, semanas, sesiones_semana):
+    """Registros con la misma forma que obtener_asistencias_curso"""
+    asistencias = []
+    for c in range(cursos):
+        course_id = f"c{c:02d}Xk3PqL9vRt2MwZ8yB"
+        course_name = f"Curso {c}"
+        # El primer curso no tiene grupos
+        ids_grupo = [None] if c == 0 else [f"g{g}AbC9dEfGh" for g in range(grupos)]
+        for group_id in ids_grupo:
+            for s in range(semanas * sesiones_semana):
+                fecha = f"2025-{2 + s // 8:02d}-{1 + (s * 3) % 28:02d}"
+                for e in range(estudiantes):
+                    cedula = str(1000000000 + c * 1000 + e)
+                    i = c + s + e
+                    asistencia = {
+                        'id': f"{course_id}_{group_id}_{fecha}_{cedula}" if group_id else f"{course_id}_{fecha}_{cedula}",
+                        'estudiante': cedula,
+                        'asignatura': f"{course_name} - Grupo {group_id}" if group_id else course_name,
+                        'fechaYhora': fecha,
+                        'estadoAsistencia': ESTADOS[i % len(ESTADOS)],
+                        'horaRegistro': f"{7 + i % 3:02d}:{i % 60:02d}:00",
+                        'late': i % 9 == 0,
+                        'courseId': course_id,
+                    }
+                    if group_id:
+                        asistencia['groupId'] = group_id
+                    asistencia['fechaDocId'] = fecha
+                    asistencia['hasGroups'] = bool(group_id)
+                    asistencias.append(asistencia)
+    return asistencias
+
+
+def _registro(course_id, group_id, asignatura, fecha, cedula, datos):
+    asistencia = {
+        'id': f"{course_id}_{group_id}_{fecha}_{cedula}" if group_id else f"{course_id}_{fecha}_{cedula}",
+        'estudiante': cedula,
+        'asignatura': asignatura,
+        'fechaYhora': fecha,
+        'estadoAsistencia': datos['estadoAsistencia'],
+        'horaRegistro': datos['horaRegistro'],
+        'late': datos['late'],
+        'courseId': course_id,
+    }
+    if group_id:
+        asistencia['groupId'] = group_id
+    asistencia['fechaDocId'] = fecha
+    asistencia['hasGroups'] = bool(group_id)
+    return asistencia
+
+
+def desde_grouped(respuesta):
+    asistencias = []
+    for course_id, curso in respuesta['cursos'].items():
+        if curso['hasGroups']:
+            grupos = curso['grupos'].items()
+        else:
+            grupos = [(None, curso)]
+        for group_id, grupo in grupos:
+            for fecha, estudiantes in grupo['fechas'].items():
+                for cedula, datos in estudiantes.items():
+                    asistencias.append(_registro(course_id, group_id, grupo['asignatura'], fecha, cedula, datos))
+    return asistencias
+
+
+def desde_columnar(respuesta):
+    columnas = respuesta['columnas']
+    asistencias = []
+    for i, indice in enumerate(columnas['clase']):
+        clase = respuesta['clases'][indice]
+        datos = {campo: columnas[campo][i] for campo in ('estadoAsistencia', 'horaRegistro', 'late')}
+        asistencias.append(_registro(
+            clase['courseId'], clase['groupId'], clase['asignatura'],
+            columnas['fechaYhora'][i], columnas['estudiante'][i], datos
+        ))
+    return asistencias
+
+
+RECONSTRUCCION = {'grouped': desde_grouped, 'columnar': desde_columnar}
+
+
+class Command(BaseCommand):
+    help = "Compara tamaño y tiempo de serialización de los formatos de AsistenciaList"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cursos', type=int, default=6)
+        parser.add_argument('--grupos', type=int, default=2)
+        parser.add_argument('--estudiantes', type=int, default=35)
+        parser.add_argument('--semanas', type=int, default=16)
+        parser.add_argument('--sesiones-semana', type=int, default=2)
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def handle(self, *args, **options):
+        datos = generar_semestre(
+            options['cursos'], options['grupos'], options['estudiantes'],
+            options['semanas'], options['sesiones_semana']
+        )
+        repeticiones = options['repeticiones']
+        json_renderer = FastJSONRenderer()
+        msgpack_renderer = MessagePackRenderer()
+
+        self.stdout.write(f"📊 {len(datos)} registros, {repeticiones} repeticiones\n")
+        self.stdout.write(
+            f"{'Formato':<10}{'mediana ms':>12}{'p95 ms':>10}{'JSON bytes':>13}{'gzip':>10}{'msgpack':>10}"
+        )
+
+        base = None
+        for formato, transformar in FORMATOS_ASISTENCIA.items():
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                respuesta = transformar(datos) if transformar else datos
+                payload = json_renderer.render(respuesta, 'application/json', {})
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+
+            if formato != FORMATO_PLANO and RECONSTRUCCION[formato](respuesta) != datos:
+                raise CommandError(f"La lista reconstruida desde '{formato}' no coincide con la original")
+
+            tiempos.sort()
+            mediana = statistics.median(tiempos)
+            p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+            comprimido = len(gzip.compress(payload, compresslevel=6))
+            binario = len(msgpack_renderer.render(respuesta))
+            if base is None:
+                base = len(payload)
+
+            self.stdout.write(
+                f"{formato:<10}{mediana:>12.2f}{p95:>10.2f}{len(payload):>13}{comprimido:>10}{binario:>10}"
+                f"   ({len(payload) / base:.0%} del plano)"
+            )
+
+        self.stdout.write(self.style.SUCCESS("✅ grouped y columnar reconstruyen exactamente la lista plana"))
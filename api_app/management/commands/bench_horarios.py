@@ -0,0 +1,127 @@
+# api_app/management/commands/bench_horarios.py
+"""
+Benchmark de validación de horarios: versión anterior (strptime y split de
+strings por cada comparación) contra la representación compacta en minutos.
+
+Uso:
+    python manage.py bench_horarios --cursos 30 --clases 4 --nuevas 5000
+"""
+import random
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from api_app.schedule import DIAS, INDICE_DIA, Franja, HorarioCompacto, formato_hora, minutos
+from api_app.serializers import ScheduleClassSerializer
+
+
+# ============================================
+# IMPLEMENTACIÓN ANTERIOR (referencia)
+# ============================================
+def _validar_clase_anterior(clase):
+    if clase['day'] not in DIAS:
+        return False
+    try:
+        ini = datetime.strptime(clase['iniTime'], "%H:%M")
+        fin = datetime.strptime(clase['endTime'], "%H:%M")
+    except ValueError:
+        return False
+    return fin > ini
+
+
+def _conflicto_anterior(cursos, new_class):
+    new_ini = new_class['iniTime'].split(':')
+    new_end = new_class['endTime'].split(':')
+    new_ini_min = int(new_ini[0]) * 60 + int(new_ini[1])
+    new_end_min = int(new_end[0]) * 60 + int(new_end[1])
+
+    for curso in cursos:
+        for clase in curso.get('schedule', []):
+            if clase['day'] != new_class['day']:
+                continue
+            clase_ini = clase['iniTime'].split(':')
+            clase_end = clase['endTime'].split(':')
+            clase_ini_min = int(clase_ini[0]) * 60 + int(clase_ini[1])
+            clase_end_min = int(clase_end[0]) * 60 + int(clase_end[1])
+            if new_ini_min < clase_end_min and new_end_min > clase_ini_min:
+                return True
+    return False
+
+
+def generar_clase(aleatorio):
+    inicio = aleatorio.randrange(6 * 60, 21 * 60, 5)
+    fin = inicio + aleatorio.choice((45, 60, 90, 120))
+    return {
+        'classroom': f"A-{aleatorio.randrange(300)}",
+        'day': aleatorio.choice(DIAS[:6]),
+        'iniTime': formato_hora(inicio),
+        'endTime': formato_hora(min(fin, 23 * 60 + 59)),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compara la validación y detección de conflictos de horarios anterior con la compacta"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cursos', type=int, default=30)
+        parser.add_argument('--clases', type=int, default=4, help="Clases por curso")
+        parser.add_argument('--nuevas', type=int, default=5000, help="Clases a validar")
+        parser.add_argument('--semilla', type=int, default=7)
+
+    def _medir(self, nombre, funcion, base=None):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        ms = (time.perf_counter() - inicio) * 1000
+        comparacion = f"   (x{base / ms:.1f})" if base else ""
+        self.stdout.write(f"{nombre:<42}{ms:>10.2f}{comparacion}")
+        return resultado, ms
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(options['semilla'])
+        cursos = [
+            {'id': f"curso{i}", 'schedule': [generar_clase(aleatorio) for _ in range(options['clases'])]}
+            for i in range(options['cursos'])
+        ]
+        nuevas = [generar_clase(aleatorio) for _ in range(options['nuevas'])]
+        total_clases = sum(len(c['schedule']) for c in cursos)
+
+        self.stdout.write(f"📊 {len(cursos)} cursos, {total_clases} clases existentes, {len(nuevas)} clases nuevas\n")
+        self.stdout.write(f"{'Operación':<42}{'ms':>10}")
+
+        # Validación de formato
+        _, base = self._medir("Validación anterior (strptime)",
+                              lambda: [_validar_clase_anterior(c) for c in nuevas])
+
+        def validar_serializer():
+            serializer = ScheduleClassSerializer(data=nuevas, many=True)
+            serializer.is_valid(raise_exception=True)
+            return serializer.validated_data
+
+        def validar_compacto():
+            return [c['day'] in INDICE_DIA and minutos(c['endTime']) > minutos(c['iniTime']) for c in nuevas]
+
+        self._medir("Validación compacta (minutos)", validar_compacto, base)
+        validadas, _ = self._medir("ScheduleClassSerializer completo (DRF)", validar_serializer)
+
+        # Detección de conflictos
+        self.stdout.write("")
+        anteriores, base = self._medir("Conflictos anterior (split por comparación)",
+                                       lambda: [_conflicto_anterior(cursos, c) for c in nuevas])
+
+        horario, ms_carga = self._medir("Construir HorarioCompacto", lambda: HorarioCompacto.desde_cursos(cursos))
+
+        def conflictos_compactos():
+            return [horario.conflicto(Franja.desde_dict(c)) is not None for c in validadas]
+
+        compactos, ms_consulta = self._medir("Conflictos HorarioCompacto", conflictos_compactos, base)
+        self.stdout.write(f"{'Construir + conflictos':<42}{ms_carga + ms_consulta:>10.2f}"
+                          f"   (x{base / (ms_carga + ms_consulta):.1f})")
+
+        if anteriores != compactos:
+            diferencias = sum(a != b for a, b in zip(anteriores, compactos))
+            self.stdout.write(self.style.ERROR(f"❌ {diferencias} resultados distintos entre implementaciones"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Mismos resultados ({sum(compactos)} conflictos de {len(compactos)})"
+            ))
@@ -0,0 +1,103 @@
+# api_app/management/commands/bench_middleware.py
+"""
+Costo por petición de los perfiles 'completo' y 'api' (ver DJANGO_PERFIL en
+settings.py) sobre GET /api/health/, pasando por todo el stack de Django
+(handler, middleware, URL resolver, DRF).
+
+Los perfiles se alternan por rondas para que el ruido afecte a ambos por igual.
+Con --vista vacia la ruta responde sin consultar Firestore y la diferencia es
+solo el middleware; con --vista health se usa HealthCheck real.
+
+Debe ejecutarse con el perfil completo (las apps de auth y sesiones instaladas).
+
+Uso:
+    python manage.py bench_middleware
+    python manage.py bench_middleware --vista health --peticiones 200 --rondas 5
+"""
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class VistaVacia(APIView):
+    """Misma forma que HealthCheck, sin Firestore"""
+
+    def get(self, request):
+        return Response({"status": "✅ API funcionando"})
+
+
+# URLconf de --vista vacia
+urlpatterns = [
+    path('api/health/', VistaVacia.as_view()),
+]
+
+
+def ajustes_perfil(perfil):
+    rest = {clave: valor for clave, valor in settings.REST_FRAMEWORK.items()
+            if clave not in settings.REST_FRAMEWORK_API}
+    if perfil == 'api':
+        return {'MIDDLEWARE': settings.MIDDLEWARE_API,
+                'REST_FRAMEWORK': {**rest, **settings.REST_FRAMEWORK_API}}
+    return {'MIDDLEWARE': settings.MIDDLEWARE_COMPLETO, 'REST_FRAMEWORK': rest}
+
+
+class Command(BaseCommand):
+    help = "Compara el costo por petición de los perfiles 'completo' y 'api' en /api/health/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vista', choices=['vacia', 'health'], default='vacia')
+        parser.add_argument('--peticiones', type=int, default=2000, help="Peticiones por perfil y ronda")
+        parser.add_argument('--rondas', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if 'django.contrib.auth' not in settings.INSTALLED_APPS:
+            raise CommandError("Ejecute con DJANGO_PERFIL=completo: el perfil completo necesita auth y sesiones")
+
+        comunes = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if options['vista'] == 'vacia':
+            comunes['ROOT_URLCONF'] = __name__
+
+        headers = {'HTTP_X_USER_UID': 'bench', 'HTTP_ORIGIN': 'http://localhost:3000'}
+        perfiles = ['completo', 'api']
+        clientes = {perfil: Client() for perfil in perfiles}
+        tiempos = {perfil: [] for perfil in perfiles}
+
+        for ronda in range(options['rondas'] + 1):
+            for perfil in perfiles:
+                with override_settings(**comunes, **ajustes_perfil(perfil)):
+                    cliente = clientes[perfil]
+                    for _ in range(options['peticiones']):
+                        inicio = time.perf_counter()
+                        respuesta = cliente.get('/api/health/', **headers)
+                        fin = time.perf_counter()
+                        if ronda:  # la primera ronda es de calentamiento
+                            tiempos[perfil].append((fin - inicio) * 1_000_000)
+                    if respuesta.status_code != 200:
+                        raise CommandError(f"/api/health/ respondió {respuesta.status_code} con el perfil {perfil}")
+
+        self.stdout.write(
+            f"📊 Vista '{options['vista']}', {options['rondas']} rondas x {options['peticiones']} peticiones\n"
+        )
+        self.stdout.write(f"{'Perfil':<10}{'mediana µs':>12}{'p95 µs':>10}{'middleware':>12}")
+        medianas = {}
+        for perfil in perfiles:
+            muestras = sorted(tiempos[perfil])
+            medianas[perfil] = statistics.median(muestras)
+            p95 = muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))]
+            self.stdout.write(
+                f"{perfil:<10}{medianas[perfil]:>12.1f}{p95:>10.1f}"
+                f"{len(ajustes_perfil(perfil)['MIDDLEWARE']):>12}"
+            )
+
+        ahorro = medianas['completo'] - medianas['api']
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ El perfil 'api' ahorra {ahorro:.1f} µs por petición "
+            f"({ahorro / medianas['completo']:.0%} de la mediana)"
+        ))
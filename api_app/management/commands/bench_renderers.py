@@ -0,0 +1,84 @@
+# api_app/management/commands/bench_renderers.py
+"""
+Benchmark de serialización de la respuesta de AsistenciaList.
+
+Uso:
+    python manage.py bench_renderers --registros 10000 --repeticiones 20
+"""
+import gzip
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api_app.renderers import FastJSONRenderer, MessagePackRenderer, orjson
+
+ESTADOS = ["Presente", "Ausente", "Tiene Excusa"]
+
+
+def generar_asistencias(total):
+    """Genera registros con la misma forma que obtener_asistencias_curso"""
+    asistencias = []
+    for i in range(total):
+        course_id = f"curso{i % 12:04d}AbCdEfGhIjKl"
+        group_id = f"grupo{i % 3}"
+        fecha_id = f"2025-{(i // 600) % 12 + 1:02d}-{(i // 20) % 28 + 1:02d}"
+        cedula = str(1000000000 + i % 400)
+        asistencias.append({
+            'id': f"{course_id}_{group_id}_{fecha_id}_{cedula}",
+            'estudiante': cedula,
+            'asignatura': f"Curso {i % 12} - Grupo {group_id}",
+            'fechaYhora': fecha_id,
+            'estadoAsistencia': ESTADOS[i % 3],
+            'horaRegistro': f"{7 + i % 10:02d}:{i % 60:02d}:00",
+            'late': i % 7 == 0,
+            'courseId': course_id,
+            'groupId': group_id,
+            'fechaDocId': fecha_id,
+            'hasGroups': True
+        })
+    return asistencias
+
+
+class Command(BaseCommand):
+    help = "Mide tiempo de codificación y tamaño de AsistenciaList con cada renderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registros', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        datos = generar_asistencias(options['registros'])
+        repeticiones = options['repeticiones']
+
+        renderers = [
+            ("JSONRenderer (DRF)", JSONRenderer(), 'application/json'),
+            ("FastJSONRenderer", FastJSONRenderer(), 'application/json'),
+            ("MessagePackRenderer", MessagePackRenderer(), 'application/msgpack'),
+        ]
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("⚠️ orjson no está instalado: FastJSONRenderer usa el camino de DRF"))
+
+        self.stdout.write(f"📊 {len(datos)} registros, {repeticiones} repeticiones\n")
+        self.stdout.write(f"{'Renderer':<22}{'mediana ms':>12}{'p95 ms':>10}{'bytes':>12}{'gzip':>10}")
+
+        base = None
+        for nombre, renderer, media_type in renderers:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                payload = renderer.render(datos, media_type, {})
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+
+            tiempos.sort()
+            mediana = statistics.median(tiempos)
+            p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+            comprimido = len(gzip.compress(payload, compresslevel=6))
+            if base is None:
+                base = mediana
+
+            self.stdout.write(
+                f"{nombre:<22}{mediana:>12.2f}{p95:>10.2f}{len(payload):>12}{comprimido:>10}"
+                f"   (x{base / mediana:.1f})"
+            )
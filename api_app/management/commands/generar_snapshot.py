@@ -0,0 +1,34 @@
+# api_app/management/commands/generar_snapshot.py
+"""
+Genera el snapshot local de datos de referencia (ver api_app/snapshot.py):
+cursos, grupos, personas y membresías en un archivo MessagePack que los
+workers cargan al arrancar y usan en modo degradado.
+
+Pensado para cron cuando SNAPSHOT_INTERVALO = 0 (sin refresco en proceso).
+
+Uso:
+    python manage.py generar_snapshot
+    python manage.py generar_snapshot --ruta /var/lib/backend/snapshot.msgpack
+"""
+from django.core.management.base import BaseCommand
+
+from api_app.snapshot import escribir_snapshot
+
+
+class Command(BaseCommand):
+    help = "Escribe el snapshot MessagePack de cursos, personas y membresías"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruta', help="Archivo de salida (por defecto SNAPSHOT_RUTA)")
+
+    def handle(self, *args, **options):
+        self.stdout.write("📸 Leyendo courses, groups, person y membership...")
+        resumen = escribir_snapshot(options.get('ruta'))
+
+        self.stdout.write(
+            f"📊 {resumen['courses']} cursos, {resumen['groups']} grupos, "
+            f"{resumen['person']} personas, {resumen['membership']} membresías"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Snapshot escrito en {resumen['ruta']} ({resumen['bytes']} bytes, {resumen['ms']} ms)"
+        ))
@@ -0,0 +1,135 @@
+# api_app/management/commands/migrar_asistencias_shards.py
+"""
+Cambia la distribución de las sesiones de asistencia de un curso entre un
+documento por fecha y N shards por fecha (ver api_app/sharding.py).
+
+Primero se guarda 'asistenciaShards' en el curso, para que los registros
+nuevos ya usen la distribución final; después cada fecha se reacomoda en una
+transacción (documento base + shards), así que un registro concurrente no se pierde.
+
+Uso:
+    python manage.py migrar_asistencias_shards --curso <ID> --shards 8
+    python manage.py migrar_asistencias_shards --todos --shards 0      # volver a un documento por fecha
+    python manage.py migrar_asistencias_shards --curso <ID> --shards 8 --dry-run
+"""
+from django.core.management.base import BaseCommand, CommandError
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from api_app.sharding import (
+    CAMPO_SHARDS,
+    coleccion_asistencias,
+    consulta_fecha,
+    db,
+    fecha_de_documento,
+    id_documento_fecha,
+)
+
+
+def distribuir(documentos, fecha, shards):
+    """
+    Contenido final de cada documento de la fecha.
+
+    Returns:
+        dict: doc_id -> datos; los campos que no son entradas de estudiante
+              se quedan en el documento base
+    """
+    destino = {}
+    base = {}
+    shards_actuales = []
+    for doc in documentos:
+        if doc.id == fecha:
+            base = doc.to_dict() or {}
+        else:
+            shards_actuales.append(doc.to_dict() or {})
+
+    # Base primero; si una cédula está en la base y en un shard, gana el shard
+    for datos in [base] + shards_actuales:
+        for campo, valor in datos.items():
+            if isinstance(valor, dict):
+                doc_id = id_documento_fecha(fecha, campo, shards)
+            else:
+                doc_id = fecha
+            destino.setdefault(doc_id, {})[campo] = valor
+    return destino
+
+
+@firestore.transactional
+def migrar_fecha(transaction, coleccion, fecha, shards):
+    """
+    Reacomoda una fecha dentro de una transacción.
+
+    Returns:
+        tuple: (documentos escritos, documentos borrados)
+    """
+    documentos = list(transaction.get(consulta_fecha(coleccion, fecha)))
+    actuales = {doc.id: doc.to_dict() or {} for doc in documentos}
+    destino = distribuir(documentos, fecha, shards)
+
+    escritos = borrados = 0
+    for doc_id, datos in destino.items():
+        if actuales.get(doc_id) != datos:
+            transaction.set(coleccion.document(doc_id), datos)
+            escritos += 1
+    for doc_id in actuales:
+        if doc_id not in destino:
+            transaction.delete(coleccion.document(doc_id))
+            borrados += 1
+    return escritos, borrados
+
+
+class Command(BaseCommand):
+    help = "Mueve las sesiones de asistencia entre un documento por fecha y N shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', action='append', default=[], help="ID del curso (repetible)")
+        parser.add_argument('--todos', action='store_true', help="Migrar todos los cursos")
+        parser.add_argument('--shards', type=int, required=True, help="Shards por fecha (0 o 1 = sin shards)")
+        parser.add_argument('--dry-run', action='store_true', help="Solo contar fechas, sin escribir")
+
+    def handle(self, *args, **options):
+        shards = max(options['shards'], 0)
+        if options['todos']:
+            course_ids = [ref.id for ref in db.collection("courses").list_documents()]
+        else:
+            course_ids = options['curso']
+        if not course_ids:
+            raise CommandError("Indique --curso <ID> o --todos")
+
+        total_fechas = total_escritos = total_borrados = 0
+        for course_id in course_ids:
+            course_ref = db.collection("courses").document(course_id)
+            if not course_ref.get(field_paths=[CAMPO_SHARDS]).exists:
+                self.stdout.write(self.style.WARNING(f"⚠️ Curso {course_id} no existe, se omite"))
+                continue
+
+            colecciones = [coleccion_asistencias(course_id)]
+            colecciones += [coleccion_asistencias(course_id, group.id)
+                            for group in course_ref.collection("groups").list_documents()]
+
+            if not options['dry_run']:
+                # Los registros nuevos ya van a la distribución final
+                course_ref.update({CAMPO_SHARDS: shards})
+
+            for coleccion in colecciones:
+                ids = coleccion.select([FieldPath.document_id()]).stream()
+                fechas = sorted({fecha_de_documento(doc.id) for doc in ids})
+                total_fechas += len(fechas)
+                if options['dry_run']:
+                    self.stdout.write(f"   {coleccion.parent.path}/{coleccion.id}: {len(fechas)} fechas")
+                    continue
+
+                for fecha in fechas:
+                    escritos, borrados = migrar_fecha(db.transaction(), coleccion, fecha, shards)
+                    total_escritos += escritos
+                    total_borrados += borrados
+
+            self.stdout.write(f"✅ Curso {course_id}: {CAMPO_SHARDS}={shards}")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"⚠️ Dry run: {total_fechas} fechas, no se escribió nada"))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {total_fechas} fechas migradas: {total_escritos} documentos escritos, {total_borrados} borrados"
+        ))
@@ -0,0 +1,88 @@
+# api_app/management/commands/reconstruir_historial.py
+"""
+Reconstruye el historial por estudiante (person/{cedula}/attendance) desde las
+sesiones de asistencia de los cursos (ver api_app/history.py).
+
+Con --limpiar también borra entradas del curso que ya no existen en las
+sesiones; se buscan por rango de ID ('{courseId}_...') en el historial de cada
+estudiante del curso, sin consultas de grupo de colecciones.
+
+Uso:
+    python manage.py reconstruir_historial
+    python manage.py reconstruir_historial --curso <ID> --curso <ID>
+    python manage.py reconstruir_historial --limpiar
+    python manage.py reconstruir_historial --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from api_app.archive import CAMPO_ARCHIVADO, leer_sesiones
+from api_app.history import db, entradas_curso, escrituras_historial
+from api_app.roster import cedulas_curso
+from api_app.writes import LoteEscrituras
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de historial de asistencia por estudiante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', action='append', default=[], help="ID del curso (repetible)")
+        parser.add_argument('--limpiar', action='store_true', help="Borrar entradas que ya no están en las sesiones")
+        parser.add_argument('--dry-run', action='store_true', help="Calcular sin escribir")
+
+    def handle(self, *args, **options):
+        if options['curso']:
+            cursos = [doc for doc in db.get_all(
+                [db.collection("courses").document(course_id) for course_id in options['curso']],
+                field_paths=['nameCourse', 'estudianteID', CAMPO_ARCHIVADO]
+            ) if doc.exists]
+        else:
+            cursos = list(db.collection("courses").select(['nameCourse', 'estudianteID', CAMPO_ARCHIVADO]).stream())
+
+        total_escritos = total_borrados = 0
+        for course_doc in cursos:
+            course_id = course_doc.id
+            course_data = course_doc.to_dict() or {}
+            nombre_curso = course_data.get('nameCourse', '')
+
+            grupos = [None] + [group.id for group in course_doc.reference.collection("groups").list_documents()]
+
+            # Incluye los periodos archivados (ver api_app/archive.py)
+            escrituras = []
+            for group_id in grupos:
+                sesiones = leer_sesiones(course_id, group_id, course_data.get(CAMPO_ARCHIVADO))
+                for fecha, estudiantes in sesiones.items():
+                    escrituras += escrituras_historial(course_id, group_id, fecha, estudiantes, nombre_curso)
+
+            obsoletas = []
+            if options['limpiar']:
+                esperadas = {referencia.path for referencia, _ in escrituras}
+                cedulas = {referencia.parent.parent.id for referencia, _ in escrituras}
+                # estudianteID guarda UIDs: se traducen a cédulas (curso y grupos)
+                cedulas |= cedulas_curso(course_doc.reference, course_data)
+                for cedula in sorted(cedulas):
+                    obsoletas += [ref for ref in entradas_curso(cedula, course_id)
+                                  if ref.path not in esperadas]
+
+            self.stdout.write(
+                f"   {nombre_curso or course_id}: {len(escrituras)} entradas, {len(obsoletas)} obsoletas"
+            )
+            if options['dry_run']:
+                continue
+
+            lote = LoteEscrituras()
+            for referencia, entrada in escrituras:
+                lote.set(referencia, entrada)
+            for referencia in obsoletas:
+                lote.delete(referencia)
+            lote.commit()
+            total_escritos += len(escrituras)
+            total_borrados += len(obsoletas)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"⚠️ Dry run: {len(cursos)} cursos, no se escribió nada"))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Historial reconstruido para {len(cursos)} cursos: "
+            f"{total_escritos} entradas escritas, {total_borrados} borradas"
+        ))
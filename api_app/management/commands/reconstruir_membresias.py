@@ -0,0 +1,80 @@
+# api_app/management/commands/reconstruir_membresias.py
+"""
+Reconstruye el índice de membresía (membership/{uid}) desde person, courses
+y courses/*/groups.
+
+Uso:
+    python manage.py reconstruir_membresias
+    python manage.py reconstruir_membresias --uid <UID>
+    python manage.py reconstruir_membresias --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from api_app.membership import (
+    COLECCION_MEMBRESIA,
+    calcular_membresias,
+    db,
+    guardar_membresia,
+)
+
+# Límite de Firestore: 500 operaciones por WriteBatch
+TAMANO_LOTE = 400
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice materializado de membresía por usuario"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', help="Reconstruir solo este usuario")
+        parser.add_argument('--dry-run', action='store_true', help="Calcular sin escribir")
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔄 Calculando membresías desde person, courses y groups...")
+        membresias = calcular_membresias()
+
+        solo_uid = options.get('uid')
+        if solo_uid:
+            membresias = {solo_uid: membresias.get(solo_uid, {})}
+
+        obsoletos = []
+        if not solo_uid:
+            existentes = {ref.id for ref in db.collection(COLECCION_MEMBRESIA).list_documents()}
+            obsoletos = sorted(existentes - set(membresias))
+
+        self.stdout.write(
+            f"📊 {len(membresias)} usuarios, "
+            f"{sum(len(c) for c in membresias.values())} vínculos curso-usuario, "
+            f"{len(obsoletos)} índices obsoletos"
+        )
+
+        if options['dry_run']:
+            for uid, cursos in sorted(membresias.items()):
+                self.stdout.write(f"   {uid}: {', '.join(sorted(cursos)) or '(sin cursos)'}")
+            self.stdout.write(self.style.WARNING("⚠️ Dry run: no se escribió nada"))
+            return
+
+        batch = db.batch()
+        pendientes = 0
+        escritos = 0
+
+        for uid, cursos in membresias.items():
+            guardar_membresia(uid, cursos, batch=batch)
+            pendientes += 1
+            if pendientes >= TAMANO_LOTE:
+                batch.commit()
+                escritos += pendientes
+                batch, pendientes = db.batch(), 0
+
+        for uid in obsoletos:
+            batch.delete(db.collection(COLECCION_MEMBRESIA).document(uid))
+            pendientes += 1
+            if pendientes >= TAMANO_LOTE:
+                batch.commit()
+                escritos += pendientes
+                batch, pendientes = db.batch(), 0
+
+        if pendientes:
+            batch.commit()
+            escritos += pendientes
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Índice reconstruido: {escritos} documentos escritos"))
@@ -0,0 +1,83 @@
+# api_app/management/commands/resumir_perfiles.py
+"""
+Resume los perfiles capturados por ProfilingMiddleware (ver api_app/profiling.py):
+peticiones por URL (duración y RPCs a Firestore) y las funciones más costosas
+sumando todos los perfiles seleccionados.
+
+Uso:
+    python manage.py resumir_perfiles
+    python manage.py resumir_perfiles --url asistencia-list --top 30 --orden tottime
+    python manage.py resumir_perfiles --uid <UID> --min-ms 500
+"""
+import io
+import pstats
+import statistics
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api_app.profiling import hash_uid, leer_etiquetas
+
+
+class Command(BaseCommand):
+    help = "Funciones más costosas en los perfiles de peticiones capturados"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PERFILADO_DIR, help="Directorio de perfiles")
+        parser.add_argument('--url', help="Solo este nombre de URL (p. ej. asistencia-list)")
+        parser.add_argument('--uid', help="Solo las peticiones de este UID")
+        parser.add_argument('--min-ms', type=int, default=0, help="Solo peticiones de al menos N ms")
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument('--orden', choices=['cumulative', 'tottime', 'ncalls'], default='cumulative')
+
+    def handle(self, *args, **options):
+        directorio = Path(options['dir'])
+        if not directorio.is_dir():
+            raise CommandError(f"No existe el directorio de perfiles: {directorio}")
+
+        uid = hash_uid(options['uid']) if options['uid'] else None
+        seleccion = []
+        for ruta in sorted(directorio.glob('*.prof')):
+            etiquetas = leer_etiquetas(ruta)
+            if etiquetas is None:
+                continue
+            if options['url'] and etiquetas['url'] != options['url']:
+                continue
+            if uid and etiquetas['uid'] != uid:
+                continue
+            if etiquetas['ms'] < options['min_ms']:
+                continue
+            seleccion.append((ruta, etiquetas))
+
+        if not seleccion:
+            self.stdout.write(self.style.WARNING("⚠️ No hay perfiles que coincidan"))
+            return
+
+        # Peticiones por URL
+        por_url = {}
+        for _, etiquetas in seleccion:
+            por_url.setdefault(etiquetas['url'], []).append(etiquetas)
+        self.stdout.write(f"📊 {len(seleccion)} perfiles en {directorio}\n")
+        self.stdout.write(f"{'URL':<26}{'n':>6}{'mediana ms':>12}{'máx ms':>10}{'RPCs med':>10}{'RPCs máx':>10}")
+        for url, lista in sorted(por_url.items(), key=lambda item: -len(item[1])):
+            duraciones = [e['ms'] for e in lista]
+            rpcs = [e['rpcs'] for e in lista]
+            self.stdout.write(
+                f"{url:<26}{len(lista):>6}{statistics.median(duraciones):>12.0f}{max(duraciones):>10}"
+                f"{statistics.median(rpcs):>10.0f}{max(rpcs):>10}"
+            )
+
+        # Funciones más costosas en el conjunto
+        estadisticas = pstats.Stats(str(seleccion[0][0]), stream=io.StringIO())
+        for ruta, _ in seleccion[1:]:
+            estadisticas.add(str(ruta))
+
+        salida = io.StringIO()
+        estadisticas.stream = salida
+        estadisticas.strip_dirs().sort_stats(options['orden']).print_stats(options['top'])
+        self.stdout.write(f"\n🔥 Top {options['top']} funciones por {options['orden']}:")
+        # Se omite el encabezado de pstats (archivos, total de llamadas)
+        lineas = salida.getvalue().splitlines()
+        inicio = next((i for i, linea in enumerate(lineas) if 'ncalls' in linea), 0)
+        self.stdout.write("\n".join(lineas[inicio:]).rstrip())
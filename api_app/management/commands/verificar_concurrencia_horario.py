@@ -0,0 +1,127 @@
+# api_app/management/commands/verificar_concurrencia_horario.py
+"""
+Prueba de concurrencia de las mutaciones de HorarioClaseView contra Firestore.
+
+Crea un curso temporal, lanza en paralelo altas, ediciones y eliminaciones de
+clases y comprueba que ninguna actualización se pierde. El curso temporal se
+borra al final.
+
+Uso:
+    python manage.py verificar_concurrencia_horario --hilos 16
+    python manage.py verificar_concurrencia_horario --ingenuo   # lectura+escritura sin transacción, para comparar
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api_app.views import (
+    ErrorHorario,
+    agregar_clase,
+    db,
+    editar_clase,
+    eliminar_clase,
+)
+
+
+def _clase(aula, minuto):
+    # Horas distintas por clase para que ArrayUnion nunca las considere iguales
+    hora = f"{7 + minuto // 60:02d}:{minuto % 60:02d}"
+    fin = f"{7 + (minuto + 1) // 60:02d}:{(minuto + 1) % 60:02d}"
+    return {'classroom': aula, 'day': 'Lunes', 'iniTime': hora, 'endTime': fin}
+
+
+def _agregar_ingenuo(doc_ref, clase):
+    schedule = doc_ref.get().to_dict().get('schedule', [])
+    schedule.append(clase)
+    doc_ref.update({'schedule': schedule})
+
+
+def _editar_ingenuo(doc_ref, indice, clase):
+    schedule = doc_ref.get().to_dict().get('schedule', [])
+    schedule[indice] = clase
+    doc_ref.update({'schedule': schedule})
+
+
+class Command(BaseCommand):
+    help = "Lanza mutaciones concurrentes sobre un curso temporal y verifica que no se pierdan"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=12)
+        parser.add_argument('--ingenuo', action='store_true',
+                            help="Usar lectura+escritura sin transacción (muestra actualizaciones perdidas)")
+
+    def _en_paralelo(self, hilos, funcion):
+        barrera = threading.Barrier(hilos)
+
+        def tarea(i):
+            barrera.wait()
+            return funcion(i)
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            return list(pool.map(tarea, range(hilos)))
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        ingenuo = options['ingenuo']
+        doc_ref = db.collection('courses').document(f"_concurrencia_{uuid.uuid4().hex[:12]}")
+
+        base = [_clase(f"B-{i}", i) for i in range(hilos)]
+        doc_ref.set({'nameCourse': 'Prueba de concurrencia', 'profesorID': '_prueba', 'schedule': base})
+        self.stdout.write(f"🧪 Curso temporal {doc_ref.id} con {hilos} clases, {hilos} hilos"
+                          f"{' (modo ingenuo)' if ingenuo else ''}")
+
+        fallos = []
+        try:
+            # 1. Altas concurrentes
+            altas = [_clase(f"A-{i}", 200 + i) for i in range(hilos)]
+            self._en_paralelo(hilos, lambda i: (_agregar_ingenuo if ingenuo else agregar_clase)(doc_ref, altas[i]))
+
+            schedule = doc_ref.get().to_dict()['schedule']
+            perdidas = [c['classroom'] for c in altas if c not in schedule]
+            self.stdout.write(f"   ➕ Altas: {hilos - len(perdidas)}/{hilos} presentes")
+            if perdidas:
+                fallos.append(f"altas perdidas: {perdidas}")
+
+            # 2. Ediciones concurrentes, cada hilo sobre un índice distinto
+            ediciones = [_clase(f"E-{i}", i) for i in range(hilos)]
+            if ingenuo:
+                self._en_paralelo(hilos, lambda i: _editar_ingenuo(doc_ref, i, ediciones[i]))
+            else:
+                self._en_paralelo(hilos, lambda i: editar_clase(doc_ref, i, ediciones[i], esperada=base[i]))
+
+            schedule = doc_ref.get().to_dict()['schedule']
+            perdidas = [c['classroom'] for i, c in enumerate(ediciones) if i >= len(schedule) or schedule[i] != c]
+            self.stdout.write(f"   ✏️ Ediciones: {hilos - len(perdidas)}/{hilos} aplicadas")
+            if perdidas:
+                fallos.append(f"ediciones perdidas: {perdidas}")
+
+            # 3. Eliminaciones concurrentes de las altas; los índices se desplazan,
+            #    expectedClass detecta el desplazamiento y se reintenta con el índice nuevo
+            if not ingenuo:
+                def eliminar(i):
+                    for _ in range(hilos * 2):
+                        actual = doc_ref.get().to_dict()['schedule']
+                        if altas[i] not in actual:
+                            return
+                        try:
+                            eliminar_clase(doc_ref, actual.index(altas[i]), esperada=altas[i])
+                            return
+                        except ErrorHorario:
+                            continue
+                    raise RuntimeError(f"No se pudo eliminar {altas[i]['classroom']}")
+
+                self._en_paralelo(hilos, eliminar)
+                schedule = doc_ref.get().to_dict()['schedule']
+                restantes = [c['classroom'] for c in altas if c in schedule]
+                self.stdout.write(f"   🗑️ Eliminaciones: {hilos - len(restantes)}/{hilos} aplicadas, "
+                                  f"{len(schedule)} clases finales")
+                if restantes or schedule != ediciones:
+                    fallos.append(f"eliminaciones incorrectas: quedan {restantes}")
+        finally:
+            doc_ref.delete()
+
+        if fallos:
+            raise CommandError("❌ Actualizaciones perdidas: " + "; ".join(fallos))
+        self.stdout.write(self.style.SUCCESS("✅ Ninguna actualización perdida"))
@@ -0,0 +1,228 @@
+# api_app/membership.py
+"""
+Índice materializado de membresía por usuario.
+
+Un documento por UID en la colección 'membership':
+
+    membership/{uid} = {
+        'courses': {
+            '<courseId>': {
+                'roles': ['Profesor'],                 # rol a nivel de curso
+                'groups': {'<groupId>': 'Estudiante'}  # rol dentro de cada grupo
+            },
+        },
+        'courseIds': ['<courseId>', ...],  # para encontrar a los miembros de un curso
+        'completo': True,                  # escrito por una reconstrucción completa
+        'actualizado': <timestamp>
+    }
+
+Con este documento, "qué cursos ve el usuario" es una sola lectura. Las
+escrituras de la API lo mantienen sincronizado y el comando
+``reconstruir_membresias`` lo reconstruye desde cero.
+"""
+import logging
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+COLECCION_MEMBRESIA = "membership"
+ROL_PROFESOR = "Profesor"
+ROL_ESTUDIANTE = "Estudiante"
+
+
+def referencia_membresia(uid):
+    return db.collection(COLECCION_MEMBRESIA).document(str(uid))
+
+
+def leer_membresia(uid):
+    """
+    Lee el documento de membresía del usuario.
+
+    Returns:
+        dict | None: None si el índice no existe o no está completo para este UID
+            (p. ej. solo lo han tocado sincronizaciones parciales)
+    """
+    doc = referencia_membresia(uid).get()
+    if not doc.exists:
+        return None
+    membresia = doc.to_dict()
+    if not membresia.get('completo'):
+        return None
+    return membresia
+
+
+def cursos_de_membresia(membresia):
+    """Lista de IDs de curso con algún rol vigente (a nivel de curso o de grupo)"""
+    return [
+        course_id
+        for course_id, entrada in (membresia or {}).get('courses', {}).items()
+        if entrada.get('roles') or entrada.get('groups')
+    ]
+
+
+def roles_de_curso(course_data):
+    """
+    Calcula {uid: [roles]} a nivel de curso a partir de los datos del curso
+    (profesorID y estudianteID).
+    """
+    roles = {}
+    if not course_data:
+        return roles
+
+    profesor_id = course_data.get('profesorID')
+    if profesor_id:
+        roles.setdefault(str(profesor_id), []).append(ROL_PROFESOR)
+
+    for estudiante_id in course_data.get('estudianteID', []) or []:
+        if estudiante_id and ROL_ESTUDIANTE not in roles.get(str(estudiante_id), []):
+            roles.setdefault(str(estudiante_id), []).append(ROL_ESTUDIANTE)
+
+    return roles
+
+
+def guardar_membresia(uid, cursos, batch=None):
+    """
+    Sobrescribe el documento de membresía completo.
+
+    Args:
+        uid: UID del usuario
+        cursos: Dict {courseId: {'roles': [...], 'groups': {...}}}
+        batch: WriteBatch opcional donde encolar la escritura
+    """
+    data = {
+        'courses': cursos,
+        'courseIds': sorted(cursos.keys()),
+        'completo': True,
+        'actualizado': firestore.SERVER_TIMESTAMP
+    }
+    if batch is not None:
+        batch.set(referencia_membresia(uid), data)
+    else:
+        referencia_membresia(uid).set(data)
+
+
+def sincronizar_membresia_curso(course_id, anterior, nuevo, batch=None):
+    """
+    Actualiza las membresías afectadas por crear/editar un curso.
+
+    Solo toca los roles a nivel de curso; los roles de grupo se conservan
+    gracias al merge.
+
+    Args:
+        course_id: ID del curso
+        anterior: Datos del curso antes del cambio (None si es nuevo)
+        nuevo: Datos del curso después del cambio
+        batch: WriteBatch opcional donde encolar las escrituras
+
+    Returns:
+        int: Número de documentos de membresía escritos
+    """
+    roles_antes = roles_de_curso(anterior)
+    roles_despues = roles_de_curso(nuevo)
+    escritos = 0
+
+    for uid in set(roles_antes) | set(roles_despues):
+        roles = roles_despues.get(uid, [])
+        if roles_antes.get(uid) == roles:
+            continue
+
+        data = {
+            'courses': {course_id: {'roles': roles}},
+            'actualizado': firestore.SERVER_TIMESTAMP
+        }
+        if roles:
+            data['courseIds'] = firestore.ArrayUnion([course_id])
+
+        if batch is not None:
+            batch.set(referencia_membresia(uid), data, merge=True)
+        else:
+            referencia_membresia(uid).set(data, merge=True)
+        escritos += 1
+
+    if escritos:
+        logger.info(f"🔗 Membresía sincronizada para curso {course_id}: {escritos} usuarios")
+    return escritos
+
+
+def desvincular_curso(course_id, batch=None):
+    """
+    Quita un curso eliminado de todas las membresías que lo referencian.
+
+    Returns:
+        int: Número de documentos de membresía escritos
+    """
+    query = db.collection(COLECCION_MEMBRESIA).where(
+        filter=firestore.FieldFilter('courseIds', 'array_contains', course_id)
+    )
+    escritos = 0
+
+    for doc in query.stream():
+        data = {
+            'courses': {course_id: firestore.DELETE_FIELD},
+            'courseIds': firestore.ArrayRemove([course_id]),
+            'actualizado': firestore.SERVER_TIMESTAMP
+        }
+        if batch is not None:
+            batch.set(doc.reference, data, merge=True)
+        else:
+            doc.reference.set(data, merge=True)
+        escritos += 1
+
+    if escritos:
+        logger.info(f"🔗 Curso {course_id} quitado de {escritos} membresías")
+    return escritos
+
+
+def calcular_membresias():
+    """
+    Recorre person, courses y courses/*/groups y calcula el índice de todos
+    los usuarios. Es la fuente de verdad del comando de reconciliación.
+
+    Returns:
+        dict: {uid: {courseId: {'roles': [...], 'groups': {...}}}}
+    """
+    membresias = {}
+
+    def entrada(uid, course_id):
+        cursos = membresias.setdefault(str(uid), {})
+        return cursos.setdefault(course_id, {'roles': [], 'groups': {}})
+
+    def agregar_rol(uid, course_id, rol):
+        roles = entrada(uid, course_id)['roles']
+        if rol not in roles:
+            roles.append(rol)
+
+    # 1. person->courses (el rol lo da el tipo de la persona)
+    for person_doc in db.collection('person').stream():
+        person_data = person_doc.to_dict()
+        uid = person_data.get('profesorUID')
+        rol = person_data.get('type')
+        if not uid or rol not in (ROL_PROFESOR, ROL_ESTUDIANTE):
+            continue
+        for course_id in person_data.get('courses', []) or []:
+            agregar_rol(uid, course_id, rol)
+
+    # 2. courses->profesorID y courses->estudianteID
+    course_ids = set()
+    for course_doc in db.collection('courses').stream():
+        course_ids.add(course_doc.id)
+        for uid, roles in roles_de_curso(course_doc.to_dict()).items():
+            for rol in roles:
+                agregar_rol(uid, course_doc.id, rol)
+
+    # 3. courses->groups->profesorID / estudianteID
+    for group_doc in db.collection_group('groups').stream():
+        course_ref = group_doc.reference.parent.parent
+        if course_ref is None or course_ref.parent.id != 'courses':
+            continue
+        for uid, roles in roles_de_curso(group_doc.to_dict()).items():
+            entrada(uid, course_ref.id)['groups'][group_doc.id] = roles[0]
+
+    # person->courses puede apuntar a cursos borrados
+    for cursos in membresias.values():
+        for course_id in [cid for cid in cursos if cid not in course_ids]:
+            del cursos[course_id]
+
+    return membresias
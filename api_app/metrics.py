@@ -0,0 +1,86 @@
+# api_app/metrics.py
+"""
+Métricas en memoria del proceso (contadores e histogramas).
+
+Cada worker de gunicorn tiene las suyas; /api/metricas/ devuelve las del
+worker que atiende la petición, identificado por su pid.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Límites de los buckets por defecto (milisegundos)
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_lock = threading.Lock()
+_contadores = {}
+_histogramas = {}
+_inicio = time.time()
+
+
+def _redondear(valor):
+    return round(valor, 3) if valor is not None else None
+
+
+class Histograma:
+    """Conteo por buckets; los percentiles se aproximan por el límite del bucket"""
+    __slots__ = ('limites', 'buckets', 'cantidad', 'suma', 'maximo')
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.buckets = [0] * (len(self.limites) + 1)
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.buckets[bisect_left(self.limites, valor)] += 1
+        self.cantidad += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def percentil(self, p):
+        if not self.cantidad:
+            return None
+        objetivo = p / 100 * self.cantidad
+        acumulado = 0
+        for posicion, conteo in enumerate(self.buckets):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return min(self.limites[posicion], self.maximo) if posicion < len(self.limites) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        return {
+            'count': self.cantidad,
+            'sum': round(self.suma, 3),
+            'avg': round(self.suma / self.cantidad, 3) if self.cantidad else None,
+            'max': round(self.maximo, 3),
+            'p50': _redondear(self.percentil(50)),
+            'p95': _redondear(self.percentil(95)),
+            'p99': _redondear(self.percentil(99)),
+        }
+
+
+def incrementar(nombre, cantidad=1):
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + cantidad
+
+
+def observar(nombre, valor, limites=LIMITES_MS):
+    with _lock:
+        histograma = _histogramas.get(nombre)
+        if histograma is None:
+            histograma = _histogramas[nombre] = Histograma(limites)
+        histograma.observar(valor)
+
+
+def instantanea():
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'desde': _inicio,
+            'contadores': dict(sorted(_contadores.items())),
+            'histogramas': {nombre: h.resumen() for nombre, h in sorted(_histogramas.items())},
+        }
@@ -0,0 +1,22 @@
+# api_app/negotiation.py
+"""
+Negociación de contenido para vistas que usan ?format= como parámetro propio.
+
+DRF interpreta ?format=<x> como "usar el renderer con format x" y responde
+404 si no existe (p. ej. ?format=grouped). Con esta clase el renderer se
+elige solo por el header Accept.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import api_settings
+
+
+class _AjustesSinFormato:
+    """api_settings con URL_FORMAT_OVERRIDE desactivado"""
+    URL_FORMAT_OVERRIDE = None
+
+    def __getattr__(self, nombre):
+        return getattr(api_settings, nombre)
+
+
+class AcceptOnlyNegotiation(DefaultContentNegotiation):
+    settings = _AjustesSinFormato()
@@ -0,0 +1,23 @@
+# api_app/parsers.py
+"""
+Parsers de la API: cuerpos MessagePack según el Content-Type.
+"""
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class MessagePackParser(BaseParser):
+    """Parser para cuerpos ``Content-Type: application/msgpack``"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise ParseError(f"Error al decodificar MessagePack: {str(e)}")
+
+
+class LegacyMessagePackParser(MessagePackParser):
+    """Mismo parser para ``application/x-msgpack``"""
+    media_type = 'application/x-msgpack'
@@ -0,0 +1,127 @@
+# api_app/profiling.py
+"""
+Perfilado de peticiones con cProfile.
+
+ProfilingMiddleware perfila una muestra de las peticiones (PERFILADO_MUESTREO,
+entre 0 y 1) o cualquier petición con el header ``X-Profile-Token`` igual a
+PERFILADO_TOKEN. Cada perfil se guarda en PERFILADO_DIR como archivo pstats:
+
+    {fecha}_{pid}_{nombre de la URL}_{hash del UID}_{N}rpc_{ms}ms.prof
+
+N es el número de RPCs a Firestore de la petición, contado por el cliente
+instrumentado (deadlines.contar_rpcs) y no en el perfil: cProfile solo ve el
+hilo de la petición, y las lecturas cubiertas y las tareas de en_paralelo
+corren en otros hilos. Se conservan los PERFILADO_MAX_ARCHIVOS más recientes;
+``python manage.py resumir_perfiles`` muestra las funciones más costosas del
+conjunto.
+"""
+import cProfile
+import hashlib
+import hmac
+import logging
+import os
+import pstats
+import random
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .deadlines import contar_rpcs
+
+logger = logging.getLogger(__name__)
+
+HEADER_TOKEN = 'X-Profile-Token'
+HEADER_PERFIL = 'X-Profile-Id'
+
+PATRON_ARCHIVO = re.compile(
+    r'^(?P<fecha>\d{8}T\d{6}\d{3})_(?P<pid>\d+)_(?P<url>[^_]+)_(?P<uid>[^_]+)'
+    r'_(?P<rpcs>\d+)rpc_(?P<ms>\d+)ms\.prof$'
+)
+
+
+def hash_uid(uid):
+    if not uid:
+        return 'anonimo'
+    return hashlib.sha256(uid.encode()).hexdigest()[:12]
+
+
+def leer_etiquetas(ruta):
+    """Etiquetas del nombre de un archivo de perfil; None si no es uno"""
+    coincidencia = PATRON_ARCHIVO.match(Path(ruta).name)
+    if coincidencia is None:
+        return None
+    etiquetas = coincidencia.groupdict()
+    etiquetas['rpcs'] = int(etiquetas['rpcs'])
+    etiquetas['ms'] = int(etiquetas['ms'])
+    return etiquetas
+
+
+def _rotar(directorio, maximo):
+    archivos = sorted(directorio.glob('*.prof'), key=lambda ruta: ruta.stat().st_mtime)
+    for ruta in archivos[:max(len(archivos) - maximo, 0)]:
+        ruta.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """Perfila una muestra de peticiones; sin muestreo ni token no hace nada"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.muestreo = settings.PERFILADO_MUESTREO
+        self.token = settings.PERFILADO_TOKEN
+        self.directorio = Path(settings.PERFILADO_DIR)
+        self.maximo = settings.PERFILADO_MAX_ARCHIVOS
+
+    def _solicitado(self, request):
+        token = request.headers.get(HEADER_TOKEN)
+        # En bytes: compare_digest rechaza str con caracteres no ASCII (TypeError)
+        if token and self.token and hmac.compare_digest(token.encode(), self.token.encode()):
+            return True
+        return self.muestreo > 0 and random.random() < self.muestreo
+
+    def __call__(self, request):
+        if not self._solicitado(request):
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Python 3.12+: otro perfil activo en el proceso (sys.monitoring es global)
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        try:
+            with contar_rpcs() as contador:
+                response = self.get_response(request)
+        finally:
+            perfil.disable()
+        duracion_ms = int((time.perf_counter() - inicio) * 1000)
+
+        try:
+            nombre = self._guardar(perfil, request, duracion_ms, contador.total)
+            response[HEADER_PERFIL] = nombre
+        except Exception as e:
+            # El perfil nunca debe romper la respuesta
+            logger.error(f"❌ No se pudo guardar el perfil: {str(e)}")
+        return response
+
+    def _guardar(self, perfil, request, duracion_ms, rpcs):
+        estadisticas = pstats.Stats(perfil)
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        url = (coincidencia.url_name if coincidencia and coincidencia.url_name else 'sin-nombre').replace('_', '-')
+        ahora = time.time()
+        fecha = time.strftime('%Y%m%dT%H%M%S', time.localtime(ahora)) + f"{int(ahora * 1000) % 1000:03d}"
+        nombre = (f"{fecha}_{os.getpid()}_{url}_{hash_uid(request.headers.get('X-User-UID'))}"
+                  f"_{rpcs}rpc_{duracion_ms}ms.prof")
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        estadisticas.dump_stats(self.directorio / nombre)
+        _rotar(self.directorio, self.maximo)
+
+        metrics.incrementar('perfilado.capturas')
+        logger.info(f"🔬 Perfil guardado: {nombre}")
+        return nombre
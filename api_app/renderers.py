@@ -0,0 +1,67 @@
+# api_app/renderers.py
+"""
+Renderers de la API.
+
+- FastJSONRenderer: JSON por defecto, codificado con orjson cuando está instalado.
+- MessagePackRenderer: binario compacto, se elige con ``Accept: application/msgpack``.
+"""
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el renderer estándar de DRF
+    orjson = None
+
+
+# Reutiliza las conversiones de DRF (fechas, Decimal, UUID, etc.) para tipos no nativos,
+# así las tres representaciones producen exactamente los mismos valores.
+_encoder_drf = JSONEncoder()
+
+
+def convertir_valor(obj):
+    """Convierte tipos no serializables (p. ej. DatetimeWithNanoseconds de Firestore)"""
+    return _encoder_drf.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer que codifica con orjson.
+
+    Las peticiones con indentación (``Accept: application/json; indent=4``)
+    siguen usando el camino de DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # OPT_PASSTHROUGH_DATETIME: las fechas pasan por DRF para conservar su formato ('Z' en UTC)
+        return orjson.dumps(
+            data,
+            default=convertir_valor,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer MessagePack (application/msgpack)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=convertir_valor, use_bin_type=True)
+
+
+class LegacyMessagePackRenderer(MessagePackRenderer):
+    """Mismo renderer con el media type no registrado que usan muchos clientes"""
+    media_type = 'application/x-msgpack'
@@ -0,0 +1,112 @@
+# api_app/request_cache.py
+"""
+Caché de lecturas con alcance de petición.
+
+Dentro de ``cache_peticion()`` las lecturas hechas con ``memo``,
+``leer_documento`` y ``leer_documentos`` se guardan en un dict ligado a un
+ContextVar: la segunda lectura del mismo documento (o de la misma persona) en
+la misma petición no vuelve a Firestore. Fuera del bloque no hay caché y las
+funciones leen directamente, así que las vistas las usan siempre.
+
+/api/batch/ abre un bloque para todas sus sub-peticiones; las que corren en
+paralelo (concurrency.en_paralelo copia el contexto) comparten el mismo dict.
+Las escrituras no lo actualizan: el lote lo vacía después de cada
+sub-petición que escribe.
+"""
+import contextlib
+import contextvars
+import threading
+
+from firebase_admin import firestore
+
+db = firestore.client()
+
+_cache = contextvars.ContextVar('cache_peticion', default=None)
+
+
+class CachePeticion:
+    def __init__(self):
+        self._valores = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.lecturas = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            if clave in self._valores:
+                self.aciertos += 1
+                return True, self._valores[clave]
+            return False, None
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self.lecturas += 1
+            self._valores[clave] = valor
+
+    def vaciar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+@contextlib.contextmanager
+def cache_peticion():
+    """Activa una caché nueva para el bloque (y las tareas que copien el contexto)"""
+    cache = CachePeticion()
+    token = _cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _cache.reset(token)
+
+
+def cache_actual():
+    return _cache.get()
+
+
+def memo(clave, funcion, *argumentos):
+    """Resultado de funcion(*argumentos), una vez por petición y clave"""
+    cache = _cache.get()
+    if cache is None:
+        return funcion(*argumentos)
+    encontrado, valor = cache.obtener(clave)
+    if encontrado:
+        return valor
+    valor = funcion(*argumentos)
+    cache.guardar(clave, valor)
+    return valor
+
+
+def _clave_documento(referencia, field_paths):
+    return ('documento', referencia.path, tuple(field_paths) if field_paths is not None else None)
+
+
+def leer_documento(referencia, field_paths=None):
+    """DocumentReference.get(field_paths=...) con la caché de la petición"""
+    return memo(_clave_documento(referencia, field_paths), referencia.get, field_paths)
+
+
+def leer_documentos(referencias, field_paths=None):
+    """
+    db.get_all con la caché de la petición: solo se piden los que faltan.
+
+    Returns:
+        list: DocumentSnapshots en el orden de las referencias
+    """
+    referencias = list(referencias)
+    cache = _cache.get()
+    if cache is None:
+        return list(db.get_all(referencias, field_paths=field_paths))
+
+    resultado = {}
+    faltantes = []
+    for referencia in referencias:
+        encontrado, snapshot = cache.obtener(_clave_documento(referencia, field_paths))
+        if encontrado:
+            resultado[referencia.path] = snapshot
+        else:
+            faltantes.append(referencia)
+    if faltantes:
+        for snapshot in db.get_all(faltantes, field_paths=field_paths):
+            cache.guardar(_clave_documento(snapshot.reference, field_paths), snapshot)
+            resultado[snapshot.reference.path] = snapshot
+    return [resultado[referencia.path] for referencia in referencias if referencia.path in resultado]
@@ -0,0 +1,297 @@
+# api_app/rooms.py
+"""
+Índice semanal de ocupación de aulas.
+
+Responde "qué curso está en el aula X a la hora T" y "qué aulas están libres
+entre T1 y T2" sin recorrer el 'schedule' de todos los cursos: por cada aula
+guarda un HorarioCompacto (intervalos ordenados por día).
+
+- Se construye con una lectura de 'courses' (solo schedule/nameCourse/group) y
+  se reconstruye cuando pasa INDICE_AULAS_TTL segundos, para recoger cambios
+  hechos por otros procesos.
+- Las escrituras de este proceso lo actualizan en el momento (actualizar_curso,
+  agregar_clase, quitar_curso); solo se recalculan las aulas afectadas.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from .schedule import DIAS, Franja, HorarioCompacto, formato_hora
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+CAMPOS_INDICE = ['schedule', 'nameCourse', 'group']
+
+
+def clave_aula(aula):
+    """Normaliza el nombre del aula ("  a-101 " y "A-101" son la misma)"""
+    if not isinstance(aula, str):
+        return None
+    clave = " ".join(aula.split()).upper()
+    return clave or None
+
+
+class IndiceAulas:
+    """Ocupación por aula y día; thread-safe"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._lock_reconstruccion = threading.Lock()
+        self._construido = None  # time.monotonic() de la última reconstrucción
+
+        self._franjas = {}       # course_id -> [Franja] en el orden del schedule
+        self._cursos = {}        # course_id -> {'nameCourse', 'group'}
+        self._aulas = {}         # clave -> nombre a mostrar
+        self._cursos_aula = {}   # clave -> {course_id}
+        self._por_aula = {}      # clave -> HorarioCompacto
+        self._sucias = set()     # aulas cuyo HorarioCompacto hay que recalcular
+
+    # ============================================
+    # CONSTRUCCIÓN Y ACTUALIZACIÓN
+    # ============================================
+    def reconstruir(self):
+        """Lee todos los cursos y reemplaza el índice completo"""
+        inicio = time.perf_counter()
+        cursos = {
+            doc.id: doc.to_dict() or {}
+            for doc in db.collection("courses").select(CAMPOS_INDICE).stream()
+        }
+        self.cargar(cursos)
+        logger.info(f"🏫 Índice de aulas: {len(self._aulas)} aulas, {len(cursos)} cursos "
+                    f"({(time.perf_counter() - inicio) * 1000:.0f} ms)")
+
+    def cargar(self, cursos, edad=0):
+        """
+        Reemplaza el índice completo con {course_id: datos} ya leídos (p. ej. del snapshot).
+
+        Args:
+            edad: Segundos que ya tienen los datos; se descuentan del TTL
+        """
+        with self._lock:
+            self._franjas.clear()
+            self._cursos.clear()
+            self._aulas.clear()
+            self._cursos_aula.clear()
+            self._por_aula.clear()
+            self._sucias.clear()
+            for course_id, course_data in cursos.items():
+                self._registrar(course_id, course_data)
+            self._construido = time.monotonic() - edad
+
+    def _asegurar_fresco(self):
+        if self._construido is not None and time.monotonic() - self._construido < self.ttl:
+            return
+        # Una sola reconstrucción a la vez; mientras tanto se sigue usando el índice anterior
+        bloqueante = self._construido is None
+        if not self._lock_reconstruccion.acquire(blocking=bloqueante):
+            return
+        try:
+            if self._construido is None or time.monotonic() - self._construido >= self.ttl:
+                self.reconstruir()
+        finally:
+            self._lock_reconstruccion.release()
+
+    def _registrar(self, course_id, course_data):
+        """Agrega las clases del curso (sin lock; el llamador lo tiene)"""
+        franjas = []
+        for clase in course_data.get('schedule', []) or []:
+            try:
+                franja = Franja.desde_dict(clase)
+            except (ValueError, AttributeError):
+                franja = None
+            franjas.append(franja)
+            self._marcar_aula(course_id, franja)
+
+        self._franjas[course_id] = franjas
+        self._cursos[course_id] = {
+            'nameCourse': course_data.get('nameCourse', ''),
+            'group': course_data.get('group', ''),
+        }
+
+    def _marcar_aula(self, course_id, franja):
+        clave = clave_aula(franja.aula) if franja else None
+        if clave is None:
+            return
+        self._aulas.setdefault(clave, " ".join(franja.aula.split()))
+        self._cursos_aula.setdefault(clave, set()).add(course_id)
+        self._sucias.add(clave)
+
+    def _quitar(self, course_id):
+        for franja in self._franjas.pop(course_id, []):
+            clave = clave_aula(franja.aula) if franja else None
+            if clave is None:
+                continue
+            cursos = self._cursos_aula.get(clave)
+            if cursos:
+                cursos.discard(course_id)
+            self._sucias.add(clave)
+        self._cursos.pop(course_id, None)
+
+    def actualizar_curso(self, course_id, course_data):
+        """
+        Reemplaza las clases del curso. course_data trae el 'schedule' final;
+        nameCourse/group se conservan si no vienen.
+        """
+        if self._construido is None:
+            return  # Se leerá completo en la primera consulta
+        with self._lock:
+            datos = {**self._cursos.get(course_id, {}), **course_data}
+            self._quitar(course_id)
+            self._registrar(course_id, datos)
+
+    def agregar_clase(self, course_id, clase):
+        """Equivalente local de un ArrayUnion sobre 'schedule'"""
+        if self._construido is None:
+            return
+        with self._lock:
+            try:
+                franja = Franja.desde_dict(clase)
+            except (ValueError, AttributeError):
+                return
+            franjas = self._franjas.setdefault(course_id, [])
+            clave = clave_aula(franja.aula)
+            for existente in franjas:
+                if (existente and existente.dia == franja.dia and existente.inicio == franja.inicio
+                        and existente.fin == franja.fin and clave_aula(existente.aula) == clave):
+                    return
+            franjas.append(franja)
+            self._marcar_aula(course_id, franja)
+
+    def quitar_curso(self, course_id):
+        if self._construido is None:
+            return
+        with self._lock:
+            self._quitar(course_id)
+
+    def _horario(self, clave):
+        """HorarioCompacto del aula, recalculado si tuvo cambios (con lock)"""
+        if clave in self._sucias:
+            horario = HorarioCompacto()
+            for course_id in self._cursos_aula.get(clave, ()):
+                for idx, franja in enumerate(self._franjas.get(course_id, [])):
+                    if franja is not None and clave_aula(franja.aula) == clave:
+                        horario.agregar(franja, (course_id, idx))
+            if len(horario):
+                self._por_aula[clave] = horario
+            else:
+                self._por_aula.pop(clave, None)
+                self._aulas.pop(clave, None)
+                self._cursos_aula.pop(clave, None)
+            self._sucias.discard(clave)
+        return self._por_aula.get(clave)
+
+    # ============================================
+    # CONSULTAS
+    # ============================================
+    def _describir(self, clave, referencia, inicio, fin, dia):
+        course_id, idx = referencia
+        return {
+            'classroom': self._aulas.get(clave, clave),
+            'courseId': course_id,
+            'classIndex': idx,
+            'nameCourse': self._cursos.get(course_id, {}).get('nameCourse', ''),
+            'group': self._cursos.get(course_id, {}).get('group', ''),
+            'day': DIAS[dia],
+            'iniTime': formato_hora(inicio),
+            'endTime': formato_hora(fin),
+        }
+
+    def clase_en(self, aula, dia, minuto):
+        """
+        Returns:
+            dict | None: Clase que ocupa el aula en ese día y minuto
+        """
+        self._asegurar_fresco()
+        clave = clave_aula(aula)
+        with self._lock:
+            horario = self._horario(clave)
+            if horario is None:
+                return None
+            choque = horario.conflicto(Franja(dia, minuto, minuto + 1))
+            return self._describir(clave, *choque, dia) if choque else None
+
+    def aulas_libres(self, dia, inicio, fin):
+        """
+        Returns:
+            list: Nombres de las aulas conocidas sin clases que se solapen con [inicio, fin)
+        """
+        self._asegurar_fresco()
+        franja = Franja(dia, inicio, fin)
+        with self._lock:
+            libres = []
+            for clave in list(self._aulas):
+                horario = self._horario(clave)
+                if horario is not None and horario.conflicto(franja) is None:
+                    libres.append(self._aulas[clave])
+            return sorted(libres)
+
+    def conflicto(self, clase, exclude_course_id=None, exclude_class_index=None):
+        """
+        Clase de otro curso que ya ocupa el aula en ese horario.
+
+        Args:
+            clase: Dict con {classroom, day, iniTime, endTime} (o ClaseValidada)
+            exclude_course_id: Curso a ignorar (completo si no se da exclude_class_index)
+            exclude_class_index: Índice de la clase que se está editando
+
+        Returns:
+            dict | None: La clase que ocupa el aula
+        """
+        clave = clave_aula(clase.get('classroom'))
+        if clave is None:
+            return None
+        franja = Franja.desde_dict(clase)
+
+        excluir = None
+        if exclude_course_id is not None:
+            if exclude_class_index is None:
+                excluir = lambda referencia: referencia[0] == exclude_course_id
+            else:
+                excluir = lambda referencia: referencia == (exclude_course_id, exclude_class_index)
+
+        self._asegurar_fresco()
+        with self._lock:
+            horario = self._horario(clave)
+            if horario is None:
+                return None
+            choque = horario.conflicto(franja, excluir)
+            return self._describir(clave, *choque, franja.dia) if choque else None
+
+
+def conflicto_interno_aulas(clases):
+    """
+    Dos clases de la misma lista que reservan la misma aula a la vez.
+
+    Returns:
+        tuple | None: (índice, índice) de las clases que se solapan
+    """
+    por_aula = {}
+    for idx, clase in enumerate(clases):
+        clave = clave_aula(clase.get('classroom'))
+        if clave is None:
+            continue
+        franja = Franja.desde_dict(clase)
+        horario = por_aula.setdefault(clave, HorarioCompacto())
+        choque = horario.conflicto(franja)
+        if choque:
+            return choque[0], idx
+        horario.agregar(franja, idx)
+    return None
+
+
+_indice = None
+_lock_global = threading.Lock()
+
+
+def obtener_indice_aulas():
+    global _indice
+    if _indice is None:
+        with _lock_global:
+            if _indice is None:
+                _indice = IndiceAulas(settings.INDICE_AULAS_TTL)
+    return _indice
@@ -0,0 +1,251 @@
+# api_app/roster.py
+"""
+Listas de clase (estudianteID) en caché y cierre de sesiones.
+
+El registro de asistencia nunca leía 'estudianteID', así que aceptaba
+cualquier cédula y los ausentes simplemente no aparecían. ListasClase guarda
+la lista de cada curso y grupo como frozenset en una caché acotada (TTLCache):
+validar un registro es una pertenencia O(1) y al cerrar la sesión los
+ausentes son inscritos - registrados.
+
+'estudianteID' guarda UIDs de Firebase (igual que obtener_cursos_estudiante
+y membership.py), mientras que la asistencia se registra por cédula: cada
+lista se traduce a cédulas con los documentos de 'person' (ID = cédula, campo
+'profesorUID'). Un grupo con su propio 'estudianteID' usa esa lista; si no la
+tiene, la del curso. Una lista vacía (curso sin estudiantes cargados) no
+restringe nada, y tampoco una con UIDs sin documento en 'person': no se puede
+saber su cédula, así que no se rechaza a nadie por ellos.
+Los ausentes se escriben en una transacción sobre los documentos de la fecha
+(y sus shards), así que un registro concurrente no queda marcado como ausente.
+"""
+import logging
+import threading
+
+from cachetools import TTLCache
+from django.conf import settings
+from firebase_admin import firestore
+
+from .history import escrituras_historial
+from .sharding import coleccion_asistencias, consulta_fecha, entradas_por_fecha, id_documento_fecha
+from .writes import MAX_OPERACIONES_LOTE, LoteEscrituras
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+CAMPO_LISTA = 'estudianteID'
+ESTADO_AUSENTE = 'Ausente'
+# Máximo de valores de un filtro 'in' de Firestore
+MAX_VALORES_IN = 30
+
+
+def uids_de(datos):
+    """estudianteID de un curso o grupo -> frozenset de UIDs"""
+    return frozenset(str(uid) for uid in (datos or {}).get(CAMPO_LISTA) or [] if uid)
+
+
+def cedulas_por_uid(uids):
+    """{uid: cédula} de los UIDs con documento en 'person' (consultas 'in' de 30)"""
+    uids = sorted(uids)
+    resultado = {}
+    for inicio in range(0, len(uids), MAX_VALORES_IN):
+        consulta = (db.collection('person')
+                    .where(filter=firestore.FieldFilter('profesorUID', 'in', uids[inicio:inicio + MAX_VALORES_IN]))
+                    .select(['profesorUID']))
+        for doc in consulta.stream():
+            resultado[doc.get('profesorUID')] = doc.id
+    return resultado
+
+
+def cedulas_curso(course_ref, course_data=None):
+    """
+    Cédulas inscritas en el curso o en cualquiera de sus grupos.
+
+    Args:
+        course_data: Datos del curso ya leídos (con estudianteID)
+    """
+    if course_data is None or CAMPO_LISTA not in course_data:
+        course_doc = course_ref.get(field_paths=[CAMPO_LISTA])
+        course_data = course_doc.to_dict() if course_doc.exists else None
+    uids = set(uids_de(course_data))
+    for group_doc in course_ref.collection("groups").select([CAMPO_LISTA]).stream():
+        uids |= uids_de(group_doc.to_dict())
+    return set(cedulas_por_uid(uids).values())
+
+
+class ListaClase:
+    """Cédulas inscritas; 'completa' es False si algún UID no tiene persona"""
+    __slots__ = ('cedulas', 'completa')
+
+    def __init__(self, cedulas, completa=True):
+        self.cedulas = frozenset(cedulas)
+        self.completa = completa
+
+    @classmethod
+    def desde_uids(cls, uids, cedulas):
+        """Lista de UIDs traducida con el mapa {uid: cédula}"""
+        traducidas = [cedulas[uid] for uid in uids if uid in cedulas]
+        faltantes = len(uids) - len(traducidas)
+        if faltantes:
+            logger.warning(f"⚠️ {faltantes} UIDs de la lista sin documento en 'person'")
+        return cls(traducidas, completa=not faltantes)
+
+    def __len__(self):
+        return len(self.cedulas)
+
+
+class SesionClase:
+    """Sesión de un curso (o grupo) en una fecha, con su lista de inscritos"""
+
+    def __init__(self, course_id, group_id, fecha, lista):
+        self.course_id = course_id
+        self.group_id = group_id
+        self.fecha = fecha
+        self.lista = lista
+        self.inscritos = lista.cedulas
+
+    def admite(self, cedula):
+        """True si la cédula está inscrita (o la lista está vacía o incompleta)"""
+        return not self.lista.completa or not self.inscritos or str(cedula) in self.inscritos
+
+    def ausentes(self, registrados):
+        """Inscritos sin registro en la sesión, ordenados"""
+        return sorted(self.inscritos - {str(cedula) for cedula in registrados})
+
+
+class ListasClase:
+    """Caché con TTL de (curso, grupo) -> ListaClase con las cédulas inscritas"""
+
+    def __init__(self, maximo, ttl):
+        self._listas = TTLCache(maxsize=maximo, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def inscritos(self, course_id, group_id=None, course_data=None):
+        """
+        Lista del curso o grupo; se lee de Firestore solo si no está en caché.
+
+        Args:
+            course_data: Datos del curso ya leídos (evita leerlo otra vez)
+        """
+        clave = (course_id, group_id)
+        with self._lock:
+            lista = self._listas.get(clave)
+        if lista is not None:
+            return lista
+
+        if group_id:
+            group_doc = (db.collection("courses").document(course_id)
+                         .collection("groups").document(group_id).get(field_paths=[CAMPO_LISTA]))
+            datos = group_doc.to_dict() if group_doc.exists else None
+            if not datos or CAMPO_LISTA not in datos:
+                # El grupo no tiene lista propia: la del curso
+                lista = self.inscritos(course_id, None, course_data)
+            else:
+                uids = uids_de(datos)
+                lista = ListaClase.desde_uids(uids, cedulas_por_uid(uids))
+        else:
+            if course_data is None or CAMPO_LISTA not in course_data:
+                course_doc = db.collection("courses").document(course_id).get(field_paths=[CAMPO_LISTA])
+                course_data = course_doc.to_dict() if course_doc.exists else None
+            uids = uids_de(course_data)
+            lista = ListaClase.desde_uids(uids, cedulas_por_uid(uids))
+
+        with self._lock:
+            self._listas[clave] = lista
+        return lista
+
+    def registrar(self, course_id, group_id, lista):
+        """Guarda una ListaClase ya calculada (p. ej. desde el snapshot)"""
+        with self._lock:
+            self._listas[(course_id, group_id)] = lista
+
+    def sesion(self, course_id, group_id, fecha, course_data=None):
+        return SesionClase(course_id, group_id, fecha, self.inscritos(course_id, group_id, course_data))
+
+    def quitar_curso(self, course_id):
+        """El curso (o sus grupos) cambió o se borró: se vuelve a leer al usarlo"""
+        with self._lock:
+            for clave in [clave for clave in self._listas if clave[0] == course_id]:
+                self._listas.pop(clave, None)
+
+
+_listas = None
+_lock_global = threading.Lock()
+
+
+def obtener_listas():
+    global _listas
+    if _listas is None:
+        with _lock_global:
+            if _listas is None:
+                _listas = ListasClase(settings.LISTAS_CLASE_MAX, settings.LISTAS_CLASE_TTL)
+    return _listas
+
+
+# ============================================
+# CIERRE DE SESIÓN
+# ============================================
+@firestore.transactional
+def _marcar_ausentes(transaction, sesion, shards, asignatura, hora):
+    """
+    Lee la sesión y escribe los ausentes dentro de la transacción.
+
+    Returns:
+        tuple: (cédulas con registro, ausentes, escrituras de historial que no cupieron)
+    """
+    coleccion = coleccion_asistencias(sesion.course_id, sesion.group_id)
+    documentos = list(transaction.get(consulta_fecha(coleccion, sesion.fecha)))
+    entradas = entradas_por_fecha(documentos).get(sesion.fecha, {})
+    registrados = {cedula for cedula, datos in entradas.items() if isinstance(datos, dict)}
+    ausentes = sesion.ausentes(registrados)
+
+    por_documento = {}
+    for cedula in ausentes:
+        doc_id = id_documento_fecha(sesion.fecha, cedula, shards)
+        por_documento.setdefault(doc_id, {})[cedula] = {
+            'estadoAsistencia': ESTADO_AUSENTE,
+            'horaRegistro': hora,
+            'late': False,
+        }
+
+    historial = []
+    for doc_id, estudiantes in por_documento.items():
+        transaction.set(coleccion.document(doc_id), estudiantes, merge=True)
+        historial += escrituras_historial(sesion.course_id, sesion.group_id, sesion.fecha, estudiantes, asignatura)
+
+    # El historial va en el mismo commit mientras quepa en el límite de Firestore
+    cupo = MAX_OPERACIONES_LOTE - len(por_documento)
+    for referencia, entrada in historial[:cupo]:
+        transaction.set(referencia, entrada, merge=True)
+    return registrados, ausentes, historial[cupo:]
+
+
+def cerrar_sesion(sesion, shards, asignatura, hora):
+    """
+    Marca como 'Ausente' a los inscritos sin registro en la sesión.
+
+    Args:
+        sesion: SesionClase
+        shards: Shards por fecha del curso (ver sharding.py)
+        asignatura: Nombre del curso (para el historial)
+        hora: 'HH:MM:SS' del cierre, guardada como horaRegistro de los ausentes
+
+    Returns:
+        dict: Resumen {inscritos, registrados, ausentes: [cédulas], listaCompleta}
+            (listaCompleta False: hay UIDs sin persona que no se pudieron marcar)
+    """
+    registrados, ausentes, restantes = _marcar_ausentes(db.transaction(), sesion, shards, asignatura, hora)
+
+    if restantes:
+        # Sesiones muy grandes: el resto del historial en lotes aparte
+        lote = LoteEscrituras()
+        for referencia, entrada in restantes:
+            lote.set(referencia, entrada, merge=True)
+        lote.commit()
+        logger.warning(f"⚠️ {len(restantes)} entradas de historial fuera de la transacción de cierre")
+
+    return {
+        'inscritos': len(sesion.inscritos),
+        'registrados': len(registrados),
+        'ausentes': ausentes,
+        'listaCompleta': sesion.lista.completa,
+    }
@@ -0,0 +1,184 @@
+# api_app/schedule.py
+"""
+Representación compacta de horarios.
+
+En Firestore las clases se guardan como {"day": "Lunes", "iniTime": "HH:MM",
+"endTime": "HH:MM", "classroom": ...}. Aquí se convierten una sola vez a
+(índice de día, minuto de inicio, minuto de fin) para que la validación, la
+detección de conflictos y el cálculo de tardanzas no vuelvan a partir strings.
+"""
+from array import array
+from bisect import bisect_left
+
+DIAS = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+INDICE_DIA = {dia: indice for indice, dia in enumerate(DIAS)}
+
+
+def minutos(hora):
+    """
+    "HH:MM" -> minutos desde medianoche. Acepta lo mismo que strptime("%H:%M")
+    (uno o dos dígitos por parte).
+
+    Raises:
+        ValueError: Si el formato o el rango no son válidos
+    """
+    if not isinstance(hora, str):
+        raise ValueError("La hora debe ser un string HH:MM")
+    horas, separador, mins = hora.partition(':')
+    if (not separador or not 1 <= len(horas) <= 2 or not 1 <= len(mins) <= 2
+            or not horas.isdigit() or not mins.isdigit()):
+        raise ValueError(f"Formato de hora inválido: {hora}")
+    h, m = int(horas), int(mins)
+    if h > 23 or m > 59:
+        raise ValueError(f"Hora fuera de rango: {hora}")
+    return h * 60 + m
+
+
+def formato_hora(total_minutos):
+    """minutos desde medianoche -> "HH:MM" """
+    return f"{total_minutos // 60:02d}:{total_minutos % 60:02d}"
+
+
+class Franja:
+    """Una clase del horario: día (0 = Lunes) e intervalo [inicio, fin) en minutos"""
+    __slots__ = ('dia', 'inicio', 'fin', 'aula')
+
+    def __init__(self, dia, inicio, fin, aula=None):
+        self.dia = dia
+        self.inicio = inicio
+        self.fin = fin
+        self.aula = aula
+
+    @classmethod
+    def desde_dict(cls, clase):
+        """
+        Construye la franja desde el dict de Firestore / del serializer.
+        Si el dict ya trae su franja (ClaseValidada), la reutiliza.
+
+        Raises:
+            ValueError: Si el día o las horas no son válidos
+        """
+        franja = getattr(clase, 'franja', None)
+        if franja is not None:
+            return franja
+        dia = INDICE_DIA.get(clase.get('day'))
+        if dia is None:
+            raise ValueError(f"Día inválido: {clase.get('day')}")
+        return cls(dia, minutos(clase.get('iniTime')), minutos(clase.get('endTime')), clase.get('classroom'))
+
+    def a_dict(self):
+        return {
+            'classroom': self.aula,
+            'day': DIAS[self.dia],
+            'iniTime': formato_hora(self.inicio),
+            'endTime': formato_hora(self.fin),
+        }
+
+    def se_solapa(self, otra):
+        return self.dia == otra.dia and self.inicio < otra.fin and self.fin > otra.inicio
+
+    def contiene(self, dia, minuto):
+        return self.dia == dia and self.inicio <= minuto < self.fin
+
+    def __repr__(self):
+        return f"Franja({DIAS[self.dia]} {formato_hora(self.inicio)}-{formato_hora(self.fin)}, {self.aula!r})"
+
+
+class ClaseValidada(dict):
+    """
+    Dict de una clase tal como se guarda en Firestore, con su Franja ya
+    calculada por el serializer. Firestore y los renderers lo tratan como un
+    dict normal; el atributo no se serializa.
+    """
+    __slots__ = ('franja',)
+
+
+class HorarioCompacto:
+    """
+    Conjunto de franjas indexado por día para consultas de solapamiento.
+
+    Por día guarda arrays paralelos ordenados por inicio, más el máximo
+    acumulado de los fines: hay solapamiento con [ini, fin) si entre las franjas
+    que empiezan antes de `fin` alguna termina después de `ini`. Descartar un
+    día sin solapes cuesta O(log n); si lo hay, el recorrido hacia atrás se
+    detiene donde el máximo acumulado ya no supera `ini`, así que solo es lineal
+    cuando `excluir` descarta muchas franjas solapadas.
+    """
+    __slots__ = ('_inicios', '_fines', '_max_fines', '_refs', '_pendientes')
+
+    def __init__(self):
+        self._inicios = [array('H') for _ in DIAS]
+        self._fines = [array('H') for _ in DIAS]
+        self._max_fines = [array('H') for _ in DIAS]
+        self._refs = [[] for _ in DIAS]
+        self._pendientes = [[] for _ in DIAS]
+
+    @classmethod
+    def desde_cursos(cls, cursos, exclude_course_id=None):
+        """
+        Construye el horario desde dicts de curso (con 'id' y 'schedule').
+        Las clases con datos inválidos se ignoran.
+        """
+        horario = cls()
+        for curso in cursos:
+            course_id = curso.get('id')
+            if exclude_course_id and course_id == exclude_course_id:
+                continue
+            for idx, clase in enumerate(curso.get('schedule', []) or []):
+                try:
+                    franja = Franja.desde_dict(clase)
+                except (ValueError, AttributeError):
+                    continue
+                horario.agregar(franja, (course_id, idx))
+        return horario
+
+    def agregar(self, franja, referencia=None):
+        self._pendientes[franja.dia].append((franja.inicio, franja.fin, referencia))
+
+    def _compactar(self, dia):
+        pendientes = self._pendientes[dia]
+        if not pendientes:
+            return
+        actuales = list(zip(self._inicios[dia], self._fines[dia], self._refs[dia]))
+        actuales.extend(pendientes)
+        actuales.sort(key=lambda item: (item[0], item[1]))
+
+        self._inicios[dia] = array('H', (item[0] for item in actuales))
+        self._fines[dia] = array('H', (item[1] for item in actuales))
+        self._refs[dia] = [item[2] for item in actuales]
+
+        maximos = array('H')
+        maximo = 0
+        for fin in self._fines[dia]:
+            maximo = max(maximo, fin)
+            maximos.append(maximo)
+        self._max_fines[dia] = maximos
+        self._pendientes[dia] = []
+
+    def conflicto(self, franja, excluir=None):
+        """
+        Args:
+            franja: Franja a comprobar
+            excluir: Función referencia -> bool para ignorar franjas (p. ej. la que se edita)
+
+        Returns:
+            tuple | None: (referencia, inicio, fin) de una franja que se solapa, o None
+        """
+        dia = franja.dia
+        self._compactar(dia)
+        limite = bisect_left(self._inicios[dia], franja.fin)  # franjas que empiezan antes del fin
+        if limite == 0 or self._max_fines[dia][limite - 1] <= franja.inicio:
+            return None
+        fines = self._fines[dia]
+        maximos = self._max_fines[dia]
+        refs = self._refs[dia]
+        for posicion in range(limite - 1, -1, -1):
+            # Ninguna franja anterior termina después del inicio: no queda solape posible
+            if maximos[posicion] <= franja.inicio:
+                break
+            if fines[posicion] > franja.inicio and not (excluir and excluir(refs[posicion])):
+                return refs[posicion], self._inicios[dia][posicion], fines[posicion]
+        return None
+
+    def __len__(self):
+        return sum(len(inicios) + len(pendientes) for inicios, pendientes in zip(self._inicios, self._pendientes))
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from datetime import datetime
+from .schedule import DIAS, ClaseValidada, Franja, INDICE_DIA, minutos
 
 class AsistenciaSerializer(serializers.Serializer):
     id = serializers.CharField(read_only=True)
@@ -61,39 +62,36 @@ class ScheduleClassSerializer(serializers.Serializer):
 
     def validate_day(self, value):
         """Validar que el día sea válido"""
-        dias_validos = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-        if value not in dias_validos:
+        if value not in INDICE_DIA:
             raise serializers.ValidationError(
-                f"Día inválido. Debe ser uno de: {', '.join(dias_validos)}"
+                f"Día inválido. Debe ser uno de: {', '.join(DIAS)}"
             )
         return value
 
-    def validate_iniTime(self, value):
-        """Validar formato de hora de inicio"""
-        try:
-            datetime.strptime(value, "%H:%M")
-            return value
-        except ValueError:
-            raise serializers.ValidationError("Formato de hora inválido. Use HH:MM")
-
-    def validate_endTime(self, value):
-        """Validar formato de hora de fin"""
-        try:
-            datetime.strptime(value, "%H:%M")
-            return value
-        except ValueError:
-            raise serializers.ValidationError("Formato de hora inválido. Use HH:MM")
-
     def validate(self, data):
-        """Validar que la hora de fin sea después de la hora de inicio"""
-        if 'iniTime' in data and 'endTime' in data:
-            inicio = datetime.strptime(data['iniTime'], "%H:%M")
-            fin = datetime.strptime(data['endTime'], "%H:%M")
-            if fin <= inicio:
-                raise serializers.ValidationError(
-                    "La hora de fin debe ser posterior a la hora de inicio"
-                )
-        return data
+        """
+        Validar formato de las horas y que la de fin sea posterior a la de inicio.
+        Cada hora se parsea una sola vez; la Franja resultante viaja con los datos
+        validados (ClaseValidada) para el chequeo de conflictos.
+        """
+        errores = {}
+        tiempos = {}
+        for campo in ('iniTime', 'endTime'):
+            try:
+                tiempos[campo] = minutos(data[campo])
+            except ValueError:
+                errores[campo] = ["Formato de hora inválido. Use HH:MM"]
+        if errores:
+            raise serializers.ValidationError(errores)
+
+        if tiempos['endTime'] <= tiempos['iniTime']:
+            raise serializers.ValidationError(
+                "La hora de fin debe ser posterior a la hora de inicio"
+            )
+
+        clase = ClaseValidada(data)
+        clase.franja = Franja(INDICE_DIA[data['day']], tiempos['iniTime'], tiempos['endTime'], data.get('classroom'))
+        return clase
 
 
 class CourseSerializer(serializers.Serializer):
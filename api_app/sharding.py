@@ -0,0 +1,139 @@
+# api_app/sharding.py
+"""
+Documentos de asistencia repartidos en shards.
+
+Por defecto cada sesión es un documento ``assistances/{fecha}`` con una entrada
+por cédula. En cursos grandes todas las escrituras de la sesión compiten por
+ese documento; con ``asistenciaShards: N`` en el curso (o ASISTENCIA_SHARDS
+global) las entradas nuevas van a ``assistances/{fecha}~{k}``, con
+k = crc32(cédula) % N.
+
+Las lecturas no dependen de N: leen el documento base y todos sus shards
+(un rango de IDs) y los combinan, así que un curso puede cambiar de modo sin
+perder datos; el comando migrar_asistencias_shards reacomoda las sesiones
+existentes.
+"""
+import zlib
+
+from django.conf import settings
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+db = firestore.client()
+
+SEPARADOR_SHARD = "~"
+CAMPO_SHARDS = "asistenciaShards"
+
+
+def shards_curso(course_data):
+    """Número de shards del curso (0 o 1 = un solo documento por sesión)"""
+    valor = (course_data or {}).get(CAMPO_SHARDS)
+    if valor is None:
+        valor = settings.ASISTENCIA_SHARDS
+    try:
+        return max(int(valor), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def id_documento_fecha(fecha, cedula, shards):
+    """ID del documento donde se escribe la entrada de la cédula"""
+    if shards <= 1:
+        return fecha
+    return f"{fecha}{SEPARADOR_SHARD}{zlib.crc32(str(cedula).encode()) % shards}"
+
+
+def fecha_de_documento(doc_id):
+    """'2025-03-03~4' -> '2025-03-03'"""
+    return doc_id.partition(SEPARADOR_SHARD)[0]
+
+
+def coleccion_asistencias(course_id, group_id=None):
+    course_ref = db.collection("courses").document(course_id)
+    if group_id:
+        return course_ref.collection("groups").document(group_id).collection("assistances")
+    return course_ref.collection("assistances")
+
+
+def referencia_asistencia(course_id, group_id, fecha, cedula=None, shards=0):
+    """Documento donde se escribe la asistencia de la cédula ese día"""
+    return coleccion_asistencias(course_id, group_id).document(id_documento_fecha(fecha, cedula, shards))
+
+
+def consulta_fecha(coleccion, fecha):
+    """Documento base y todos los shards de una fecha (una consulta por rango de ID)"""
+    return (coleccion
+            .where(filter=firestore.FieldFilter(FieldPath.document_id(), ">=", coleccion.document(fecha)))
+            .where(filter=firestore.FieldFilter(
+                FieldPath.document_id(), "<=", coleccion.document(f"{fecha}{SEPARADOR_SHARD}\uf8ff")
+            )))
+
+
+def consulta_fechas(coleccion, desde=None, hasta=None):
+    """
+    Sesiones entre dos fechas 'YYYY-MM-DD' (inclusivas, con sus shards) como
+    rango de IDs de documento; sin límites es la colección completa.
+    """
+    consulta = coleccion
+    if desde:
+        consulta = consulta.where(filter=firestore.FieldFilter(
+            FieldPath.document_id(), ">=", coleccion.document(desde)
+        ))
+    if hasta:
+        consulta = consulta.where(filter=firestore.FieldFilter(
+            FieldPath.document_id(), "<=", coleccion.document(f"{hasta}{SEPARADOR_SHARD}\uf8ff")
+        ))
+    return consulta
+
+
+def entradas_por_fecha(documentos):
+    """
+    Combina documentos base y shards.
+
+    Returns:
+        dict: fecha -> {cédula: datos}; si una cédula aparece en la base y en un
+              shard (migración a medias) gana el shard
+    """
+    por_fecha = {}
+    shards = []
+    for doc in documentos:
+        fecha = fecha_de_documento(doc.id)
+        entradas = por_fecha.setdefault(fecha, {})
+        if doc.id == fecha:
+            entradas.update(doc.to_dict() or {})
+        else:
+            shards.append((fecha, doc))
+    for fecha, doc in shards:
+        por_fecha[fecha].update(doc.to_dict() or {})
+    return por_fecha
+
+
+def copias_asistencia(course_id, group_id, fecha, cedula):
+    """
+    Todos los documentos de la sesión que tienen una entrada de la cédula: tras
+    una migración a medias puede estar en la base y en su shard.
+
+    Returns:
+        tuple: (existe_sesion, [(referencia, datos)]; el shard, si lo hay, al final)
+    """
+    documentos = list(consulta_fecha(coleccion_asistencias(course_id, group_id), fecha).stream())
+    copias = []
+    for doc in documentos:
+        datos = (doc.to_dict() or {}).get(cedula)
+        if isinstance(datos, dict):
+            copias.append((doc.reference, datos))
+    # La entrada que gana (ver entradas_por_fecha) queda al final
+    copias.sort(key=lambda copia: copia[0].id != fecha)
+    return bool(documentos), copias
+
+
+def localizar_asistencia(course_id, group_id, fecha, cedula):
+    """
+    Busca la entrada de la cédula en la sesión, sin importar el modo del curso.
+
+    Returns:
+        tuple: (existe_sesion, referencia del documento que la contiene | None, datos | None)
+    """
+    existe_sesion, copias = copias_asistencia(course_id, group_id, fecha, cedula)
+    referencia, datos = copias[-1] if copias else (None, None)
+    return existe_sesion, referencia, datos
@@ -0,0 +1,374 @@
+# api_app/snapshot.py
+"""
+Snapshot local de los datos de referencia (cursos, grupos, personas y
+membresías) en MessagePack.
+
+- ``python manage.py generar_snapshot`` o el hilo periódico (SNAPSHOT_INTERVALO
+  segundos; un solo escritor por máquina con flock) lo escriben en
+  SNAPSHOT_RUTA de forma atómica.
+- Al arrancar (ApiAppConfig.ready) cada worker lo carga con mmap y calienta
+  sus cachés (calendario de cursos, listas de clase e índice de aulas), cada
+  una solo si el snapshot es más nuevo que su TTL.
+- Modo degradado: si falla el health check de Firestore o una lectura por
+  error de conexión, durante SNAPSHOT_DEGRADADO_SEGUNDOS los endpoints de
+  horarios y cursos responden desde el snapshot, con los headers
+  ``Warning: 110`` y ``X-Snapshot-Age`` (segundos desde que se generó).
+
+Los valores se guardan ya convertidos como en la respuesta JSON (fechas en
+ISO 8601), así que una respuesta desde el snapshot tiene la misma forma.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import msgpack
+from django.conf import settings
+from firebase_admin import firestore
+from google.api_core.exceptions import DeadlineExceeded, RetryError, ServiceUnavailable
+from google.auth.exceptions import TransportError
+
+from . import metrics
+from .ingestion import obtener_calendario
+from .membership import COLECCION_MEMBRESIA, cursos_de_membresia
+from .renderers import convertir_valor
+from .rooms import obtener_indice_aulas
+from .roster import CAMPO_LISTA, ListaClase, obtener_listas, uids_de
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+FORMATO = 1
+CAMPOS_PERSONA = ['namePerson', 'type', 'courses', 'profesorUID']
+# Errores que indican que Firestore no está disponible (no errores de datos)
+ERRORES_CONEXION = (ServiceUnavailable, DeadlineExceeded, RetryError, TransportError)
+# Cada cuánto un worker mira si otro proceso escribió un snapshot más nuevo
+REVISION_SEGUNDOS = 30
+
+
+def _convertir(obj):
+    try:
+        return convertir_valor(obj)
+    except TypeError:
+        # DocumentReference y demás: su ruta o su texto
+        return getattr(obj, 'path', None) or str(obj)
+
+
+# ============================================
+# ESCRITURA
+# ============================================
+def leer_firestore():
+    """Datos de referencia completos, listos para empaquetar"""
+    cursos = {doc.id: doc.to_dict() or {} for doc in db.collection("courses").stream()}
+
+    grupos = {}
+    for doc in db.collection_group("groups").stream():
+        course_ref = doc.reference.parent.parent
+        if course_ref is None or course_ref.parent.id != 'courses':
+            continue
+        grupos.setdefault(course_ref.id, {})[doc.id] = doc.to_dict() or {}
+
+    personas = {doc.id: doc.to_dict() or {} for doc in db.collection('person').select(CAMPOS_PERSONA).stream()}
+    membresias = {doc.id: doc.to_dict() or {} for doc in db.collection(COLECCION_MEMBRESIA).stream()}
+
+    return {
+        'formato': FORMATO,
+        'generado': time.time(),
+        'courses': cursos,
+        'groups': grupos,
+        'person': personas,
+        'membership': membresias,
+    }
+
+
+def escribir_snapshot(ruta=None):
+    """
+    Lee Firestore y reemplaza el snapshot (archivo temporal + os.replace).
+
+    Returns:
+        dict: Resumen {ruta, bytes, courses, groups, person, membership, ms}
+    """
+    ruta = Path(ruta or settings.SNAPSHOT_RUTA)
+    inicio = time.perf_counter()
+    datos = leer_firestore()
+    contenido = msgpack.packb(datos, default=_convertir, use_bin_type=True)
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.tmp")
+    with open(temporal, 'wb') as archivo:
+        archivo.write(contenido)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+    metrics.incrementar('snapshot.escrituras')
+    return {
+        'ruta': str(ruta),
+        'bytes': len(contenido),
+        'courses': len(datos['courses']),
+        'groups': sum(len(grupos) for grupos in datos['groups'].values()),
+        'person': len(datos['person']),
+        'membership': len(datos['membership']),
+        'ms': int((time.perf_counter() - inicio) * 1000),
+    }
+
+
+# ============================================
+# LECTURA
+# ============================================
+class Snapshot:
+    """Snapshot cargado en memoria, con el índice UID -> persona"""
+
+    def __init__(self, datos, mtime=None):
+        self.generado = datos.get('generado', 0)
+        self.mtime = mtime
+        self.cursos = datos.get('courses') or {}
+        self.grupos = datos.get('groups') or {}
+        self.personas = datos.get('person') or {}
+        self.membresias = datos.get('membership') or {}
+        self._por_uid = {
+            persona['profesorUID']: cedula
+            for cedula, persona in self.personas.items() if persona.get('profesorUID')
+        }
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Lee el archivo con mmap (sin copiarlo a un bytes intermedio)"""
+        with open(ruta, 'rb') as archivo:
+            mtime = os.fstat(archivo.fileno()).st_mtime
+            with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                datos = msgpack.unpackb(mapa, raw=False)
+        if datos.get('formato') != FORMATO:
+            raise ValueError(f"Formato de snapshot no soportado: {datos.get('formato')}")
+        return cls(datos, mtime)
+
+    def edad(self):
+        """Segundos desde que se generó"""
+        return max(time.time() - self.generado, 0)
+
+    def generado_iso(self):
+        return datetime.fromtimestamp(self.generado, timezone.utc).isoformat()
+
+    def persona(self, uid):
+        cedula = self._por_uid.get(uid)
+        if cedula is None:
+            return None
+        return {**self.personas[cedula], 'id': cedula}
+
+    def curso(self, course_id, campos=None):
+        datos = self.cursos.get(course_id)
+        if datos is None:
+            return None
+        if campos is not None:
+            datos = {campo: datos[campo] for campo in campos if campo in datos}
+        return {**datos, 'id': course_id}
+
+    def cursos_usuario(self, uid, persona, campos=None):
+        """Mismo criterio que resolver_cursos_usuario: membresía o, sin ella, los tres métodos"""
+        ids = list((persona or {}).get('courses') or [])
+        membresia = self.membresias.get(uid)
+        if membresia and membresia.get('completo'):
+            ids = cursos_de_membresia(membresia) + ids
+        else:
+            for course_id, datos in self.cursos.items():
+                if datos.get('profesorID') == uid or uid in (datos.get(CAMPO_LISTA) or []):
+                    ids.append(course_id)
+            for course_id, grupos in self.grupos.items():
+                for datos in grupos.values():
+                    if datos.get('profesorID') == uid or uid in (datos.get(CAMPO_LISTA) or []):
+                        ids.append(course_id)
+        return [self.curso(course_id, campos) for course_id in dict.fromkeys(ids) if course_id in self.cursos]
+
+
+_snapshot = None
+_revisado = 0.0
+_lock_snapshot = threading.Lock()
+
+
+def obtener_snapshot():
+    """
+    Snapshot en memoria; si otro proceso escribió uno más nuevo se recarga
+    (se mira como mucho cada REVISION_SEGUNDOS).
+
+    Returns:
+        Snapshot | None: None si no hay archivo o no se pudo leer
+    """
+    global _snapshot, _revisado
+    ahora = time.monotonic()
+    if _snapshot is not None and ahora - _revisado < REVISION_SEGUNDOS:
+        return _snapshot
+
+    with _lock_snapshot:
+        if _snapshot is not None and ahora - _revisado < REVISION_SEGUNDOS:
+            return _snapshot
+        _revisado = ahora
+        ruta = Path(settings.SNAPSHOT_RUTA)
+        try:
+            mtime = ruta.stat().st_mtime
+        except FileNotFoundError:
+            return _snapshot
+        if _snapshot is None or mtime != _snapshot.mtime:
+            try:
+                _snapshot = Snapshot.cargar(ruta)
+            except Exception as e:
+                logger.error(f"❌ No se pudo cargar el snapshot {ruta}: {str(e)}")
+        return _snapshot
+
+
+def calentar(snapshot):
+    """
+    Llena las cachés del proceso con los datos del snapshot.
+
+    Una caché solo se calienta si el snapshot es más nuevo que su TTL: uno más
+    viejo (p. ej. un generar_snapshot manual de hace días) dejaría fuera a los
+    inscritos desde entonces y validaría aulas contra horarios viejos. Las
+    entradas del calendario y las listas viven su TTL completo; el índice de
+    aulas descuenta la edad.
+
+    Returns:
+        list: Nombres de las cachés calentadas
+    """
+    edad = snapshot.edad()
+    calentadas = []
+    if edad < settings.CALENDARIO_CURSOS_TTL:
+        calendario = obtener_calendario()
+        for course_id, datos in snapshot.cursos.items():
+            calendario.registrar(course_id, datos)
+        calentadas.append('calendario')
+    if edad < settings.LISTAS_CLASE_TTL:
+        listas = obtener_listas()
+        for course_id, datos in snapshot.cursos.items():
+            listas.registrar(course_id, None, ListaClase.desde_uids(uids_de(datos), snapshot._por_uid))
+        for course_id, grupos in snapshot.grupos.items():
+            for group_id, datos in grupos.items():
+                if CAMPO_LISTA in datos:
+                    listas.registrar(course_id, group_id, ListaClase.desde_uids(uids_de(datos), snapshot._por_uid))
+        calentadas.append('listas')
+    if edad < settings.INDICE_AULAS_TTL:
+        obtener_indice_aulas().cargar(snapshot.cursos, edad)
+        calentadas.append('aulas')
+    return calentadas
+
+
+# ============================================
+# ESTADO DE FIRESTORE (MODO DEGRADADO)
+# ============================================
+class EstadoFirestore:
+    """Tras un fallo, Firestore se da por caído durante 'segundos' (se responde desde el snapshot)"""
+
+    def __init__(self, segundos):
+        self.segundos = segundos
+        self._hasta = 0.0
+        self.ultimo_error = None
+        self._lock = threading.Lock()
+
+    def degradado(self):
+        return time.monotonic() < self._hasta
+
+    def registrar_fallo(self, error):
+        with self._lock:
+            if not self.degradado():
+                logger.warning(f"⚠️ Firestore no disponible, modo degradado: {str(error)}")
+            self._hasta = time.monotonic() + self.segundos
+            self.ultimo_error = str(error)
+        metrics.incrementar('firestore.fallos')
+
+    def registrar_exito(self):
+        with self._lock:
+            if self.degradado():
+                logger.info("✅ Firestore disponible de nuevo")
+            self._hasta = 0.0
+
+
+_estado = None
+_lock_global = threading.Lock()
+
+
+def obtener_estado_firestore():
+    global _estado
+    if _estado is None:
+        with _lock_global:
+            if _estado is None:
+                _estado = EstadoFirestore(settings.SNAPSHOT_DEGRADADO_SEGUNDOS)
+    return _estado
+
+
+def marcar_desactualizada(response, snapshot):
+    """Headers de una respuesta servida desde el snapshot"""
+    response['Warning'] = '110 - "Response is Stale"'
+    response['X-Snapshot-Age'] = str(int(snapshot.edad()))
+    response['X-Snapshot-Generated'] = snapshot.generado_iso()
+    metrics.incrementar('snapshot.respuestas')
+    return response
+
+
+# ============================================
+# ARRANQUE Y REFRESCO PERIÓDICO
+# ============================================
+def _refrescar(ruta, intervalo):
+    """Escribe el snapshot si este proceso tiene el lock y el archivo está viejo"""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta.with_name(ruta.name + '.lock'), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # otro worker lo está escribiendo
+        try:
+            if ruta.exists() and time.time() - ruta.stat().st_mtime < intervalo / 2:
+                return  # otro worker lo escribió hace poco
+            resumen = escribir_snapshot(ruta)
+            logger.info(f"📸 Snapshot escrito: {resumen['bytes']} bytes, {resumen['courses']} cursos "
+                        f"({resumen['ms']} ms)")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _refrescar_siempre(ruta, intervalo):
+    # El primero de inmediato si falta o está viejo; luego cada intervalo (±10 %)
+    espera = 0
+    while True:
+        time.sleep(espera)
+        try:
+            _refrescar(ruta, intervalo)
+        except ERRORES_CONEXION as e:
+            obtener_estado_firestore().registrar_fallo(e)
+        except Exception as e:
+            logger.error(f"❌ Error al escribir el snapshot: {str(e)}")
+        espera = intervalo * random.uniform(0.9, 1.1)
+
+
+_hilo = None
+
+
+def iniciar():
+    """Carga el snapshot y calienta las cachés; arranca el refresco si SNAPSHOT_INTERVALO > 0"""
+    global _hilo
+    if settings.SNAPSHOT_CARGAR_AL_INICIAR:
+        inicio = time.perf_counter()
+        snapshot = obtener_snapshot()
+        if snapshot is not None:
+            try:
+                calentadas = calentar(snapshot)
+                if calentadas:
+                    logger.info(f"📸 Cachés calentadas desde el snapshot ({', '.join(calentadas)}: "
+                                f"{len(snapshot.cursos)} cursos, {int(snapshot.edad())} s de antigüedad, "
+                                f"{(time.perf_counter() - inicio) * 1000:.0f} ms)")
+                else:
+                    logger.warning(f"⚠️ Snapshot de {int(snapshot.edad())} s, más viejo que el TTL de las "
+                                   f"cachés: no se calientan")
+            except Exception as e:
+                logger.error(f"❌ No se pudieron calentar las cachés: {str(e)}")
+
+    if settings.SNAPSHOT_INTERVALO > 0 and _hilo is None:
+        _hilo = threading.Thread(
+            target=_refrescar_siempre,
+            args=(Path(settings.SNAPSHOT_RUTA), settings.SNAPSHOT_INTERVALO),
+            name='snapshot',
+            daemon=True
+        )
+        _hilo.start()
@@ -4,16 +4,30 @@ from .views import (
     # Asistencias
     AsistenciaList,
     AsistenciaCreate,
+    AsistenciaLoteView,
+    AsistenciaColaView,
+    AsistenciaCerrarSesionView,
     AsistenciaRetrieve,
     AsistenciaUpdate,
     AsistenciaDelete,
+    # Bootstrap y lotes
+    BootstrapView,
+    BatchView,
     # Horarios
     HorarioProfesorView,
     HorarioCursoView,
     HorarioClaseView,
+    # Aulas
+    AulaActualView,
+    AulasLibresView,
     # Health Check
     HealthCheck,
     EstudianteNombreView,
+    HistorialEstudianteView,
+    # Trabajos
+    TrabajoView,
+    # Métricas
+    MetricasView,
 )
 
 urlpatterns = [
@@ -22,15 +36,25 @@ urlpatterns = [
     # ============================================
     path("health/", HealthCheck.as_view(), name="health-check"),
     
+    # ============================================
+    # BOOTSTRAP DEL FRONTEND Y LOTES DE PETICIONES
+    # ============================================
+    path("bootstrap/", BootstrapView.as_view(), name="bootstrap"),
+    path("batch/", BatchView.as_view(), name="batch"),
+    
     # ============================================
     # ASISTENCIAS
     # ============================================
     path("asistencias/", AsistenciaList.as_view(), name="asistencia-list"),
     path("asistencias/crear/", AsistenciaCreate.as_view(), name="asistencia-create"),
+    path("asistencias/lote/", AsistenciaLoteView.as_view(), name="asistencia-batch"),
+    path("asistencias/cola/", AsistenciaColaView.as_view(), name="asistencia-cola"),
+    path("asistencias/cerrar-sesion/", AsistenciaCerrarSesionView.as_view(), name="asistencia-cerrar-sesion"),
     path("asistencias/<str:pk>/", AsistenciaRetrieve.as_view(), name="asistencia-detail"),
     path("asistencias/<str:pk>/update/", AsistenciaUpdate.as_view(), name="asistencia-update"),
     path("asistencias/<str:pk>/delete/", AsistenciaDelete.as_view(), name="asistencia-delete"),
     path('estudiantes/nombre/<str:cedula>/', EstudianteNombreView.as_view(), name='estudiante-nombre'),
+    path('estudiantes/<str:cedula>/asistencias/', HistorialEstudianteView.as_view(), name='estudiante-historial'),
 
     
     # ============================================
@@ -40,4 +64,20 @@ urlpatterns = [
     path("horarios/Cursos/<str:course_id>/", HorarioCursoView.as_view(), name="horario-curso"),
     path("horarios/clases/", HorarioClaseView.as_view(), name="horario-clase-create"),
     path("horarios/clases/<str:clase_id>/", HorarioClaseView.as_view(), name="horario-clase-detail"),
+    
+    # ============================================
+    # AULAS
+    # ============================================
+    path("aulas/libres/", AulasLibresView.as_view(), name="aulas-libres"),
+    path("aulas/<str:aula>/actual/", AulaActualView.as_view(), name="aula-actual"),
+    
+    # ============================================
+    # TRABAJOS EN SEGUNDO PLANO
+    # ============================================
+    path("jobs/<str:job_id>/", TrabajoView.as_view(), name="job-detail"),
+    
+    # ============================================
+    # MÉTRICAS
+    # ============================================
+    path("metricas/", MetricasView.as_view(), name="metricas"),
 ]
\ No newline at end of file
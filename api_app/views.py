@@ -14,14 +14,53 @@ from .serializers import (
     ScheduleClassSerializer,
     UpdateScheduleSerializer
 )
+from .conditional import calcular_validadores, respuesta_no_modificada, aplicar_validadores
+from .membership import (
+    leer_membresia,
+    cursos_de_membresia,
+    guardar_membresia,
+    sincronizar_membresia_curso,
+    desvincular_curso,
+)
+from .deletion import BorradorRecursivo, contar_descendientes
+from .writes import LoteEscrituras
+from .schedule import DIAS, INDICE_DIA, Franja, HorarioCompacto, formato_hora, minutos
+from .rooms import obtener_indice_aulas, conflicto_interno_aulas
+from .ingestion import ESTADOS_VALIDOS, ZONA_COLOMBIA, ingerir_eventos, obtener_calendario
+from .coalescing import obtener_coalescedor
+from .writebehind import obtener_cola
+from .formats import FORMATO_PLANO, FORMATOS_ASISTENCIA
+from .negotiation import AcceptOnlyNegotiation
+from .history import borrar_historial, entradas_curso, escrituras_historial, pagina_historial, registrar_historial
+from .archive import CAMPO_ARCHIVADO, leer_sesiones, localizar_archivada
+from .roster import cedulas_curso, cerrar_sesion, obtener_listas
+from .concurrency import en_paralelo
+from .request_cache import leer_documento, leer_documentos, memo
+from .batch import ejecutar_lote
+from .snapshot import ERRORES_CONEXION, marcar_desactualizada, obtener_estado_firestore, obtener_snapshot
+from .sharding import (
+    copias_asistencia,
+    localizar_asistencia,
+    referencia_asistencia,
+)
+from . import deadlines, metrics
+from .deadlines import PlazoAgotado
+from .jobs import enviar_trabajo, obtener_trabajo, cancelar_trabajo
+from django.conf import settings
+from google.cloud.firestore_v1.field_path import FieldPath
 from firebase_admin.exceptions import FirebaseError
 from google.api_core.exceptions import PermissionDenied, NotFound
 import logging
+import re
 from datetime import datetime, time
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 db = firestore.client()
+
+# Errores que no se pueden tragar devolviendo datos parciales: sin plazo o sin
+# Firestore, una lista de cursos incompleta saldría como 200 con un ETag válido
+ERRORES_FIRESTORE = (PlazoAgotado,) + ERRORES_CONEXION
 def obtener_fecha_colombia():
     zona_colombia = timezone(timedelta(hours=-5))
     ahora_colombia = datetime.now(zona_colombia)
@@ -30,62 +69,50 @@ def obtener_fecha_colombia():
     return fecha_str, hora_str
 
 # ----- FUNCIONES AUXILIARES -----
-def validar_conflicto_horario(profesor_id, new_class, exclude_course_id=None, exclude_class_index=None):
+def cargar_horario_profesor(profesor_id, exclude_course_id=None):
     """
-    Valida si hay conflicto de horario para el profesor
+    Carga todas las clases del profesor en un HorarioCompacto (una sola consulta).
     
     Args:
         profesor_id: UID del profesor
-        new_class: Dict con {day, iniTime, endTime}
         exclude_course_id: ID del curso a excluir (para ediciones)
-        exclude_class_index: Índice de la clase a excluir
+    """
+    query = (db.collection("courses")
+             .where(filter=firestore.FieldFilter("profesorID", "==", profesor_id))
+             .select(['schedule']))
+    cursos = [
+        {'id': doc.id, 'schedule': (doc.to_dict() or {}).get('schedule', [])}
+        for doc in query.stream()
+    ]
+    return HorarioCompacto.desde_cursos(cursos, exclude_course_id)
+
+
+def validar_conflicto_horario(profesor_id, new_class, exclude_course_id=None, exclude_class_index=None,
+                              horario=None):
+    """
+    Valida si hay conflicto de horario para el profesor
+    
+    Args:
+        profesor_id: UID del profesor
+        new_class: Dict con {day, iniTime, endTime} (o ClaseValidada con su Franja)
+        exclude_course_id: ID del curso a excluir (para ediciones); se excluye el curso completo
+        exclude_class_index: Se conserva por compatibilidad (el curso excluido se omite entero)
+        horario: HorarioCompacto ya cargado, para validar varias clases con una sola consulta
     
     Returns:
         Tuple (bool, str) - (hay_conflicto, mensaje_error)
     """
     try:
-        # Obtener todos los cursos del profesor
-        courses_ref = db.collection("courses")
-        query = courses_ref.where("profesorID", "==", profesor_id)
-        docs = query.stream()
+        if horario is None:
+            horario = cargar_horario_profesor(profesor_id, exclude_course_id)
         
-        new_day = new_class.get('day')
-        new_ini = new_class.get('iniTime')
-        new_fin = new_class.get('endTime')
+        franja = Franja.desde_dict(new_class)
+        choque = horario.conflicto(franja)
         
-        # Convertir tiempos a minutos para comparación
-        new_ini_min = int(new_ini.split(':')[0]) * 60 + int(new_ini.split(':')[1])
-        new_fin_min = int(new_fin.split(':')[0]) * 60 + int(new_fin.split(':')[1])
-        
-        for doc in docs:
-            curso_id = doc.id
-            
-            # Saltar el curso excluido (para ediciones)
-            if exclude_course_id and curso_id == exclude_course_id:
-                continue
-            
-            curso_data = doc.to_dict()
-            schedule = curso_data.get('schedule', [])
-            
-            for idx, clase in enumerate(schedule):
-                # Saltar la clase excluida (para ediciones)
-                if exclude_course_id == curso_id and exclude_class_index == idx:
-                    continue
-                
-                # Solo verificar si es el mismo día
-                if clase.get('day') != new_day:
-                    continue
-                
-                clase_ini = clase.get('iniTime')
-                clase_fin = clase.get('endTime')
-                
-                clase_ini_min = int(clase_ini.split(':')[0]) * 60 + int(clase_ini.split(':')[1])
-                clase_fin_min = int(clase_fin.split(':')[0]) * 60 + int(clase_fin.split(':')[1])
-                
-                # Verificar solapamiento
-                # Hay conflicto si: new_ini < clase_fin AND new_fin > clase_ini
-                if new_ini_min < clase_fin_min and new_fin_min > clase_ini_min:
-                    return True, f"Conflicto de horario: ya tiene clase de {clase_ini} a {clase_fin} el {new_day}"
+        if choque:
+            _, inicio, fin = choque
+            return True, (f"Conflicto de horario: ya tiene clase de {formato_hora(inicio)} "
+                          f"a {formato_hora(fin)} el {DIAS[franja.dia]}")
         
         return False, None
         
@@ -94,6 +121,25 @@ def validar_conflicto_horario(profesor_id, new_class, exclude_course_id=None, ex
         return False, str(e)
 
 
+def validar_conflicto_aula(new_class, exclude_course_id=None, exclude_class_index=None):
+    """
+    Valida que el aula no esté reservada por otra clase en ese horario
+    
+    Args:
+        new_class: Dict con {classroom, day, iniTime, endTime}
+        exclude_course_id: Curso a ignorar (completo si no se da exclude_class_index)
+        exclude_class_index: Índice de la clase que se está editando
+    
+    Returns:
+        Tuple (bool, str) - (hay_conflicto, mensaje_error)
+    """
+    ocupada = obtener_indice_aulas().conflicto(new_class, exclude_course_id, exclude_class_index)
+    if ocupada:
+        return True, (f"Conflicto de aula: {ocupada['classroom']} está ocupada de {ocupada['iniTime']} "
+                      f"a {ocupada['endTime']} el {ocupada['day']} por {ocupada['nameCourse']}")
+    return False, None
+
+
 def handle_firestore_error(e):
     """Manejo centralizado de errores Firestore"""
     if isinstance(e, PermissionDenied):
@@ -165,7 +211,8 @@ def obtener_uid_usuario(request):
 def buscar_persona_por_uid(uid):
     """
     Busca un documento en la colección 'person' donde el campo 'profesorUID' 
-    coincida con el UID proporcionado.
+    coincida con el UID proporcionado. Dentro de un lote (/api/batch/) la
+    consulta se hace una sola vez (ver request_cache.py).
     
     Args:
         uid (str): UID del usuario de Firebase Auth
@@ -173,6 +220,10 @@ def buscar_persona_por_uid(uid):
     Returns:
         dict | None: Datos del documento si se encuentra, None si no existe
     """
+    return memo(('persona', uid), _consultar_persona_por_uid, uid)
+
+
+def _consultar_persona_por_uid(uid):
     try:
         logger.info(f"🔍 Buscando persona con UID: {uid}")
         
@@ -195,6 +246,9 @@ def buscar_persona_por_uid(uid):
         
         return person_data
         
+    except ERRORES_FIRESTORE:
+        # Plazo agotado o Firestore no disponible: que la vista decida (p. ej. el snapshot)
+        raise
     except Exception as e:
         logger.error(f"❌ Error al buscar persona por UID: {str(e)}")
         import traceback
@@ -234,10 +288,55 @@ def buscar_nombre_estudiante(cedula, buscar_en_db=False):
         logger.error(f"❌ Error al buscar nombre de estudiante: {str(e)}")
         return f"Estudiante {cedula}"
 
+def buscar_nombres_estudiantes(cedulas):
+    """
+    Nombres de varios estudiantes en un solo get_all (solo 'namePerson').
+    
+    Returns:
+        dict: cédula -> nombre (o "Estudiante <cédula>" si no existe)
+    """
+    cedulas = sorted({str(cedula) for cedula in cedulas if cedula})
+    if not cedulas:
+        return {}
+    nombres = {cedula: f"Estudiante {cedula}" for cedula in cedulas}
+    refs = [db.collection('person').document(cedula) for cedula in cedulas]
+    for doc in db.get_all(refs, field_paths=['namePerson']):
+        if doc.exists:
+            nombres[doc.id] = (doc.to_dict() or {}).get('namePerson') or nombres[doc.id]
+    return nombres
+
+# ============================================
+# PROYECCIONES (?fields=)
+# ============================================
+PATRON_CAMPO = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def leer_campos(request):
+    """
+    Campos pedidos en ?fields=nameCourse,group,schedule para proyectar los
+    documentos de curso en Firestore (select / get(field_paths=)). 'id'
+    siempre se incluye y no es un campo del documento.
+    
+    Returns:
+        list | None: None si no se pidió proyección (documento completo)
+    
+    Raises:
+        ValueError: Si algún nombre de campo no es válido
+    """
+    valor = request.query_params.get('fields')
+    if not valor:
+        return None
+    campos = [campo.strip() for campo in valor.split(',') if campo.strip()]
+    invalidos = [campo for campo in campos if not PATRON_CAMPO.match(campo)]
+    if invalidos:
+        raise ValueError(f"Campos inválidos en fields: {', '.join(invalidos)}")
+    return list(dict.fromkeys(campo for campo in campos if campo != 'id'))
+
+
 # ============================================
 # FUNCIÓN PARA OBTENER CURSOS DEL PROFESOR
 # ============================================
-def obtener_cursos_profesor(person_data, user_uid):
+def obtener_cursos_profesor(person_data, user_uid, versiones=None, campos=None):
     """
     Obtiene los cursos de un profesor buscando en:
     1. person->courses (array con IDs de cursos)
@@ -247,12 +346,16 @@ def obtener_cursos_profesor(person_data, user_uid):
     Args:
         person_data: Datos del documento person
         user_uid: UID del usuario
+        versiones: Dict opcional que se llena con {course_id: update_time}
+        campos: Proyección de los documentos de curso (None = completos)
         
     Returns:
         list: Lista de cursos encontrados
     """
     cursos = []
     course_ids_found = set()  # Para evitar duplicados
+    if versiones is None:
+        versiones = {}
     
     try:
         # ============================================
@@ -264,7 +367,7 @@ def obtener_cursos_profesor(person_data, user_uid):
         for course_id in courses_array:
             try:
                 course_ref = db.collection("courses").document(course_id)
-                course_doc = course_ref.get()
+                course_doc = leer_documento(course_ref, campos)
                 
                 if course_doc.exists:
                     curso_data = course_doc.to_dict()
@@ -274,10 +377,13 @@ def obtener_cursos_profesor(person_data, user_uid):
                     if course_doc.id not in course_ids_found:
                         cursos.append(curso_data)
                         course_ids_found.add(course_doc.id)
+                        versiones[course_doc.id] = course_doc.update_time
                         logger.info(f"   ✅ Curso encontrado: {curso_data.get('nameCourse')} (ID: {course_doc.id})")
                 else:
                     logger.warning(f"   ⚠️ Curso {course_id} no existe en Firestore")
                     
+            except ERRORES_FIRESTORE:
+                raise
             except Exception as e:
                 logger.error(f"   ❌ Error al obtener curso {course_id}: {str(e)}")
         
@@ -288,6 +394,8 @@ def obtener_cursos_profesor(person_data, user_uid):
         
         courses_ref = db.collection("courses")
         query = courses_ref.where(filter=firestore.FieldFilter('profesorID', '==', user_uid))
+        if campos is not None:
+            query = query.select(campos)
         docs = query.stream()
         
         for doc in docs:
@@ -296,6 +404,7 @@ def obtener_cursos_profesor(person_data, user_uid):
                 curso_data['id'] = doc.id
                 cursos.append(curso_data)
                 course_ids_found.add(doc.id)
+                versiones[doc.id] = doc.update_time
                 logger.info(f"   ✅ Curso encontrado: {curso_data.get('nameCourse')} (ID: {doc.id})")
         
         # ============================================
@@ -303,10 +412,11 @@ def obtener_cursos_profesor(person_data, user_uid):
         # ============================================
         logger.info(f"📋 Método 3: Buscando en groups donde profesorID == {user_uid}")
         
-        all_courses = db.collection("courses").stream()
+        # Solo los IDs: los datos se leen (proyectados) para los cursos que coinciden
+        all_courses = db.collection("courses").select([FieldPath.document_id()]).stream()
         
-        for course_doc in all_courses:
-            course_id = course_doc.id
+        for course_ref_doc in all_courses:
+            course_id = course_ref_doc.id
             
             # Ya lo tenemos? Saltar
             if course_id in course_ids_found:
@@ -319,14 +429,20 @@ def obtener_cursos_profesor(person_data, user_uid):
             
             if group_docs:
                 # Encontramos al menos un grupo con este profesor
+                course_doc = leer_documento(db.collection("courses").document(course_id), campos)
+                if not course_doc.exists:
+                    continue
                 curso_data = course_doc.to_dict()
                 curso_data['id'] = course_id
                 cursos.append(curso_data)
                 course_ids_found.add(course_id)
+                versiones[course_id] = course_doc.update_time
                 logger.info(f"   ✅ Curso encontrado en groups: {curso_data.get('nameCourse')} (ID: {course_id})")
         
         logger.info(f"📊 Total de cursos encontrados: {len(cursos)}")
         
+    except ERRORES_FIRESTORE:
+        raise
     except Exception as e:
         logger.error(f"❌ Error al obtener cursos del profesor: {str(e)}")
         import traceback
@@ -338,7 +454,7 @@ def obtener_cursos_profesor(person_data, user_uid):
 # ============================================
 # FUNCIÓN PARA OBTENER CURSOS DEL ESTUDIANTE
 # ============================================
-def obtener_cursos_estudiante(person_data, user_uid):
+def obtener_cursos_estudiante(person_data, user_uid, versiones=None, campos=None):
     """
     Obtiene los cursos de un estudiante buscando en:
     1. person->courses (array con IDs de cursos)
@@ -347,12 +463,16 @@ def obtener_cursos_estudiante(person_data, user_uid):
     Args:
         person_data: Datos del documento person
         user_uid: UID del usuario
+        versiones: Dict opcional que se llena con {course_id: update_time}
+        campos: Proyección de los documentos de curso (None = completos)
         
     Returns:
         list: Lista de cursos encontrados
     """
     cursos = []
     course_ids_found = set()
+    if versiones is None:
+        versiones = {}
     
     try:
         # ============================================
@@ -364,7 +484,7 @@ def obtener_cursos_estudiante(person_data, user_uid):
         for course_id in courses_array:
             try:
                 course_ref = db.collection("courses").document(course_id)
-                course_doc = course_ref.get()
+                course_doc = leer_documento(course_ref, campos)
                 
                 if course_doc.exists:
                     curso_data = course_doc.to_dict()
@@ -373,10 +493,13 @@ def obtener_cursos_estudiante(person_data, user_uid):
                     if course_doc.id not in course_ids_found:
                         cursos.append(curso_data)
                         course_ids_found.add(course_doc.id)
+                        versiones[course_doc.id] = course_doc.update_time
                         logger.info(f"   ✅ Curso encontrado: {curso_data.get('nameCourse')} (ID: {course_doc.id})")
                 else:
                     logger.warning(f"   ⚠️ Curso {course_id} no existe en Firestore")
                     
+            except ERRORES_FIRESTORE:
+                raise
             except Exception as e:
                 logger.error(f"   ❌ Error al obtener curso {course_id}: {str(e)}")
         
@@ -387,6 +510,8 @@ def obtener_cursos_estudiante(person_data, user_uid):
         
         courses_ref = db.collection("courses")
         query = courses_ref.where(filter=firestore.FieldFilter('estudianteID', 'array_contains', user_uid))
+        if campos is not None:
+            query = query.select(campos)
         docs = query.stream()
         
         for doc in docs:
@@ -395,10 +520,13 @@ def obtener_cursos_estudiante(person_data, user_uid):
                 curso_data['id'] = doc.id
                 cursos.append(curso_data)
                 course_ids_found.add(doc.id)
+                versiones[doc.id] = doc.update_time
                 logger.info(f"   ✅ Curso encontrado: {curso_data.get('nameCourse')} (ID: {doc.id})")
         
         logger.info(f"📊 Total de cursos encontrados: {len(cursos)}")
         
+    except ERRORES_FIRESTORE:
+        raise
     except Exception as e:
         logger.error(f"❌ Error al obtener cursos del estudiante: {str(e)}")
         import traceback
@@ -407,20 +535,220 @@ def obtener_cursos_estudiante(person_data, user_uid):
     return cursos
 
 
+# ============================================
+# RESOLUCIÓN DE CURSOS CON EL ÍNDICE DE MEMBRESÍA
+# ============================================
+def resolver_cursos_usuario(person_data, user_uid, user_type, versiones=None, campos=None):
+    """
+    Obtiene los cursos visibles para el usuario leyendo un solo documento
+    (membership/{uid}) y luego los cursos en un único get_all.
+    
+    Si el índice no existe se repara con la búsqueda multi-estrategia
+    (obtener_cursos_profesor / obtener_cursos_estudiante) y se materializa.
+    
+    Args:
+        person_data: Datos del documento person
+        user_uid: UID del usuario
+        user_type: 'Profesor' o 'Estudiante'
+        versiones: Dict opcional que se llena con {course_id: update_time}
+        campos: Proyección de los documentos de curso (None = completos)
+        
+    Returns:
+        list: Lista de cursos encontrados
+    """
+    if versiones is None:
+        versiones = {}
+    
+    membresia = leer_membresia(user_uid)
+    
+    if membresia is None:
+        logger.info(f"🔧 Índice de membresía ausente para {user_uid}, reparando con búsqueda completa")
+        if user_type == 'Profesor':
+            cursos = obtener_cursos_profesor(person_data, user_uid, versiones, campos)
+        else:
+            cursos = obtener_cursos_estudiante(person_data, user_uid, versiones, campos)
+        
+        try:
+            guardar_membresia(user_uid, {
+                curso['id']: {'roles': [user_type], 'groups': {}} for curso in cursos
+            })
+        except Exception as e:
+            logger.error(f"❌ Error al materializar membresía de {user_uid}: {str(e)}")
+        
+        return cursos
+    
+    # person->courses ya está en memoria: unirlo no cuesta lecturas y cubre
+    # cambios hechos fuera de la API antes de la siguiente reconciliación
+    course_ids = list(dict.fromkeys(
+        cursos_de_membresia(membresia) + list(person_data.get('courses', []) or [])
+    ))
+    logger.info(f"📋 Membresía: {len(course_ids)} cursos para {user_uid}")
+    
+    if not course_ids:
+        return []
+    
+    refs = [db.collection("courses").document(course_id) for course_id in course_ids]
+    encontrados = {}
+    for course_doc in leer_documentos(refs, campos):
+        if not course_doc.exists:
+            logger.warning(f"   ⚠️ Curso {course_doc.id} del índice no existe en Firestore")
+            continue
+        curso_data = course_doc.to_dict()
+        curso_data['id'] = course_doc.id
+        encontrados[course_doc.id] = curso_data
+        versiones[course_doc.id] = course_doc.update_time
+    
+    # get_all no garantiza el orden
+    cursos = [encontrados[course_id] for course_id in course_ids if course_id in encontrados]
+    logger.info(f"📊 Total de cursos encontrados: {len(cursos)}")
+    return cursos
+
+
+# ============================================
+# BORRADO EN CASCADA DE CURSOS
+# ============================================
+def borrar_cursos_en_cascada(contexto, course_ids):
+    """
+    Borra cursos junto con sus subcolecciones (groups, assistances, ...), las
+    entradas de historial de sus inscritos (person/{cedula}/attendance) y los
+    quita del índice de membresía. Se usa directamente o como trabajo en
+    segundo plano (contexto es None en el caso síncrono).
+    
+    Returns:
+        dict: Resumen con cursos, documentos y entradas de historial eliminados
+    """
+    progreso = cancelado = None
+    if contexto is not None:
+        progreso = lambda borrados, encolados: contexto.reportar(borrados, encolados, "Borrando documentos")
+        cancelado = contexto.cancelado
+    
+    refs = [db.collection("courses").document(course_id) for course_id in course_ids]
+    # Los inscritos se leen antes: el borrado se lleva estudianteID de curso y grupos
+    inscritos = {ref.id: cedulas_curso(ref) for ref in refs}
+    documentos = BorradorRecursivo(progreso=progreso, cancelado=cancelado).borrar(refs)
+    if cancelado and cancelado():
+        # Los cursos siguen existiendo: su historial también
+        return {"deletedCount": 0, "documentosEliminados": documentos, "historialEliminado": 0}
+    
+    # Una consulta por rango de ID por inscrito, concurrentes
+    lote = LoteEscrituras()
+    for referencias in en_paralelo([
+        (entradas_curso, cedula, course_id)
+        for course_id, cedulas in inscritos.items() for cedula in sorted(cedulas)
+    ]):
+        for referencia in referencias:
+            lote.delete(referencia)
+    lote.commit()
+    historial = lote.operaciones
+    
+    indice_aulas = obtener_indice_aulas()
+    listas = obtener_listas()
+    for course_id in course_ids:
+        desvincular_curso(course_id)
+        indice_aulas.quitar_curso(course_id)
+        listas.quitar_curso(course_id)
+    
+    if contexto is not None:
+        contexto.reportar(documentos, documentos, "Borrado completado", forzar=True)
+    
+    return {"deletedCount": len(course_ids), "documentosEliminados": documentos, "historialEliminado": historial}
+
+
+def responder_borrado(request, course_ids, mensaje):
+    """
+    Borra los cursos en línea si son pocos documentos; si no, encola un trabajo
+    y responde 202 con su ID para consultar /api/jobs/<id>/.
+    """
+    refs = [db.collection("courses").document(course_id) for course_id in course_ids]
+    umbral = settings.BORRADO_UMBRAL_SINCRONO
+    descendientes = contar_descendientes(refs, umbral)
+    
+    if descendientes > umbral:
+        job_id = enviar_trabajo(
+            "borrado_cursos",
+            borrar_cursos_en_cascada,
+            course_ids,
+            uid=request.user_firebase.get('uid')
+        )
+        logger.info(f"📤 Borrado grande (>{umbral} documentos) enviado a segundo plano: {job_id}")
+        return Response({
+            "success": True,
+            "message": f"{mensaje} en segundo plano",
+            "jobId": job_id,
+            "statusUrl": f"/api/jobs/{job_id}/",
+            "courseIds": course_ids
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    resumen = borrar_cursos_en_cascada(None, course_ids)
+    return Response({
+        "success": True,
+        "message": mensaje,
+        "courseIds": course_ids,
+        **resumen
+    }, status=status.HTTP_200_OK)
+
+
 # ============================================
 # FUNCIONES AUXILIARES PARA MANEJAR AMBAS ESTRUCTURAS
 # ============================================
 
-def obtener_asistencias_curso(course_id, course_data, course_name):
+def leer_filtros_asistencia(request):
+    """
+    Filtros de ?estado=, ?curso=, ?grupo= (repetibles o separados por comas)
+    y ?desde=/?hasta= (YYYY-MM-DD, inclusivas).
+    
+    Returns:
+        dict: {'estados', 'cursos', 'grupos'} como sets (None = sin filtro), 'desde', 'hasta'
+    
+    Raises:
+        ValueError: Si un estado o una fecha no son válidos
+    """
+    def valores(nombre):
+        lista = [v.strip() for valor in request.query_params.getlist(nombre) for v in valor.split(',')]
+        return {v for v in lista if v} or None
+    
+    filtros = {
+        'estados': valores('estado'),
+        'cursos': valores('curso'),
+        'grupos': valores('grupo'),
+        'desde': request.query_params.get('desde') or None,
+        'hasta': request.query_params.get('hasta') or None,
+    }
+    
+    invalidos = (filtros['estados'] or set()) - set(ESTADOS_VALIDOS)
+    if invalidos:
+        raise ValueError(f"Estado inválido: {', '.join(sorted(invalidos))}. Debe ser uno de: {', '.join(ESTADOS_VALIDOS)}")
+    for campo in ('desde', 'hasta'):
+        if filtros[campo]:
+            try:
+                datetime.strptime(filtros[campo], "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Fecha inválida en '{campo}': {filtros[campo]} (formato YYYY-MM-DD)")
+    return filtros
+
+
+def obtener_asistencias_curso(course_id, course_data, course_name, filtros=None):
     """
     Obtiene asistencias de un curso, manejando ambas estructuras:
     1. courses/{courseId}/assistances/{fecha}
     2. courses/{courseId}/groups/{groupId}/assistances/{fecha}
     
+    Los filtros (ver leer_filtros_asistencia) se aplican antes de leer: los
+    grupos que no coinciden no se consultan, las fechas son un rango de IDs y
+    el estado se descarta antes de armar cada registro.
+    
+    Los periodos archivados (course_data['archivadoHasta'], ver archive.py)
+    solo se leen si 'desde' es anterior al corte o no se indicó.
+    
     Returns:
         list: Lista de asistencias encontradas
     """
     asistencias_list = []
+    filtros = filtros or {}
+    estados = filtros.get('estados')
+    grupos_filtro = filtros.get('grupos')
+    desde, hasta = filtros.get('desde'), filtros.get('hasta')
+    archivado_hasta = (course_data or {}).get(CAMPO_ARCHIVADO)
     
     # ✅ CASO 1: Verificar si tiene subcolección 'groups'
     groups_ref = db.collection("courses").document(course_id).collection("groups")
@@ -435,21 +763,22 @@ def obtener_asistencias_curso(course_id, course_data, course_name):
             group_data = group_doc.to_dict()
             group_name = group_data.get('group', group_id)
             
+            if grupos_filtro and group_id not in grupos_filtro and str(group_name) not in grupos_filtro:
+                continue
+            
             logger.info(f"      📂 Procesando grupo: {group_name} (ID: {group_id})")
             
-            # Obtener asistencias del grupo
-            assistances_ref = db.collection("courses").document(course_id).collection("groups").document(group_id).collection("assistances")
-            assistances = assistances_ref.stream()
+            # Obtener asistencias del grupo (documentos base y shards combinados por fecha)
+            sesiones = leer_sesiones(course_id, group_id, archivado_hasta, desde, hasta)
             
             asistencias_grupo = 0
             
-            for assistance_doc in assistances:
-                fecha_id = assistance_doc.id
-                assistance_data = assistance_doc.to_dict()
-                
+            for fecha_id, assistance_data in sesiones.items():
                 # Cada documento tiene cédulas como campos
                 for cedula, estudiante_data in assistance_data.items():
                     if isinstance(estudiante_data, dict):
+                        if estados and estudiante_data.get('estadoAsistencia', 'Presente') not in estados:
+                            continue
                         asistencias_grupo += 1
                         
                         # Crear objeto de asistencia con información del grupo
@@ -470,22 +799,24 @@ def obtener_asistencias_curso(course_id, course_data, course_name):
             
             logger.info(f"         ✅ {asistencias_grupo} asistencias en grupo {group_name}")
     
+    elif grupos_filtro:
+        # Se pidió un grupo y el curso no tiene grupos
+        logger.info(f"   ⏭️ Curso SIN grupos omitido por el filtro de grupo: {course_name}")
+    
     else:
         # ✅ CASO 2: No tiene grupos - estructura simple
         logger.info(f"   📚 Curso SIN grupos: {course_name}")
         
-        # Obtener asistencias directamente
-        assistances_ref = db.collection("courses").document(course_id).collection("assistances")
-        assistances = assistances_ref.stream()
+        # Obtener asistencias directamente (documentos base y shards combinados por fecha)
+        sesiones = leer_sesiones(course_id, None, archivado_hasta, desde, hasta)
         
         asistencias_curso = 0
         
-        for assistance_doc in assistances:
-            fecha_id = assistance_doc.id
-            assistance_data = assistance_doc.to_dict()
-            
+        for fecha_id, assistance_data in sesiones.items():
             for cedula, estudiante_data in assistance_data.items():
                 if isinstance(estudiante_data, dict):
+                    if estados and estudiante_data.get('estadoAsistencia', 'Presente') not in estados:
+                        continue
                     asistencias_curso += 1
                     
                     asistencia = {
@@ -507,6 +838,43 @@ def obtener_asistencias_curso(course_id, course_data, course_name):
     return asistencias_list
 
 
+def parsear_id_asistencia(pk):
+    """
+    ID de asistencia -> (course_id, group_id, fecha, cedula). group_id es None
+    en cursos sin grupos. El ID no incluye el shard: se resuelve al leer.
+    
+    Returns:
+        tuple | None: None si el ID no tiene 3 o 4 partes
+    """
+    parts = pk.split('_')
+    if len(parts) == 4:
+        return tuple(parts)
+    if len(parts) == 3:
+        course_id, fecha_id, cedula = parts
+        return course_id, None, fecha_id, cedula
+    return None
+
+
+def asistencia_archivada(course_id, group_id, fecha, cedula):
+    """
+    Entrada que ya solo está en el archivo del curso (periodo anterior a
+    'archivadoHasta'); se consulta solo cuando no está en la colección viva.
+    
+    Returns:
+        tuple: (existe_sesion archivada, datos | None)
+    """
+    course_doc = db.collection("courses").document(course_id).get(field_paths=[CAMPO_ARCHIVADO])
+    archivado_hasta = (course_doc.to_dict() or {}).get(CAMPO_ARCHIVADO) if course_doc.exists else None
+    return localizar_archivada(course_id, group_id, fecha, cedula, archivado_hasta)
+
+
+def respuesta_periodo_archivado():
+    return Response(
+        {"error": "Periodo archivado (solo lectura)"},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
 # ============================================
 # ASISTENCIAS - MODIFICADO PARA FILTRAR POR PROFESOR
 # ============================================
@@ -517,13 +885,34 @@ class AsistenciaList(APIView):
     Lista las asistencias filtradas según el usuario:
     - Profesor: Solo asistencias de SUS cursos
     - Estudiante: Solo asistencias de SUS cursos
+    
+    Filtros opcionales: ?estado=Ausente&curso=<ID o nombre>&grupo=<ID o nombre>
+    &desde=YYYY-MM-DD&hasta=YYYY-MM-DD (estado, curso y grupo admiten varios valores)
+    
+    ?format=grouped|columnar devuelve la misma información sin repetir los datos
+    del curso en cada registro (ver api_app/formats.py); por defecto, lista plana.
     """
+    # ?format= es el formato de la respuesta, no el renderer (ese se elige por Accept)
+    content_negotiation_class = AcceptOnlyNegotiation
+    
     def get(self, request):
         # Obtener UID sin verificar token
         user_uid, error = obtener_uid_usuario(request)
         if error:
             return error
 
+        formato = request.query_params.get('format') or FORMATO_PLANO
+        if formato not in FORMATOS_ASISTENCIA:
+            return Response(
+                {"error": f"Formato inválido. Debe ser uno de: {', '.join(FORMATOS_ASISTENCIA)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            filtros = leer_filtros_asistencia(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             logger.info("=" * 60)
             logger.info("📥 [GET] /api/asistencias/ - Obtener asistencias filtradas")
@@ -549,19 +938,26 @@ class AsistenciaList(APIView):
             # ============================================
             # OBTENER CURSOS SEGÚN EL TIPO DE USUARIO
             # ============================================
-            if user_type == 'Profesor':
-                logger.info(f"👨‍🏫 Obteniendo cursos del profesor {user_name}")
-                cursos_usuario = obtener_cursos_profesor(person_data, user_uid)
-            elif user_type == 'Estudiante':
-                logger.info(f"👨‍🎓 Obteniendo cursos del estudiante {user_name}")
-                cursos_usuario = obtener_cursos_estudiante(person_data, user_uid)
-            else:
+            if user_type not in ('Profesor', 'Estudiante'):
                 logger.warning(f"⚠️ Tipo de usuario no reconocido: {user_type}")
                 return Response({
                     "error": f"Tipo de usuario no válido: {user_type}",
                     "asistencias": []
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            logger.info(f"📚 Obteniendo cursos de {user_name} ({user_type})")
+            # Solo nombre y corte de archivo: el listado no usa el resto del curso (estudianteID puede ser enorme)
+            cursos_usuario = resolver_cursos_usuario(
+                person_data, user_uid, user_type, campos=['nameCourse', CAMPO_ARCHIVADO]
+            )
+            
+            # Filtro de curso: los demás cursos no se leen
+            if filtros['cursos']:
+                cursos_usuario = [
+                    curso for curso in cursos_usuario
+                    if curso['id'] in filtros['cursos'] or curso.get('nameCourse') in filtros['cursos']
+                ]
+            
             # ============================================
             # OBTENER ASISTENCIAS DE LOS CURSOS
             # ============================================
@@ -574,13 +970,16 @@ class AsistenciaList(APIView):
                 logger.info(f"📚 Procesando curso: {course_name} (ID: {course_id})")
                 
                 # Usar función auxiliar para obtener asistencias
-                asistencias_curso = obtener_asistencias_curso(course_id, curso, course_name)
+                asistencias_curso = obtener_asistencias_curso(course_id, curso, course_name, filtros)
                 asistencias_list.extend(asistencias_curso)
             
             logger.info(f"✅ [SUCCESS] Total cursos del usuario: {len(cursos_usuario)}")
             logger.info(f"✅ [SUCCESS] Total asistencias encontradas: {len(asistencias_list)}")
             logger.info("=" * 60)
             
+            if formato != FORMATO_PLANO:
+                return Response(FORMATOS_ASISTENCIA[formato](asistencias_list), status=status.HTTP_200_OK)
+            
             return Response(asistencias_list, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -619,54 +1018,62 @@ class AsistenciaCreate(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Buscar el curso por nombre
-            courses_ref = db.collection("courses")
-            course_query = courses_ref.where(filter=firestore.FieldFilter("nameCourse", "==", asignatura)).limit(1).stream()
-            
-            course_doc = None
-            for doc in course_query:
-                course_doc = doc
-                break
-            
-            if not course_doc:
+            # Buscar el curso por nombre (nombre, horario y shards quedan en caché)
+            calendario = obtener_calendario()
+            course_id = calendario.resolver_nombre(asignatura)
+            if not course_id or calendario.cargar([course_id]):
                 return Response(
                     {"error": f"No se encontró el curso: {asignatura}"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            course_id = course_doc.id
-            fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-            hora_actual = datetime.now().strftime("%H:%M:%S")
+            ahora = datetime.now(ZONA_COLOMBIA)
+            fecha_hoy = ahora.strftime("%Y-%m-%d")
+            hora_actual = ahora.strftime("%H:%M:%S")
+            
+            # Solo estudiantes inscritos (lista del curso o grupo en caché)
+            sesion = obtener_listas().sesion(course_id, group_id, fecha_hoy)
+            if not sesion.admite(estudiante_cedula):
+                return Response(
+                    {"error": f"El estudiante {estudiante_cedula} no está inscrito en {asignatura}"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            # Tardanza contra el horario del curso
+            late = calendario.es_tarde(course_id, ahora.weekday(), ahora.hour * 60 + ahora.minute)
             
             # Datos del estudiante
             estudiante_data = {
                 'estadoAsistencia': estado_asistencia,
                 'horaRegistro': hora_actual,
-                'late': False
+                'late': late
             }
             
-            # ✅ Determinar la ruta correcta según si tiene grupos
+            # ✅ Determinar la ruta correcta según si tiene grupos (y el shard si el curso los usa)
+            assistance_ref = referencia_asistencia(
+                course_id, group_id, fecha_hoy, estudiante_cedula, calendario.shards(course_id)
+            )
             if group_id:
-                # Ruta con grupos
-                assistance_ref = (db.collection("courses")
-                                 .document(course_id)
-                                 .collection("groups")
-                                 .document(group_id)
-                                 .collection("assistances")
-                                 .document(fecha_hoy))
                 logger.info(f"📁 Guardando en curso con grupos: {course_id}/groups/{group_id}")
             else:
-                # Ruta simple
-                assistance_ref = (db.collection("courses")
-                                 .document(course_id)
-                                 .collection("assistances")
-                                 .document(fecha_hoy))
                 logger.info(f"📚 Guardando en curso sin grupos: {course_id}")
             
-            # Actualizar o crear el documento
-            assistance_ref.set({
-                estudiante_cedula: estudiante_data
-            }, merge=True)
+            # Entrada del historial del estudiante, en el mismo commit que la sesión
+            historial = escrituras_historial(
+                course_id, group_id, fecha_hoy, {estudiante_cedula: estudiante_data}, asignatura
+            )
+            
+            if settings.WRITE_BEHIND_ACTIVO:
+                # Queda en el log local y el drenador la envía a Firestore
+                obtener_cola().encolar(assistance_ref, {estudiante_cedula: estudiante_data}, historial)
+                respuesta_status = status.HTTP_202_ACCEPTED
+            else:
+                # Actualizar o crear el documento; los registros simultáneos del mismo
+                # día se agrupan en una sola escritura
+                obtener_coalescedor().fusionar(assistance_ref, {
+                    estudiante_cedula: estudiante_data
+                }, historial)
+                respuesta_status = status.HTTP_201_CREATED
             
             logger.info(f"✅ Asistencia creada: {estudiante_cedula} en {asignatura}")
             
@@ -680,10 +1087,11 @@ class AsistenciaCreate(APIView):
                     "asignatura": asignatura,
                     "fechaYhora": fecha_hoy,
                     "horaRegistro": hora_actual,
-                    "late": False,
-                    "groupId": group_id if group_id else None
+                    "late": late,
+                    "groupId": group_id if group_id else None,
+                    "pendiente": respuesta_status == status.HTTP_202_ACCEPTED
                 },
-                status=status.HTTP_201_CREATED
+                status=respuesta_status
             )
                 
         except Exception as e:
@@ -691,6 +1099,164 @@ class AsistenciaCreate(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class AsistenciaLoteView(APIView):
+    """
+    POST /api/asistencias/lote/
+    Ingesta por lotes de eventos de los dispositivos de reconocimiento.
+    
+    Body: {"eventos": [{idempotencyKey, estudiante, courseId | asignatura,
+                        groupId?, estadoAsistencia?, timestamp?}, ...]}
+    Un evento repetido (misma idempotencyKey) devuelve el resultado original sin escribir.
+    """
+    def post(self, request):
+        # Obtener UID sin verificar token
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        eventos = request.data.get('eventos') if isinstance(request.data, dict) else request.data
+        if not isinstance(eventos, list) or not eventos:
+            return Response(
+                {"error": "Se requiere una lista 'eventos' no vacía"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        maximo = settings.ASISTENCIA_LOTE_MAX
+        if len(eventos) > maximo:
+            return Response(
+                {"error": f"Máximo {maximo} eventos por lote", "recibidos": len(eventos)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            logger.info(f"📥 [POST] /api/asistencias/lote/ - {len(eventos)} eventos")
+            
+            resultado = ingerir_eventos(eventos, user_uid)
+            
+            return Response(resultado, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsistenciaColaView(APIView):
+    """
+    GET /api/asistencias/cola/
+    Estado de la cola write-behind del worker que responde: registros y bytes
+    pendientes, tasa de drenado y último error.
+    """
+    def get(self, request):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        try:
+            return Response(obtener_cola().estado(), status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsistenciaCerrarSesionView(APIView):
+    """
+    POST /api/asistencias/cerrar-sesion/
+    Cierra la sesión del día: los inscritos sin registro quedan como 'Ausente'.
+    Solo el profesor del curso o del grupo; groupId es obligatorio si el curso
+    tiene grupos.
+    
+    Body: {courseId | asignatura, groupId?, fecha? (YYYY-MM-DD, por defecto hoy)}
+    """
+    def post(self, request):
+        # Obtener UID sin verificar token
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        course_id = request.data.get('courseId')
+        asignatura = request.data.get('asignatura')
+        group_id = request.data.get('groupId') or None
+        ahora = datetime.now(ZONA_COLOMBIA)
+        fecha = request.data.get('fecha') or ahora.strftime("%Y-%m-%d")
+        
+        if not course_id and not asignatura:
+            return Response(
+                {"error": "Falta courseId o asignatura"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            datetime.strptime(fecha, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return Response(
+                {"error": f"Fecha inválida: {fecha} (formato YYYY-MM-DD)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            logger.info(f"🔒 [POST] /api/asistencias/cerrar-sesion/ - {course_id or asignatura} {fecha}")
+            
+            calendario = obtener_calendario()
+            course_id = course_id or calendario.resolver_nombre(asignatura)
+            if not course_id or calendario.cargar([course_id]):
+                return Response(
+                    {"error": f"No se encontró el curso: {course_id or asignatura}"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            # El cierre escribe registros de otros usuarios: solo el profesor del
+            # curso o del grupo, y siempre sobre un grupo que exista
+            curso_ref = db.collection("courses").document(course_id)
+            curso_doc = curso_ref.get()
+            if not curso_doc.exists:
+                return Response(
+                    {"error": f"No se encontró el curso: {course_id}"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            curso_data = curso_doc.to_dict()
+            profesores = {curso_data.get('profesorID')}
+            if group_id:
+                grupo_doc = curso_ref.collection("groups").document(group_id).get()
+                if not grupo_doc.exists:
+                    return Response(
+                        {"error": f"No se encontró el grupo {group_id} en el curso {course_id}"},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+                profesores.add(grupo_doc.to_dict().get('profesorID'))
+            elif list(curso_ref.collection("groups").limit(1).stream()):
+                return Response(
+                    {"error": "El curso tiene grupos: falta groupId"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if user_uid not in profesores:
+                return Response(
+                    {"error": "Solo el profesor del curso o del grupo puede cerrar la sesión"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            sesion = obtener_listas().sesion(course_id, group_id, fecha, curso_data)
+            if not sesion.inscritos:
+                return Response(
+                    {"error": "El curso no tiene estudiantes inscritos (estudianteID)"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            resumen = cerrar_sesion(
+                sesion, calendario.shards(course_id), calendario.nombre(course_id), ahora.strftime("%H:%M:%S")
+            )
+            logger.info(f"✅ Sesión cerrada: {len(resumen['ausentes'])} ausentes de {resumen['inscritos']} inscritos")
+            
+            return Response({
+                "courseId": course_id,
+                "groupId": group_id,
+                "fecha": fecha,
+                **resumen,
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class AsistenciaRetrieve(APIView):
     """
     GET /api/asistencias/<id>/
@@ -703,47 +1269,32 @@ class AsistenciaRetrieve(APIView):
             return error
 
         try:
-            parts = pk.split('_')
-            
-            # Determinar si tiene grupos según el número de partes
-            if len(parts) == 4:
-                course_id, group_id, fecha_id, cedula = parts
-                has_groups = True
-            elif len(parts) == 3:
-                course_id, fecha_id, cedula = parts
-                group_id = None
-                has_groups = False
-            else:
+            partes = parsear_id_asistencia(pk)
+            if partes is None:
                 return Response(
                     {"error": "ID de asistencia inválido"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            course_id, group_id, fecha_id, cedula = partes
+            has_groups = group_id is not None
             
-            # Obtener documento según la estructura
-            if has_groups:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("groups")
-                                .document(group_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            else:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            
-            assistance_doc = assistance_ref.get()
+            # Busca en el documento de la fecha y en sus shards
+            existe_sesion, assistance_ref, estudiante_data = localizar_asistencia(
+                course_id, group_id, fecha_id, cedula
+            )
+            archivada = assistance_ref is None
+            if archivada:
+                # Periodo archivado: el original ya solo está en assistancesArchive
+                en_archivo, estudiante_data = asistencia_archivada(course_id, group_id, fecha_id, cedula)
+                existe_sesion = existe_sesion or en_archivo
             
-            if not assistance_doc.exists:
+            if not existe_sesion:
                 return Response(
                     {"error": "Asistencia no encontrada"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            assistance_data = assistance_doc.to_dict()
-            
-            if cedula not in assistance_data:
+            if estudiante_data is None:
                 return Response(
                     {"error": "Estudiante no encontrado en esta asistencia"},
                     status=status.HTTP_404_NOT_FOUND
@@ -753,8 +1304,6 @@ class AsistenciaRetrieve(APIView):
             course_doc = db.collection("courses").document(course_id).get()
             course_name = course_doc.to_dict().get('nameCourse', 'Sin nombre') if course_doc.exists else 'Sin nombre'
             
-            estudiante_data = assistance_data[cedula]
-            
             # ✅ OBTENER NOMBRE DEL ESTUDIANTE DESDE LA CÉDULA
             nombre_estudiante = buscar_nombre_estudiante(cedula)
             
@@ -770,7 +1319,8 @@ class AsistenciaRetrieve(APIView):
                 'courseId': course_id,
                 'groupId': group_id if has_groups else None,
                 'fechaDocId': fecha_id,
-                'hasGroups': has_groups
+                'hasGroups': has_groups,
+                'archivada': archivada
             }
             
             return Response(data, status=status.HTTP_200_OK)
@@ -791,63 +1341,49 @@ class AsistenciaUpdate(APIView):
             return error
 
         try:
-            parts = pk.split('_')
-            
-            if len(parts) == 4:
-                course_id, group_id, fecha_id, cedula = parts
-                has_groups = True
-            elif len(parts) == 3:
-                course_id, fecha_id, cedula = parts
-                group_id = None
-                has_groups = False
-            else:
+            partes = parsear_id_asistencia(pk)
+            if partes is None:
                 return Response(
                     {"error": "ID de asistencia inválido"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            course_id, group_id, fecha_id, cedula = partes
+            has_groups = group_id is not None
             
-            if has_groups:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("groups")
-                                .document(group_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            else:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            
-            assistance_doc = assistance_ref.get()
+            # Busca en el documento de la fecha y en sus shards
+            existe_sesion, assistance_ref, estudiante_data = localizar_asistencia(
+                course_id, group_id, fecha_id, cedula
+            )
+            if assistance_ref is None and asistencia_archivada(course_id, group_id, fecha_id, cedula)[1]:
+                return respuesta_periodo_archivado()
             
-            if not assistance_doc.exists:
+            if not existe_sesion:
                 return Response(
                     {"error": "Asistencia no encontrada"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            assistance_data = assistance_doc.to_dict()
-            
-            if cedula not in assistance_data:
+            if assistance_ref is None:
                 return Response(
                     {"error": "Estudiante no encontrado"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            estudiante_data = assistance_data[cedula]
-            
             # ✅ SOLO ACTUALIZAR EL ESTADO DE ASISTENCIA
             if 'estadoAsistencia' in request.data:
                 estudiante_data['estadoAsistencia'] = request.data['estadoAsistencia']
             
-            assistance_ref.update({
-                cedula: estudiante_data
-            })
-            
             course_doc = db.collection("courses").document(course_id).get()
             course_name = course_doc.to_dict().get('nameCourse', 'Sin nombre') if course_doc.exists else 'Sin nombre'
             
+            # Sesión e historial del estudiante en un solo commit
+            batch = db.batch()
+            batch.update(assistance_ref, {
+                cedula: estudiante_data
+            })
+            registrar_historial(batch, cedula, course_id, group_id, fecha_id, estudiante_data, course_name)
+            batch.commit()
+            
             # ✅ OBTENER NOMBRE DEL ESTUDIANTE
             nombre_estudiante = buscar_nombre_estudiante(cedula)
             
@@ -883,53 +1419,40 @@ class AsistenciaDelete(APIView):
             return error
 
         try:
-            parts = pk.split('_')
-            
-            if len(parts) == 4:
-                course_id, group_id, fecha_id, cedula = parts
-                has_groups = True
-            elif len(parts) == 3:
-                course_id, fecha_id, cedula = parts
-                group_id = None
-                has_groups = False
-            else:
+            partes = parsear_id_asistencia(pk)
+            if partes is None:
                 return Response(
                     {"error": "ID de asistencia inválido"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            course_id, group_id, fecha_id, cedula = partes
             
-            if has_groups:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("groups")
-                                .document(group_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            else:
-                assistance_ref = (db.collection("courses")
-                                .document(course_id)
-                                .collection("assistances")
-                                .document(fecha_id))
-            
-            assistance_doc = assistance_ref.get()
+            # Busca en el documento de la fecha y en sus shards; tras una
+            # migración a medias la entrada puede estar en ambos y hay que
+            # borrar las dos (si no, la de la base vuelve a aparecer)
+            existe_sesion, copias = copias_asistencia(course_id, group_id, fecha_id, cedula)
+            if not copias and asistencia_archivada(course_id, group_id, fecha_id, cedula)[1]:
+                return respuesta_periodo_archivado()
             
-            if not assistance_doc.exists:
+            if not existe_sesion:
                 return Response(
                     {"error": "Asistencia no encontrada"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            assistance_data = assistance_doc.to_dict()
-            
-            if cedula not in assistance_data:
+            if not copias:
                 return Response(
                     {"error": "Estudiante no encontrado"},
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            assistance_ref.update({
-                cedula: firestore.DELETE_FIELD
-            })
+            batch = db.batch()
+            for assistance_ref, _ in copias:
+                batch.update(assistance_ref, {
+                    cedula: firestore.DELETE_FIELD
+                })
+            borrar_historial(batch, cedula, course_id, group_id, fecha_id)
+            batch.commit()
             
             logger.info(f"✅ Asistencia eliminada: {pk}")
             
@@ -943,14 +1466,199 @@ class AsistenciaDelete(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# ============================================
+# BOOTSTRAP DEL FRONTEND
+# ============================================
+
+class BootstrapView(APIView):
+    """
+    GET /api/bootstrap/
+    Todo lo que el frontend pide al arrancar, en una respuesta: usuario,
+    cursos con su horario (como /api/horarios/), asistencias de hoy (como
+    /api/asistencias/?desde=hoy&hasta=hoy) y los nombres de los estudiantes
+    que aparecen en ellas.
+    
+    La persona y los cursos se resuelven una sola vez; las asistencias de
+    cada curso se leen en paralelo y los nombres en un solo get_all.
+    """
+    
+    def get(self, request):
+        # Obtener UID sin verificar token
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        try:
+            logger.info("=" * 60)
+            logger.info("🚀 [GET] /api/bootstrap/")
+            
+            person_data = buscar_persona_por_uid(user_uid)
+            if not person_data:
+                return Response({
+                    "error": f"No se encontró usuario en 'person' con UID: {user_uid}",
+                    "message": "Usuario no registrado en el sistema"
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            user_type = person_data.get('type', '')
+            if user_type not in ('Profesor', 'Estudiante'):
+                logger.warning(f"⚠️ Tipo de usuario no reconocido: {user_type}")
+                return Response(
+                    {"error": f"Tipo de usuario no válido: {user_type}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            cursos = resolver_cursos_usuario(person_data, user_uid, user_type)
+            
+            # Asistencias de hoy: una tarea por curso, en paralelo
+            fecha_hoy, _ = obtener_fecha_colombia()
+            filtros = {'desde': fecha_hoy, 'hasta': fecha_hoy}
+            por_curso = en_paralelo([
+                (obtener_asistencias_curso, curso['id'], curso, curso.get('nameCourse', 'Sin nombre'), filtros)
+                for curso in cursos
+            ])
+            asistencias = [asistencia for lista in por_curso for asistencia in lista]
+            
+            nombres = buscar_nombres_estudiantes(asistencia['estudiante'] for asistencia in asistencias)
+            
+            logger.info(
+                f"✅ Bootstrap: {len(cursos)} cursos, {len(asistencias)} asistencias hoy, {len(nombres)} nombres"
+            )
+            logger.info("=" * 60)
+            
+            return Response({
+                "usuario": {
+                    "uid": user_uid,
+                    "cedula": person_data.get('id'),
+                    "nombre": person_data.get('namePerson', request.user_firebase.get('name', '')),
+                    "email": request.user_firebase.get('email'),
+                    "userType": user_type,
+                },
+                "clases": cursos,
+                "fecha": fecha_hoy,
+                "asistencias": asistencias,
+                "nombres": nombres,
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error en bootstrap: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return Response(
+                {"error": "Error al cargar los datos iniciales", "detail": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class BatchView(APIView):
+    """
+    POST /api/batch/
+    Varias peticiones a la API en una sola: cada sub-petición se despacha
+    dentro del proceso con la identidad de esta petición (ver batch.py).
+    
+    Body: {"peticiones": [{method, path, body?, headers?}, ...]}
+    Respuesta: [{status, body, headers?}, ...] en el mismo orden
+    """
+    
+    def post(self, request):
+        # Obtener UID sin verificar token
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        peticiones = request.data.get('peticiones') if isinstance(request.data, dict) else request.data
+        if not isinstance(peticiones, list) or not peticiones:
+            return Response(
+                {"error": "Se requiere una lista 'peticiones' no vacía"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        maximo = settings.BATCH_MAX_SUBPETICIONES
+        if len(peticiones) > maximo:
+            return Response(
+                {"error": f"Máximo {maximo} sub-peticiones por lote", "recibidas": len(peticiones)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            logger.info(f"📦 [POST] /api/batch/ - {len(peticiones)} sub-peticiones")
+            return Response(ejecutar_lote(request._request, peticiones), status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# ============================================
+# MODO DEGRADADO (SNAPSHOT LOCAL)
+# ============================================
+def respuesta_plazo_agotado(error):
+    """504 cuando la petición agotó su plazo (Firestore no se da por caído)"""
+    logger.warning(f"⏱️ {str(error)}")
+    return Response({"error": str(error)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+
+
+def sin_snapshot():
+    return Response(
+        {"error": "Firestore no disponible y no hay snapshot local"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+def horario_desde_snapshot(request, user_uid, campos):
+    """Respuesta de GET /api/horarios/ con los datos del snapshot (sin ETag)"""
+    snapshot = obtener_snapshot()
+    if snapshot is None:
+        return sin_snapshot()
+    
+    logger.warning(f"📸 Horario de {user_uid} servido desde el snapshot ({int(snapshot.edad())} s)")
+    person_data = snapshot.persona(user_uid)
+    if not person_data:
+        response = Response({
+            "error": f"No se encontró usuario en 'person' con UID: {user_uid}",
+            "clases": [],
+            "message": "Usuario no registrado en el sistema"
+        }, status=status.HTTP_404_NOT_FOUND)
+        return marcar_desactualizada(response, snapshot)
+    
+    user_type = person_data.get('type', '')
+    if user_type not in ('Profesor', 'Estudiante'):
+        return Response({
+            "error": f"Tipo de usuario no válido: {user_type}",
+            "clases": []
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = Response({
+        "profesorEmail": request.user_firebase.get('email'),
+        "profesorNombre": person_data.get('namePerson', request.user_firebase.get('name', '')),
+        "clases": snapshot.cursos_usuario(user_uid, person_data, campos),
+        "userType": user_type
+    }, status=status.HTTP_200_OK)
+    return marcar_desactualizada(response, snapshot)
+
+
+def curso_desde_snapshot(course_id, campos):
+    """Respuesta de GET /api/horarios/cursos/<id>/ con los datos del snapshot (sin ETag)"""
+    snapshot = obtener_snapshot()
+    if snapshot is None:
+        return sin_snapshot()
+    
+    curso_data = snapshot.curso(course_id, campos)
+    if curso_data is None:
+        response = Response({"error": "Curso no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+    else:
+        response = Response(curso_data, status=status.HTTP_200_OK)
+    return marcar_desactualizada(response, snapshot)
+
+
 # ============================================
 # HORARIOS - MODIFICADO PARA USAR UID SIN TOKEN
 # ============================================
 
 class HorarioProfesorView(APIView):
     """
-    GET /api/horarios/
-    Obtiene todos los cursos del profesor o estudiante autenticado
+    GET /api/horarios/?fields=nameCourse,group,schedule
+    Obtiene todos los cursos del profesor o estudiante autenticado; con
+    fields solo se leen (y devuelven) esos campos de cada curso
     """
     
     def get(self, request):
@@ -959,6 +1667,15 @@ class HorarioProfesorView(APIView):
         if error:
             return error
 
+        try:
+            campos = leer_campos(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        estado = obtener_estado_firestore()
+        if estado.degradado():
+            return horario_desde_snapshot(request, user_uid, campos)
+
         try:
             logger.info("=" * 60)
             logger.info("📅 [GET] /api/horarios/ - Obtener horario del usuario")
@@ -983,29 +1700,49 @@ class HorarioProfesorView(APIView):
             # ============================================
             # OBTENER CURSOS SEGÚN EL TIPO DE USUARIO
             # ============================================
-            if user_type == 'Profesor':
-                logger.info(f"👨‍🏫 Obteniendo cursos del profesor {user_name}")
-                cursos = obtener_cursos_profesor(person_data, user_uid)
-            elif user_type == 'Estudiante':
-                logger.info(f"👨‍🎓 Obteniendo cursos del estudiante {user_name}")
-                cursos = obtener_cursos_estudiante(person_data, user_uid)
-            else:
+            if user_type not in ('Profesor', 'Estudiante'):
                 logger.warning(f"⚠️ Tipo de usuario no reconocido: {user_type}")
                 return Response({
                     "error": f"Tipo de usuario no válido: {user_type}",
                     "clases": []
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            logger.info(f"📚 Obteniendo cursos de {user_name} ({user_type})")
+            versiones = {}
+            cursos = resolver_cursos_usuario(person_data, user_uid, user_type, versiones, campos)
+            
             logger.info(f"✅ Total cursos del usuario: {len(cursos)}")
             logger.info("=" * 60)
             
-            return Response({
+            # ✅ GET condicional: el ETag cambia con cualquier escritura sobre los cursos
+            etag, last_modified = calcular_validadores(
+                versiones,
+                user_uid,
+                user_type,
+                person_data.get('namePerson', ''),
+                request.user_firebase.get('email'),
+                request.user_firebase.get('name', ''),
+                request.accepted_media_type,
+                ','.join(campos) if campos is not None else '*'
+            )
+            no_modificado = respuesta_no_modificada(request, etag, last_modified)
+            if no_modificado:
+                logger.info("♻️ Horario sin cambios (304)")
+                return no_modificado
+            
+            response = Response({
                 "profesorEmail": request.user_firebase.get('email'),
                 "profesorNombre": person_data.get('namePerson', request.user_firebase.get('name', '')),
                 "clases": cursos,
                 "userType": user_type
             }, status=status.HTTP_200_OK)
+            return aplicar_validadores(response, etag, last_modified)
             
+        except PlazoAgotado as e:
+            return respuesta_plazo_agotado(e)
+        except ERRORES_CONEXION as e:
+            estado.registrar_fallo(e)
+            return horario_desde_snapshot(request, user_uid, campos)
         except Exception as e:
             logger.error(f"❌ Error al obtener horario: {str(e)}")
             import traceback
@@ -1034,38 +1771,79 @@ class HorarioProfesorView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            cursos_guardados = []
-            
-            for clase in clases:
+            # ============================================
+            # 1. VALIDAR TODO EL PAYLOAD ANTES DE ESCRIBIR
+            # ============================================
+            validados = []
+            for idx, clase in enumerate(clases):
                 serializer = CourseSerializer(data=clase)
-                if serializer.is_valid():
-                    curso_data = serializer.validated_data
-                    curso_data['profesorID'] = user_uid
-                    
-                    if 'id' in clase and clase['id']:
-                        doc_ref = db.collection("courses").document(clase['id'])
-                        doc_ref.update(curso_data)
-                        curso_data['id'] = clase['id']
-                        logger.info(f"✏️ Curso actualizado: {clase['id']}")
-                    else:
-                        doc_ref = db.collection("courses").add(curso_data)
-                        curso_data['id'] = doc_ref[1].id
-                        logger.info(f"✅ Curso creado: {curso_data['id']}")
-                    
-                    cursos_guardados.append(curso_data)
-                else:
-                    logger.warning(f"⚠️ Datos inválidos: {serializer.errors}")
+                if not serializer.is_valid():
+                    logger.warning(f"⚠️ Datos inválidos en clase {idx}: {serializer.errors}")
                     return Response(
-                        {"error": "Datos inválidos", "details": serializer.errors},
+                        {"error": "Datos inválidos", "details": serializer.errors, "index": idx},
                         status=status.HTTP_400_BAD_REQUEST
                     )
+                curso_data = serializer.validated_data
+                curso_data['profesorID'] = user_uid
+                validados.append((clase.get('id') if isinstance(clase, dict) else None, curso_data))
+            
+            # Cursos existentes: un solo get_all (también da los datos previos para la membresía)
+            ids_existentes = list(dict.fromkeys(course_id for course_id, _ in validados if course_id))
+            anteriores = {}
+            if ids_existentes:
+                refs = [db.collection("courses").document(course_id) for course_id in ids_existentes]
+                anteriores = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+            
+            faltantes = [course_id for course_id in ids_existentes if course_id not in anteriores]
+            if faltantes:
+                return Response(
+                    {"error": "Curso no encontrado", "courseIds": faltantes},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            # ============================================
+            # 2. UN SOLO COMMIT CON TODAS LAS ESCRITURAS
+            # ============================================
+            lote = LoteEscrituras()
+            cursos_guardados = []
+            
+            for course_id, curso_data in validados:
+                if course_id:
+                    doc_ref = db.collection("courses").document(course_id)
+                    lote.update(doc_ref, curso_data)
+                    datos_previos = anteriores[course_id]
+                    logger.info(f"✏️ Curso a actualizar: {course_id}")
+                else:
+                    # ID generado en el cliente: se conoce antes del commit
+                    doc_ref = db.collection("courses").document()
+                    lote.create(doc_ref, curso_data)
+                    datos_previos = None
+                    logger.info(f"✅ Curso a crear: {doc_ref.id}")
+                
+                sincronizar_membresia_curso(doc_ref.id, datos_previos, curso_data, batch=lote)
+                # Si el mismo curso se repite en el payload, el siguiente parte de estos datos
+                if course_id:
+                    anteriores[course_id] = {**datos_previos, **curso_data}
+                
+                curso_data['id'] = doc_ref.id
+                cursos_guardados.append(curso_data)
+            
+            lote.commit()
+            logger.info(f"💾 {lote.operaciones} escrituras en {lote.commits} commit(s)")
+            
+            indice_aulas = obtener_indice_aulas()
+            listas = obtener_listas()
+            for curso in cursos_guardados:
+                indice_aulas.actualizar_curso(curso['id'], curso)
+                listas.quitar_curso(curso['id'])
             
             logger.info(f"✅ Horario guardado: {len(cursos_guardados)} cursos")
             logger.info("=" * 60)
             
             return Response({
                 "profesorEmail": request.user_firebase.get('email'),
-                "clases": cursos_guardados
+                "clases": cursos_guardados,
+                "ids": [curso['id'] for curso in cursos_guardados]
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
@@ -1086,22 +1864,18 @@ class HorarioProfesorView(APIView):
             logger.info("🗑️ [DELETE] /api/horarios/ - Eliminar horario completo")
             
             courses_ref = db.collection("courses")
-            query = courses_ref.where(filter=firestore.FieldFilter('profesorID', '==', user_uid))
-            docs = query.stream()
+            query = (courses_ref
+                     .where(filter=firestore.FieldFilter('profesorID', '==', user_uid))
+                     .select([FieldPath.document_id()]))
+            course_ids = [doc.id for doc in query.stream()]
             
-            deleted_count = 0
-            for doc in docs:
-                doc.reference.delete()
-                deleted_count += 1
-                logger.info(f"   🗑️ Curso eliminado: {doc.id}")
+            logger.info(f"🗑️ {len(course_ids)} cursos a eliminar (con subcolecciones)")
             
-            logger.info(f"✅ Eliminados {deleted_count} cursos")
-            
-            return Response({
-                "success": True,
-                "message": f"Horario eliminado ({deleted_count} cursos)",
-                "deletedCount": deleted_count
-            }, status=status.HTTP_200_OK)
+            return responder_borrado(
+                request,
+                course_ids,
+                f"Horario eliminado ({len(course_ids)} cursos)"
+            )
             
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
@@ -1110,8 +1884,8 @@ class HorarioProfesorView(APIView):
 
 class HorarioCursoView(APIView):
     """
-    GET /api/horarios/cursos/<course_id>/
-    Obtiene los detalles de un curso específico
+    GET /api/horarios/cursos/<course_id>/?fields=nameCourse,schedule
+    Obtiene los detalles de un curso específico (solo los campos pedidos)
     
     PUT /api/horarios/cursos/<course_id>/
     Actualiza el horario (schedule) de un curso específico
@@ -1123,10 +1897,19 @@ class HorarioCursoView(APIView):
         if error:
             return error
 
+        try:
+            campos = leer_campos(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        estado = obtener_estado_firestore()
+        if estado.degradado():
+            return curso_desde_snapshot(course_id, campos)
+
         try:
             logger.info(f"📖 [GET] /api/horarios/cursos/{course_id}/")
             
-            doc = db.collection("courses").document(course_id).get()
+            doc = leer_documento(db.collection("courses").document(course_id), campos)
             
             if not doc.exists:
                 return Response(
@@ -1134,11 +1917,25 @@ class HorarioCursoView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            curso_data = doc.to_dict()
+            etag, last_modified = calcular_validadores(
+                {doc.id: doc.update_time}, request.accepted_media_type,
+                ','.join(campos) if campos is not None else '*'
+            )
+            no_modificado = respuesta_no_modificada(request, etag, last_modified)
+            if no_modificado:
+                return no_modificado
+            
+            curso_data = doc.to_dict() or {}
             curso_data['id'] = doc.id
             
-            return Response(curso_data, status=status.HTTP_200_OK)
+            response = Response(curso_data, status=status.HTTP_200_OK)
+            return aplicar_validadores(response, etag, last_modified)
             
+        except PlazoAgotado as e:
+            return respuesta_plazo_agotado(e)
+        except ERRORES_CONEXION as e:
+            estado.registrar_fallo(e)
+            return curso_desde_snapshot(course_id, campos)
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1172,28 +1969,54 @@ class HorarioCursoView(APIView):
             profesor_id = curso_actual.get('profesorID')
             
             schedule = serializer.validated_data['schedule']
+            # Una sola consulta para validar todas las clases
+            horario_profesor = cargar_horario_profesor(profesor_id, exclude_course_id=course_id)
             for idx, clase in enumerate(schedule):
                 hay_conflicto, mensaje = validar_conflicto_horario(
                     profesor_id,
                     clase,
                     exclude_course_id=course_id,
-                    exclude_class_index=idx
+                    exclude_class_index=idx,
+                    horario=horario_profesor
                 )
                 if hay_conflicto:
                     return Response(
                         {"error": mensaje},
                         status=status.HTTP_409_CONFLICT
                     )
+                
+                hay_conflicto, mensaje = validar_conflicto_aula(clase, exclude_course_id=course_id)
+                if hay_conflicto:
+                    return Response(
+                        {"error": mensaje, "index": idx},
+                        status=status.HTTP_409_CONFLICT
+                    )
+            
+            # Dos clases del mismo horario no pueden reservar la misma aula a la vez
+            choque = conflicto_interno_aulas(schedule)
+            if choque:
+                return Response(
+                    {"error": f"Conflicto de aula: las clases {choque[0]} y {choque[1]} reservan "
+                              f"{schedule[choque[1]]['classroom']} a la misma hora",
+                     "index": choque[1]},
+                    status=status.HTTP_409_CONFLICT
+                )
             
             doc_ref.update({"schedule": schedule})
             
             updated_doc = doc_ref.get()
             updated_data = updated_doc.to_dict()
             updated_data['id'] = course_id
+            obtener_indice_aulas().actualizar_curso(course_id, updated_data)
             
             logger.info(f"✅ Horario actualizado: {len(schedule)} clases")
             
-            return Response(updated_data, status=status.HTTP_200_OK)
+            # Devolver el nuevo validador para que el cliente no tenga que volver a pedir el curso
+            etag, last_modified = calcular_validadores(
+                {course_id: updated_doc.update_time}, request.accepted_media_type
+            )
+            response = Response(updated_data, status=status.HTTP_200_OK)
+            return aplicar_validadores(response, etag, last_modified)
             
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
@@ -1218,20 +2041,116 @@ class HorarioCursoView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            doc_ref.delete()
+            response = responder_borrado(request, [course_id], "Curso eliminado correctamente")
+            response.data["courseId"] = course_id
             logger.info(f"✅ Curso eliminado: {course_id}")
             
-            return Response({
-                "success": True,
-                "message": "Curso eliminado correctamente",
-                "courseId": course_id
-            }, status=status.HTTP_200_OK)
+            return response
             
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# ============================================
+# MUTACIONES DEL ARRAY 'schedule' (SEGURAS ANTE CONCURRENCIA)
+# ============================================
+class ErrorHorario(Exception):
+    """Error de validación detectado dentro de una mutación del horario"""
+    
+    def __init__(self, mensaje, codigo=status.HTTP_400_BAD_REQUEST):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.codigo = codigo
+
+
+CAMPOS_CLASE = ('classroom', 'day', 'iniTime', 'endTime')
+
+
+def _misma_clase(a, b):
+    return all(a.get(campo) == b.get(campo) for campo in CAMPOS_CLASE)
+
+
+def agregar_clase(doc_ref, clase):
+    """
+    Agrega una clase con ArrayUnion: el append se hace en el servidor, así que
+    dos altas concurrentes no se pisan.
+    """
+    doc_ref.update({"schedule": firestore.ArrayUnion([dict(clase)])})
+    obtener_indice_aulas().agregar_clase(doc_ref.id, clase)
+
+
+@firestore.transactional
+def _mutar_clase(transaction, doc_ref, class_index, nueva, esperada):
+    """
+    Lee y reescribe 'schedule' dentro de una transacción. Si otro cliente
+    escribe el curso entre la lectura y el commit, Firestore reintenta la función.
+    
+    Returns:
+        tuple: (clase que había en el índice antes del cambio, schedule resultante)
+    """
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise ErrorHorario("Curso no encontrado", status.HTTP_404_NOT_FOUND)
+    
+    schedule = snapshot.to_dict().get('schedule', [])
+    if class_index < 0 or class_index >= len(schedule):
+        raise ErrorHorario("Índice de clase inválido")
+    
+    # El índice pudo desplazarse por otra edición: el cliente puede enviar la clase que espera encontrar
+    if esperada is not None and not _misma_clase(schedule[class_index], esperada):
+        raise ErrorHorario(
+            "La clase cambió desde que se cargó el horario; recárguelo e intente de nuevo",
+            status.HTTP_409_CONFLICT
+        )
+    
+    anterior = schedule[class_index]
+    if nueva is None:
+        schedule.pop(class_index)
+    else:
+        schedule[class_index] = dict(nueva)
+    
+    transaction.update(doc_ref, {"schedule": schedule})
+    return anterior, schedule
+
+
+def editar_clase(doc_ref, class_index, nueva, esperada=None):
+    """Reemplaza la clase en class_index de forma transaccional"""
+    transaction = db.transaction(max_attempts=settings.HORARIO_MAX_REINTENTOS)
+    anterior, schedule = _mutar_clase(transaction, doc_ref, class_index, nueva, esperada)
+    obtener_indice_aulas().actualizar_curso(doc_ref.id, {'schedule': schedule})
+    return anterior
+
+
+def eliminar_clase(doc_ref, class_index, esperada=None):
+    """Elimina la clase en class_index de forma transaccional"""
+    transaction = db.transaction(max_attempts=settings.HORARIO_MAX_REINTENTOS)
+    anterior, schedule = _mutar_clase(transaction, doc_ref, class_index, None, esperada)
+    obtener_indice_aulas().actualizar_curso(doc_ref.id, {'schedule': schedule})
+    return anterior
+
+
+def leer_indice_clase(request):
+    """classIndex del body como int, o None si falta o no es un entero"""
+    try:
+        return int(request.data.get('classIndex'))
+    except (TypeError, ValueError):
+        return None
+
+
+def leer_clase_esperada(request):
+    """
+    expectedClass del body: None si falta, o el objeto de la clase.
+    
+    Raises:
+        ErrorHorario: Si no es un objeto (400)
+    """
+    esperada = request.data.get('expectedClass')
+    if esperada is not None and not isinstance(esperada, dict):
+        raise ErrorHorario("expectedClass debe ser un objeto con classroom, day, iniTime y endTime")
+    return esperada
+
+
 class HorarioClaseView(APIView):
     """
     POST /api/horarios/clases/
@@ -1281,22 +2200,23 @@ class HorarioClaseView(APIView):
             
             new_class = serializer.validated_data
             hay_conflicto, mensaje = validar_conflicto_horario(profesor_id, new_class)
+            if not hay_conflicto:
+                hay_conflicto, mensaje = validar_conflicto_aula(new_class)
             if hay_conflicto:
                 return Response(
                     {"error": mensaje},
                     status=status.HTTP_409_CONFLICT
                 )
             
-            schedule = curso_data.get('schedule', [])
-            schedule.append(new_class)
-            
-            doc_ref.update({"schedule": schedule})
+            agregar_clase(doc_ref, new_class)
             
             logger.info(f"✅ Clase agregada al curso {course_id}")
             
+            # Posición según la lectura previa (exacta salvo que otra alta concurra);
+            # PUT/DELETE pueden enviar expectedClass para verificarla
             return Response({
                 **new_class,
-                "index": len(schedule) - 1
+                "index": len(curso_data.get('schedule', []))
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
@@ -1314,13 +2234,14 @@ class HorarioClaseView(APIView):
             logger.info("✏️ [PUT] /api/horarios/clases/ - Actualizar clase")
             
             course_id = request.data.get('courseId')
-            class_index = request.data.get('classIndex')
+            class_index = leer_indice_clase(request)
             
             if course_id is None or class_index is None:
                 return Response(
                     {"error": "courseId y classIndex son requeridos"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            esperada = leer_clase_esperada(request)
             
             serializer = ScheduleClassSerializer(data=request.data)
             if not serializer.is_valid():
@@ -1329,31 +2250,31 @@ class HorarioClaseView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            doc_ref = db.collection("courses").document(course_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                return Response(
-                    {"error": "Curso no encontrado"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            curso_data = doc.to_dict()
-            schedule = curso_data.get('schedule', [])
-            
-            if class_index < 0 or class_index >= len(schedule):
+            hay_conflicto, mensaje = validar_conflicto_aula(
+                serializer.validated_data,
+                exclude_course_id=course_id,
+                exclude_class_index=class_index
+            )
+            if hay_conflicto:
                 return Response(
-                    {"error": "Índice de clase inválido"},
-                    status=status.HTTP_400_BAD_REQUEST
+                    {"error": mensaje},
+                    status=status.HTTP_409_CONFLICT
                 )
             
-            schedule[class_index] = serializer.validated_data
-            doc_ref.update({"schedule": schedule})
+            doc_ref = db.collection("courses").document(course_id)
+            editar_clase(
+                doc_ref,
+                class_index,
+                serializer.validated_data,
+                esperada=esperada
+            )
             
             logger.info(f"✅ Clase actualizada en curso {course_id}")
             
             return Response(serializer.validated_data, status=status.HTTP_200_OK)
             
+        except ErrorHorario as e:
+            return Response({"error": e.mensaje}, status=e.codigo)
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1369,34 +2290,21 @@ class HorarioClaseView(APIView):
             logger.info("🗑️ [DELETE] /api/horarios/clases/ - Eliminar clase")
             
             course_id = request.data.get('courseId')
-            class_index = request.data.get('classIndex')
+            class_index = leer_indice_clase(request)
             
             if course_id is None or class_index is None:
                 return Response(
                     {"error": "courseId y classIndex son requeridos"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            esperada = leer_clase_esperada(request)
             
             doc_ref = db.collection("courses").document(course_id)
-            doc = doc_ref.get()
-            
-            if not doc.exists:
-                return Response(
-                    {"error": "Curso no encontrado"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            curso_data = doc.to_dict()
-            schedule = curso_data.get('schedule', [])
-            
-            if class_index < 0 or class_index >= len(schedule):
-                return Response(
-                    {"error": "Índice de clase inválido"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            deleted_class = schedule.pop(class_index)
-            doc_ref.update({"schedule": schedule})
+            deleted_class = eliminar_clase(
+                doc_ref,
+                class_index,
+                esperada=esperada
+            )
             
             logger.info(f"✅ Clase eliminada del curso {course_id}")
             
@@ -1406,10 +2314,120 @@ class HorarioClaseView(APIView):
                 "deleted_class": deleted_class
             }, status=status.HTTP_200_OK)
             
+        except ErrorHorario as e:
+            return Response({"error": e.mensaje}, status=e.codigo)
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+# ============================================
+# OCUPACIÓN DE AULAS
+# ============================================
+def leer_dia_y_hora(request, campo_hora='time', por_defecto=None):
+    """
+    Día (?day=Lunes) y hora (?time=HH:MM) de la consulta, en minutos.
+    Si faltan se usa el momento actual en Colombia.
+    
+    Returns:
+        Tuple (int, int) - (índice del día, minuto)
+    
+    Raises:
+        ValueError: Si el día o la hora no son válidos
+    """
+    ahora = datetime.now(timezone(timedelta(hours=-5)))
+    
+    dia = request.query_params.get('day')
+    if dia is None:
+        indice_dia = ahora.weekday()
+    elif dia in INDICE_DIA:
+        indice_dia = INDICE_DIA[dia]
+    else:
+        raise ValueError(f"Día inválido. Debe ser uno de: {', '.join(DIAS)}")
+    
+    hora = request.query_params.get(campo_hora)
+    if hora is None:
+        minuto = por_defecto if por_defecto is not None else ahora.hour * 60 + ahora.minute
+    else:
+        minuto = minutos(hora)
+    
+    return indice_dia, minuto
+
+
+class AulaActualView(APIView):
+    """
+    GET /api/aulas/<aula>/actual/?day=Lunes&time=08:30
+    Clase que ocupa el aula en ese momento (por defecto, ahora)
+    """
+    
+    def get(self, request, aula):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        try:
+            dia, minuto = leer_dia_y_hora(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            logger.info(f"🏫 [GET] /api/aulas/{aula}/actual/ - {DIAS[dia]} {formato_hora(minuto)}")
+            
+            clase = obtener_indice_aulas().clase_en(aula, dia, minuto)
+            
+            return Response({
+                "classroom": aula,
+                "day": DIAS[dia],
+                "time": formato_hora(minuto),
+                "ocupada": clase is not None,
+                "clase": clase
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AulasLibresView(APIView):
+    """
+    GET /api/aulas/libres/?day=Lunes&iniTime=08:00&endTime=10:00
+    Aulas sin clases entre iniTime y endTime (por defecto, la próxima hora)
+    """
+    
+    def get(self, request):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+
+        try:
+            dia, inicio = leer_dia_y_hora(request, 'iniTime')
+            _, fin = leer_dia_y_hora(request, 'endTime', por_defecto=min(inicio + 60, 24 * 60 - 1))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if fin <= inicio:
+            return Response(
+                {"error": "La hora de fin debe ser posterior a la hora de inicio"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            logger.info(f"🏫 [GET] /api/aulas/libres/ - {DIAS[dia]} {formato_hora(inicio)}-{formato_hora(fin)}")
+            
+            libres = obtener_indice_aulas().aulas_libres(dia, inicio, fin)
+            
+            return Response({
+                "day": DIAS[dia],
+                "iniTime": formato_hora(inicio),
+                "endTime": formato_hora(fin),
+                "count": len(libres),
+                "aulas": libres
+            }, status=status.HTTP_200_OK)
+            
         except Exception as e:
             logger.error(f"❌ Error: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
 # ============================================
 # NUEVO ENDPOINT PARA BUSCAR NOMBRE DE ESTUDIANTE
 # ============================================
@@ -1442,6 +2460,173 @@ class EstudianteNombreView(APIView):
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class HistorialEstudianteView(APIView):
+    """
+    GET /api/estudiantes/<cedula>/asistencias/?limite=50&cursor=<id>&desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    Historial de asistencia de un estudiante, del más reciente al más antiguo,
+    leído del índice person/{cedula}/attendance. Solo incluye los cursos que el
+    usuario puede ver (los mismos que en /api/asistencias/).
+    """
+    
+    def get(self, request, cedula):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+        
+        try:
+            limite = int(request.query_params.get('limite', settings.HISTORIAL_PAGINA))
+        except ValueError:
+            return Response({"error": "limite debe ser un entero"}, status=status.HTTP_400_BAD_REQUEST)
+        limite = min(max(limite, 1), settings.HISTORIAL_PAGINA_MAX)
+        
+        desde = request.query_params.get('desde')
+        hasta = request.query_params.get('hasta')
+        cursor = request.query_params.get('cursor')
+        if cursor and '_' not in cursor:
+            return Response({"error": "cursor inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        # El cursor es un ID de la página anterior y termina en su fecha
+        for valor in (desde, hasta, cursor and cursor.rsplit('_', 1)[-1]):
+            if valor:
+                try:
+                    datetime.strptime(valor, "%Y-%m-%d")
+                except ValueError:
+                    return Response(
+                        {"error": f"Fecha inválida: {valor} (formato YYYY-MM-DD)"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        
+        try:
+            logger.info(f"🔍 [GET] /api/estudiantes/{cedula}/asistencias/")
+            
+            person_data = buscar_persona_por_uid(user_uid)
+            user_type = (person_data or {}).get('type', '')
+            if user_type not in ('Profesor', 'Estudiante'):
+                return Response(
+                    {"error": "Usuario no registrado en el sistema"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            visibles = {
+                curso['id'] for curso in resolver_cursos_usuario(
+                    person_data, user_uid, user_type, campos=['nameCourse']
+                )
+            }
+            
+            # Se leen páginas hasta completar el límite con entradas visibles
+            pagina, siguiente = [], cursor
+            while visibles and len(pagina) < limite:
+                leidas, siguiente = pagina_historial(cedula, limite - len(pagina), siguiente, desde, hasta)
+                pagina += [(doc_id, entrada) for doc_id, entrada in leidas if entrada.get('courseId') in visibles]
+                if siguiente is None:
+                    break
+            if not visibles:
+                siguiente = None
+            
+            asistencias = [
+                {
+                    'id': f"{doc_id}_{cedula}",
+                    'estudiante': str(cedula),
+                    'asignatura': entrada.get('asignatura', ''),
+                    'fechaYhora': entrada.get('fecha'),
+                    'estadoAsistencia': entrada.get('estadoAsistencia', 'Presente'),
+                    'horaRegistro': entrada.get('horaRegistro', ''),
+                    'late': entrada.get('late', False),
+                    'courseId': entrada.get('courseId'),
+                    'groupId': entrada.get('groupId'),
+                }
+                for doc_id, entrada in pagina
+            ]
+            
+            return Response({
+                "cedula": cedula,
+                "asistencias": asistencias,
+                "siguiente": siguiente
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+# ============================================
+# TRABAJOS EN SEGUNDO PLANO
+# ============================================
+
+class TrabajoView(APIView):
+    """
+    GET /api/jobs/<job_id>/
+    Estado y progreso de un trabajo en segundo plano
+    
+    DELETE /api/jobs/<job_id>/
+    Solicita la cancelación del trabajo
+    """
+    
+    def _trabajo_del_usuario(self, request, job_id):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return None, error
+        
+        trabajo = obtener_trabajo(job_id)
+        
+        # Un trabajo de otro usuario se trata como inexistente
+        if not trabajo or trabajo.get('uid') != user_uid:
+            return None, Response(
+                {"error": "Trabajo no encontrado"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return trabajo, None
+    
+    def get(self, request, job_id):
+        try:
+            trabajo, error = self._trabajo_del_usuario(request, job_id)
+            if error:
+                return error
+            
+            return Response(trabajo, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def delete(self, request, job_id):
+        try:
+            trabajo, error = self._trabajo_del_usuario(request, job_id)
+            if error:
+                return error
+            
+            if not cancelar_trabajo(job_id):
+                return Response(
+                    {"error": f"El trabajo ya terminó ({trabajo['estado']})"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            logger.info(f"🚫 Cancelación solicitada para trabajo {job_id}")
+            return Response(obtener_trabajo(job_id), status=status.HTTP_202_ACCEPTED)
+            
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# ============================================
+# MÉTRICAS
+# ============================================
+class MetricasView(APIView):
+    """
+    GET /api/metricas/ - Contadores e histogramas del worker que responde,
+    con el resumen de lecturas cubiertas (tasa y p99 ahorrado por método)
+    """
+    
+    def get(self, request):
+        user_uid, error = obtener_uid_usuario(request)
+        if error:
+            return error
+        
+        return Response({
+            **metrics.instantanea(),
+            "cobertura": deadlines.resumen()
+        }, status=status.HTTP_200_OK)
+
+
 # ============================================
 # HEALTH CHECK
 # ============================================
@@ -1451,21 +2636,38 @@ class HealthCheck(APIView):
     def get(self, request):
         logger.info("💚 [HEALTH CHECK] Servidor funcionando")
         
+        # El resultado decide si horarios y cursos se sirven desde el snapshot
+        estado = obtener_estado_firestore()
         try:
             docs_count = len(list(db.collection("courses").limit(1).stream()))
             firebase_status = "✅ Conectado"
+            estado.registrar_exito()
         except Exception as e:
             firebase_status = f"❌ Error: {str(e)}"
+            estado.registrar_fallo(e)
+        
+        snapshot = obtener_snapshot()
         
         return Response({
             "status": "OK",
             "timestamp": datetime.now().isoformat(),
             "firebase": firebase_status,
+            "snapshot": {
+                "generado": snapshot.generado_iso(),
+                "edad": int(snapshot.edad()),
+                "degradado": estado.degradado()
+            } if snapshot is not None else None,
             "authentication": "UID-based (no token verification)",
             "endpoints": {
+                "bootstrap": "GET /api/bootstrap/",
+                "batch": "POST /api/batch/",
                 "asistencias": {
                     "list": "GET /api/asistencias/",
                     "create": "POST /api/asistencias/crear/",
+                    "batch": "POST /api/asistencias/lote/",
+                    "cola": "GET /api/asistencias/cola/",
+                    "cerrar_sesion": "POST /api/asistencias/cerrar-sesion/",
+                    "historial": "GET /api/estudiantes/<cedula>/asistencias/",
                     "detail": "GET /api/asistencias/<id>/",
                     "update": "PUT /api/asistencias/<id>/update/",
                     "delete": "DELETE /api/asistencias/<id>/delete/"
@@ -1480,8 +2682,17 @@ class HealthCheck(APIView):
                     "update_clase": "/api/horarios/clases/ (PUT)",
                     "delete_clase": "/api/horarios/clases/ (DELETE)"
                 },
+                "aulas": {
+                    "actual": "GET /api/aulas/<aula>/actual/?day=&time=",
+                    "libres": "GET /api/aulas/libres/?day=&iniTime=&endTime="
+                },
                 "estudiantes": {  # ✅ NUEVO
                     "get_nombre": "GET /api/estudiantes/nombre/<cedula>/"
+                },
+                "metricas": "GET /api/metricas/",
+                "jobs": {
+                    "detail": "GET /api/jobs/<job_id>/",
+                    "cancel": "DELETE /api/jobs/<job_id>/"
                 }
             }
         }, status=status.HTTP_200_OK)
\ No newline at end of file
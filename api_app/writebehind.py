@@ -0,0 +1,383 @@
+# api_app/writebehind.py
+"""
+Cola local de escrituras de asistencia (write-behind).
+
+Con WRITE_BEHIND_ACTIVO, AsistenciaCreate no espera a Firestore: agrega el
+registro a un log local (append-only, fsync por registro) y responde de
+inmediato. Un hilo drenador lo reenvía a Firestore por lotes, con backoff
+exponencial si Firestore falla o está lento.
+
+Estructura en disco (WRITE_BEHIND_DIR):
+
+    {pid}/.lock                 flock exclusivo mientras el proceso vive
+    {pid}/0000000001.log        segmentos; se rota al pasar WRITE_BEHIND_SEGMENTO_BYTES
+    {pid}/0000000001.ack        byte hasta el que el segmento ya está en Firestore
+
+Cada línea es "<crc32> <json>\\n"; una línea cortada por una caída se descarta.
+Las escrituras son set(merge=True) de {cédula: datos}, así que repetir un
+registro ya aplicado (caída entre el commit y el .ack) no cambia el resultado.
+Si un proceso muere, el drenador de otro proceso adopta su directorio (el
+flock queda libre) y termina de vaciarlo. ``iniciar()`` (desde
+ApiAppConfig.ready) arranca la cola al levantar el proceso si está activa o si
+quedaron segmentos de una ejecución anterior, aunque WRITE_BEHIND_ACTIVO se
+haya apagado: esos registros ya se confirmaron con 202.
+
+WRITE_BEHIND_DIR tiene que sobrevivir a los reinicios: en Render el disco del
+servicio es efímero y BASE_DIR/var se pierde en cada deploy, así que hay que
+montar un disco persistente y apuntar WRITE_BEHIND_DIR a él.
+"""
+import fcntl
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from . import metrics
+from .coalescing import fusionar_campos
+from .writes import LoteEscrituras
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+BACKOFF_INICIAL = 0.5
+BACKOFF_MAXIMO = 30.0
+VENTANA_TASA = 60  # segundos para calcular la tasa de drenado
+
+
+def _codificar(registro):
+    cuerpo = json.dumps(registro, separators=(',', ':'), ensure_ascii=False).encode()
+    return b"%08x %s\n" % (zlib.crc32(cuerpo), cuerpo)
+
+
+def _leer_registros(ruta, desde, hasta=None):
+    """
+    Registros completos del segmento a partir del byte ``desde``.
+
+    Yields:
+        tuple: (registro | None si la línea está corrupta, byte donde termina la línea)
+    """
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(desde)
+        posicion = desde
+        for linea in archivo:
+            if not linea.endswith(b"\n"):
+                return  # Escritura a medias (o cortada por una caída)
+            posicion += len(linea)
+            if hasta is not None and posicion > hasta:
+                return
+            crc, _, cuerpo = linea[:-1].partition(b" ")
+            try:
+                if int(crc, 16) != zlib.crc32(cuerpo):
+                    raise ValueError("crc")
+                yield json.loads(cuerpo), posicion
+            except ValueError:
+                yield None, posicion
+
+
+def _leer_ack(ruta_log):
+    try:
+        return int(ruta_log.with_suffix('.ack').read_text() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _escribir_ack(ruta_log, posicion):
+    temporal = ruta_log.with_suffix('.ack.tmp')
+    with open(temporal, 'w') as archivo:
+        archivo.write(str(posicion))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta_log.with_suffix('.ack'))
+
+
+class _Directorio:
+    """Directorio de segmentos de un proceso (propio o adoptado) con su flock"""
+
+    def __init__(self, ruta, lock):
+        self.ruta = ruta
+        self.lock = lock
+
+    def segmentos(self):
+        return sorted(self.ruta.glob('*.log'))
+
+    def liberar(self):
+        fcntl.flock(self.lock, fcntl.LOCK_UN)
+        self.lock.close()
+
+
+def _tomar_lock(ruta):
+    """Abre y bloquea ruta/.lock sin esperar; None si otro proceso lo tiene"""
+    archivo = open(ruta / '.lock', 'a')
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        archivo.close()
+        return None
+    return archivo
+
+
+class ColaEscrituras:
+    """Log local + drenador en segundo plano; una instancia por proceso"""
+
+    def __init__(self, directorio, tamano_segmento, tamano_lote, fsync=True):
+        self.raiz = Path(directorio)
+        self.tamano_segmento = tamano_segmento
+        self.tamano_lote = tamano_lote
+        self.fsync = fsync
+
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        ruta_propia = self.raiz / str(os.getpid())
+        ruta_propia.mkdir(exist_ok=True)
+        # Si un proceso muerto con el mismo pid dejó segmentos, se continúan
+        lock = _tomar_lock(ruta_propia)
+        if lock is None:
+            # Mismo pid vivo en otro host/contenedor que comparte el directorio
+            ruta_propia = self.raiz / f"{os.getpid()}-{int(time.time() * 1000)}"
+            ruta_propia.mkdir()
+            lock = _tomar_lock(ruta_propia)
+        self.propio = _Directorio(ruta_propia, lock)
+        self.adoptados = []
+
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._activo = None
+        self._ruta_activa = None
+        segmentos = self.propio.segmentos()
+        self._secuencia = int(segmentos[-1].stem) if segmentos else 0
+
+        self._pendientes = sum(self._contar_pendientes(ruta) for ruta in segmentos)
+        self._drenados = deque()
+        self._ultimo_error = None
+        self._reintento_en = None
+        self._ultimo_drenado = None
+
+        self._hilo = threading.Thread(target=self._drenar_siempre, name='write-behind', daemon=True)
+        self._hilo.start()
+
+    # ============================================
+    # PRODUCTOR
+    # ============================================
+    def _rotar(self):
+        if self._activo is not None:
+            self._activo.close()
+        self._secuencia += 1
+        self._ruta_activa = self.propio.ruta / f"{self._secuencia:010d}.log"
+        self._activo = open(self._ruta_activa, 'ab')
+
+    def encolar(self, referencia, campos, adicionales=()):
+        """
+        Agrega la escritura merge (y las adicionales, p. ej. el historial) al
+        log. Cuando retorna, el registro ya está en disco (fsync) y el drenador
+        lo enviará a Firestore.
+        """
+        registro = {'ruta': referencia.path, 'campos': campos, 't': time.time()}
+        if adicionales:
+            registro['adicionales'] = [[ref.path, extra] for ref, extra in adicionales]
+        linea = _codificar(registro)
+        with self._lock:
+            if self._activo is None or self._activo.tell() >= self.tamano_segmento:
+                self._rotar()
+            self._activo.write(linea)
+            self._activo.flush()
+            if self.fsync:
+                os.fsync(self._activo.fileno())
+            self._pendientes += 1
+        metrics.incrementar('write_behind.encolados')
+        self._despertar.set()
+
+    # ============================================
+    # DRENADOR
+    # ============================================
+    def _contar_pendientes(self, ruta):
+        return sum(1 for _ in _leer_registros(ruta, _leer_ack(ruta)))
+
+    def _adoptar_huerfanos(self):
+        """Toma los directorios de procesos muertos (su flock está libre)"""
+        en_uso = {self.propio.ruta} | {d.ruta for d in self.adoptados}
+        for ruta in self.raiz.iterdir():
+            if not ruta.is_dir() or ruta in en_uso:
+                continue
+            lock = _tomar_lock(ruta)
+            if lock is None:
+                continue
+            directorio = _Directorio(ruta, lock)
+            pendientes = sum(self._contar_pendientes(s) for s in directorio.segmentos())
+            with self._lock:
+                self._pendientes += pendientes
+            self.adoptados.append(directorio)
+            logger.info(f"📦 Write-behind: adoptado {ruta.name} con {pendientes} registros pendientes")
+
+    def _leer_lote(self):
+        """
+        Returns:
+            tuple: ([registros], {ruta del segmento: byte final}, líneas corruptas)
+        """
+        with self._lock:
+            secuencia = self._secuencia
+            hasta_activo = self._activo.tell() if self._activo is not None else None
+
+        registros, avances, corruptos = [], {}, 0
+        for directorio in [self.propio] + self.adoptados:
+            for ruta in directorio.segmentos():
+                cerrado, hasta = True, None
+                if directorio is self.propio:
+                    numero = int(ruta.stem)
+                    if numero > secuencia:
+                        continue  # Rotado después de la foto: en la próxima vuelta
+                    if numero == secuencia and hasta_activo is not None:
+                        # Segmento activo: solo hasta donde llegaba en la foto
+                        cerrado, hasta = False, hasta_activo
+                for registro, posicion in _leer_registros(ruta, _leer_ack(ruta), hasta):
+                    avances[ruta] = posicion
+                    if registro is None:
+                        corruptos += 1
+                        continue
+                    registros.append(registro)
+                    if len(registros) >= self.tamano_lote:
+                        return registros, avances, corruptos
+                if cerrado:
+                    # Segmento cerrado antes de la foto (o de un proceso muerto):
+                    # lo que quede es una línea cortada que nadie va a completar
+                    avances[ruta] = ruta.stat().st_size
+        return registros, avances, corruptos
+
+    def _aplicar(self, registros):
+        """Una escritura merge por documento (los registros del lote se fusionan en orden)"""
+        por_documento = {}
+        for registro in registros:
+            fusionar_campos(por_documento.setdefault(registro['ruta'], {}), registro['campos'])
+            for ruta, extra in registro.get('adicionales', ()):
+                fusionar_campos(por_documento.setdefault(ruta, {}), extra)
+
+        lote = LoteEscrituras()
+        for ruta, campos in por_documento.items():
+            lote.set(db.document(ruta), campos, merge=True)
+        inicio = time.perf_counter()
+        lote.commit()
+        metrics.observar('write_behind.commit_ms', (time.perf_counter() - inicio) * 1000)
+
+    def _confirmar(self, avances, cantidad):
+        with self._lock:
+            ruta_activa = self._ruta_activa
+            self._pendientes -= cantidad
+
+        for ruta, posicion in avances.items():
+            if ruta != ruta_activa and posicion >= ruta.stat().st_size:
+                # Segmento cerrado y aplicado completo
+                ruta.unlink()
+                ruta.with_suffix('.ack').unlink(missing_ok=True)
+            else:
+                _escribir_ack(ruta, posicion)
+
+        for directorio in list(self.adoptados):
+            if not directorio.segmentos():
+                shutil.rmtree(directorio.ruta, ignore_errors=True)
+                directorio.liberar()
+                self.adoptados.remove(directorio)
+
+        ahora = time.monotonic()
+        self._drenados.append((ahora, cantidad))
+        while self._drenados and ahora - self._drenados[0][0] > VENTANA_TASA:
+            self._drenados.popleft()
+        self._ultimo_drenado = time.time()
+
+    def _drenar_siempre(self):
+        espera = BACKOFF_INICIAL
+        ultima_adopcion = 0.0
+        while True:
+            try:
+                if time.monotonic() - ultima_adopcion > 30:
+                    ultima_adopcion = time.monotonic()
+                    self._adoptar_huerfanos()
+
+                registros, avances, corruptos = self._leer_lote()
+                if not avances:
+                    self._despertar.wait(1.0)
+                    self._despertar.clear()
+                    continue
+
+                if registros:
+                    self._aplicar(registros)
+                if corruptos:
+                    logger.error(f"❌ Write-behind: {corruptos} registros corruptos descartados")
+                    metrics.incrementar('write_behind.corruptos', corruptos)
+                self._confirmar(avances, len(registros) + corruptos)
+                metrics.incrementar('write_behind.drenados', len(registros))
+                metrics.observar('write_behind.tamano_lote', len(registros), (1, 10, 50, 100, 200, 400, 500))
+
+                espera = BACKOFF_INICIAL
+                self._ultimo_error = None
+                self._reintento_en = None
+            except Exception as e:
+                metrics.incrementar('write_behind.errores')
+                self._ultimo_error = str(e)
+                # Backoff exponencial con jitter; los registros siguen en disco
+                pausa = espera * (0.5 + random.random() / 2)
+                self._reintento_en = time.time() + pausa
+                logger.error(f"❌ Write-behind: error al drenar, reintento en {pausa:.1f}s: {str(e)}")
+                time.sleep(pausa)
+                espera = min(espera * 2, BACKOFF_MAXIMO)
+
+    # ============================================
+    # ESTADO
+    # ============================================
+    def estado(self):
+        directorios = [self.propio] + self.adoptados
+        segmentos = [ruta for d in directorios for ruta in d.segmentos()]
+        bytes_pendientes = 0
+        for ruta in segmentos:
+            try:
+                bytes_pendientes += max(ruta.stat().st_size - _leer_ack(ruta), 0)
+            except FileNotFoundError:
+                continue
+
+        ahora = time.monotonic()
+        drenados = sum(n for t, n in list(self._drenados) if ahora - t <= VENTANA_TASA)
+        return {
+            'activo': settings.WRITE_BEHIND_ACTIVO,
+            'pid': os.getpid(),
+            'pendientes': self._pendientes,
+            'bytesPendientes': bytes_pendientes,
+            'segmentos': len(segmentos),
+            'directoriosAdoptados': [d.ruta.name for d in self.adoptados],
+            'drenadosUltimoMinuto': drenados,
+            'tasaDrenadoPorSegundo': round(drenados / VENTANA_TASA, 2),
+            'ultimoDrenado': self._ultimo_drenado,
+            'ultimoError': self._ultimo_error,
+            'reintentoEn': self._reintento_en,
+        }
+
+
+_cola = None
+_lock_global = threading.Lock()
+
+
+def obtener_cola():
+    global _cola
+    if _cola is None:
+        with _lock_global:
+            if _cola is None:
+                _cola = ColaEscrituras(
+                    settings.WRITE_BEHIND_DIR,
+                    settings.WRITE_BEHIND_SEGMENTO_BYTES,
+                    settings.WRITE_BEHIND_LOTE,
+                    fsync=settings.WRITE_BEHIND_FSYNC
+                )
+    return _cola
+
+
+def iniciar():
+    """Arranca la cola si está activa o si hay segmentos pendientes de otra ejecución"""
+    raiz = Path(settings.WRITE_BEHIND_DIR)
+    if settings.WRITE_BEHIND_ACTIVO or any(raiz.glob('*/*.log')):
+        obtener_cola()
+        logger.info(f"📝 Write-behind iniciado en {raiz}")
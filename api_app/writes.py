@@ -0,0 +1,72 @@
+# api_app/writes.py
+"""
+Escrituras agrupadas en WriteBatch.
+"""
+import logging
+
+from firebase_admin import firestore
+
+logger = logging.getLogger(__name__)
+db = firestore.client()
+
+# Límite de Firestore por commit
+MAX_OPERACIONES_LOTE = 500
+
+
+class LoteEscrituras:
+    """
+    Misma interfaz que WriteBatch (set/create/update/delete/commit), pero parte
+    las operaciones en varios WriteBatch si se supera el límite de 500.
+
+    Con 500 operaciones o menos es un único commit atómico. Por encima, cada
+    trozo es atómico por separado y se confirman en orden.
+    """
+
+    def __init__(self, tamano=MAX_OPERACIONES_LOTE):
+        self.tamano = tamano
+        self._lotes = [db.batch()]
+        self._en_lote_actual = 0
+        self.operaciones = 0
+
+    def _lote(self):
+        if self._en_lote_actual >= self.tamano:
+            self._lotes.append(db.batch())
+            self._en_lote_actual = 0
+        self._en_lote_actual += 1
+        self.operaciones += 1
+        return self._lotes[-1]
+
+    def set(self, referencia, data, merge=False):
+        self._lote().set(referencia, data, merge=merge)
+
+    def create(self, referencia, data):
+        self._lote().create(referencia, data)
+
+    def update(self, referencia, data, option=None):
+        self._lote().update(referencia, data, option=option)
+
+    def delete(self, referencia, option=None):
+        self._lote().delete(referencia, option=option)
+
+    @property
+    def commits(self):
+        return len(self._lotes) if self.operaciones else 0
+
+    def commit(self, timeout=None):
+        """
+        Confirma todos los trozos en orden.
+
+        Returns:
+            list: WriteResults de todas las operaciones
+        """
+        resultados = []
+        if not self.operaciones:
+            return resultados
+
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        for lote in self._lotes:
+            resultados.extend(lote.commit(**kwargs))
+
+        if len(self._lotes) > 1:
+            logger.warning(f"⚠️ Lote de {self.operaciones} escrituras partido en {len(self._lotes)} commits")
+        return resultados
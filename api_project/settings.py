@@ -41,7 +41,9 @@ INSTALLED_APPS = [
     'api_app',
 ]
 
-MIDDLEWARE = [
+MIDDLEWARE_COMPLETO = [
+    'api_app.profiling.ProfilingMiddleware',  # primero: el perfil incluye todo el stack
+    'api_app.deadlines.PlazoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # ← DEBE estar AQUÍ (segundo)
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+MIDDLEWARE = MIDDLEWARE_COMPLETO
 
 ROOT_URLCONF = 'api_project.urls'
 
@@ -83,6 +86,21 @@ CORS_ALLOW_HEADERS = [
     'x-user-uid',
     'x-user-email',
     'x-user-name',
+    # GET condicionales (ETag / Last-Modified)
+    'if-none-match',
+    'if-modified-since',
+    # Perfilado bajo demanda
+    'x-profile-token',
+]
+
+# Headers de respuesta que el frontend puede leer
+CORS_EXPOSE_HEADERS = [
+    'etag',
+    'last-modified',
+    'x-profile-id',
+    'x-snapshot-age',
+    'x-snapshot-generated',
+    'warning',
 ]
 
 # Métodos HTTP permitidos
@@ -121,7 +139,8 @@ WSGI_APPLICATION = 'api_project.wsgi.application'
 # -------------------------
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.dummy',
+        'ENGINE': os.getenv('DJANGO_DB_ENGINE', 'django.db.backends.dummy'),
+        'NAME': os.getenv('DJANGO_DB_NAME', ''),
     }
 }
 
@@ -129,15 +148,189 @@ DATABASES = {
 # REST Framework Configuration
 # -------------------------
 REST_FRAMEWORK = {
+    # El primero es el que se usa cuando el cliente no envía Accept
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api_app.renderers.FastJSONRenderer',
+        'api_app.renderers.MessagePackRenderer',
+        'api_app.renderers.LegacyMessagePackRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
+        'api_app.parsers.MessagePackParser',
+        'api_app.parsers.LegacyMessagePackParser',
     ],
 }
 
+# -------------------------
+# Perfil de ejecución
+# -------------------------
+# DJANGO_PERFIL=api: solo lo que usa la API. La identidad llega en X-User-UID y
+# la base de datos es dummy, así que sesiones, auth, mensajes, CSRF y
+# clickjacking no aportan nada en /api/. Sin base de datos real (DJANGO_DB_ENGINE)
+# tampoco se instalan admin, auth, contenttypes, sessions ni messages, y
+# /admin/ no se sirve. Comparar con: python manage.py bench_middleware
+PERFIL = os.getenv('DJANGO_PERFIL', 'completo')
+BASE_DE_DATOS_REAL = DATABASES['default']['ENGINE'] != 'django.db.backends.dummy'
+
+APPS_CON_BASE_DE_DATOS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+]
+MIDDLEWARE_API = [
+    'api_app.profiling.ProfilingMiddleware',
+    'api_app.deadlines.PlazoMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+# DRF sin autenticación de Django (SessionAuthentication/BasicAuthentication)
+REST_FRAMEWORK_API = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
+
+if PERFIL == 'api':
+    REST_FRAMEWORK.update(REST_FRAMEWORK_API)
+    if not BASE_DE_DATOS_REAL:
+        INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in APPS_CON_BASE_DE_DATOS]
+        MIDDLEWARE = MIDDLEWARE_API
+        TEMPLATES[0]['OPTIONS']['context_processors'] = [
+            'django.template.context_processors.debug',
+            'django.template.context_processors.request',
+        ]
+
+# La interfaz navegable solo en desarrollo (necesita auth para mostrar el usuario)
+if DEBUG and PERFIL != 'api':
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'rest_framework.renderers.BrowsableAPIRenderer'
+    )
+
+# -------------------------
+# Borrado en cascada (cursos con subcolecciones)
+# -------------------------
+# Por encima de este número de documentos descendientes el borrado se hace en segundo plano
+BORRADO_UMBRAL_SINCRONO = int(os.getenv('BORRADO_UMBRAL_SINCRONO', '500'))
+BORRADO_HILOS = int(os.getenv('BORRADO_HILOS', '4'))
+BORRADO_OPS_POR_SEGUNDO = int(os.getenv('BORRADO_OPS_POR_SEGUNDO', '500'))
+BORRADO_MAX_OPS_POR_SEGUNDO = int(os.getenv('BORRADO_MAX_OPS_POR_SEGUNDO', '1000'))
+
+# -------------------------
+# Horarios
+# -------------------------
+# Intentos de las transacciones que editan/eliminan clases bajo contención
+HORARIO_MAX_REINTENTOS = int(os.getenv('HORARIO_MAX_REINTENTOS', '5'))
+# Segundos entre reconstrucciones completas del índice de aulas (recoge cambios de otros procesos)
+INDICE_AULAS_TTL = int(os.getenv('INDICE_AULAS_TTL', '120'))
+
+# -------------------------
+# Ingesta de asistencias
+# -------------------------
+# Eventos por petición a /api/asistencias/lote/ (un commit de Firestore admite 500 escrituras)
+ASISTENCIA_LOTE_MAX = int(os.getenv('ASISTENCIA_LOTE_MAX', '500'))
+# Claves de idempotencia recordadas por proceso y durante cuántos segundos
+ASISTENCIA_IDEMPOTENCIA_MAX = int(os.getenv('ASISTENCIA_IDEMPOTENCIA_MAX', '200000'))
+ASISTENCIA_IDEMPOTENCIA_TTL = int(os.getenv('ASISTENCIA_IDEMPOTENCIA_TTL', '86400'))
+# Un registro es tardío si llega más de N minutos después del inicio de la clase;
+# se asocia a una clase si llega hasta M minutos antes de que empiece
+ASISTENCIA_TOLERANCIA_MINUTOS = int(os.getenv('ASISTENCIA_TOLERANCIA_MINUTOS', '10'))
+ASISTENCIA_ANTICIPACION_MINUTOS = int(os.getenv('ASISTENCIA_ANTICIPACION_MINUTOS', '30'))
+# Horarios de cursos en caché para calcular tardanzas
+CALENDARIO_CURSOS_MAX = int(os.getenv('CALENDARIO_CURSOS_MAX', '5000'))
+CALENDARIO_CURSOS_TTL = int(os.getenv('CALENDARIO_CURSOS_TTL', '300'))
+# Listas de clase (estudianteID) en caché por curso y grupo: validan los
+# registros y calculan los ausentes al cerrar la sesión
+LISTAS_CLASE_MAX = int(os.getenv('LISTAS_CLASE_MAX', '5000'))
+LISTAS_CLASE_TTL = int(os.getenv('LISTAS_CLASE_TTL', '300'))
+
+# Página por defecto y máxima de /api/estudiantes/<cedula>/asistencias/
+HISTORIAL_PAGINA = int(os.getenv('HISTORIAL_PAGINA', '50'))
+HISTORIAL_PAGINA_MAX = int(os.getenv('HISTORIAL_PAGINA_MAX', '200'))
+
+# Hilos por proceso para sub-consultas concurrentes de una petición (/api/bootstrap/)
+CONSULTAS_HILOS = int(os.getenv('CONSULTAS_HILOS', '8'))
+# Sub-peticiones máximas por POST /api/batch/
+BATCH_MAX_SUBPETICIONES = int(os.getenv('BATCH_MAX_SUBPETICIONES', '20'))
+
+# Shards por sesión de asistencia para cursos sin 'asistenciaShards' (0 = un documento por fecha)
+ASISTENCIA_SHARDS = int(os.getenv('ASISTENCIA_SHARDS', '0'))
+# Archivo de periodos cerrados (python manage.py archivar_asistencias): meses en
+# que empieza cada periodo académico (el corte por defecto es el inicio del
+# periodo actual) y tamaño máximo estimado de un documento de archivo (Firestore
+# admite 1 MiB)
+ARCHIVO_MESES_PERIODO = [int(mes) for mes in os.getenv('ARCHIVO_MESES_PERIODO', '1,7').split(',') if mes.strip()]
+ARCHIVO_MAX_BYTES = int(os.getenv('ARCHIVO_MAX_BYTES', '800000'))
+# Ventana (ms) en la que se agrupan los registros concurrentes sobre el mismo
+# documento de asistencias del día; 0 desactiva la agrupación. Solo agrupa
+# peticiones del mismo proceso: requiere workers con hilos (render.yaml usa
+# gunicorn --worker-class gthread --threads 8); con el worker sync cada
+# registro pagaría la ventana sin agrupar nada, así que ahí debe ser 0
+COALESCENCIA_VENTANA_MS = float(os.getenv('COALESCENCIA_VENTANA_MS', '15'))
+COALESCENCIA_MAX_ESCRITURAS = int(os.getenv('COALESCENCIA_MAX_ESCRITURAS', '200'))
+
+# Write-behind: AsistenciaCreate responde tras escribir en un log local y un
+# hilo por proceso lo envía a Firestore (ver api_app/writebehind.py)
+WRITE_BEHIND_ACTIVO = os.getenv('WRITE_BEHIND_ACTIVO', 'False') == 'True'
+# Debe ser persistente: en Render BASE_DIR/var se pierde en cada deploy (montar
+# un disco y apuntar aquí); los segmentos pendientes se reenvían al arrancar
+WRITE_BEHIND_DIR = os.getenv('WRITE_BEHIND_DIR', BASE_DIR / 'var' / 'write_behind')
+WRITE_BEHIND_SEGMENTO_BYTES = int(os.getenv('WRITE_BEHIND_SEGMENTO_BYTES', str(4 * 1024 * 1024)))
+# Registros por commit al drenar (máximo 500 documentos por commit)
+WRITE_BEHIND_LOTE = int(os.getenv('WRITE_BEHIND_LOTE', '400'))
+# fsync por registro; sin él una caída del sistema operativo puede perder los últimos registros
+WRITE_BEHIND_FSYNC = os.getenv('WRITE_BEHIND_FSYNC', 'True') == 'True'
+
+# -------------------------
+# Trabajos en segundo plano
+# -------------------------
+# Registro local compartido por los workers de la máquina (no requiere broker)
+TRABAJOS_DB_PATH = os.getenv('TRABAJOS_DB_PATH', BASE_DIR / 'var' / 'trabajos.sqlite3')
+TRABAJOS_MAX_CONCURRENCIA = int(os.getenv('TRABAJOS_MAX_CONCURRENCIA', '2'))
+TRABAJOS_RETENCION_HORAS = int(os.getenv('TRABAJOS_RETENCION_HORAS', '24'))
+
+# -------------------------
+# Perfilado de peticiones
+# -------------------------
+# Fracción de peticiones perfiladas con cProfile (0 = ninguna, salvo las que
+# traen X-Profile-Token igual a PERFILADO_TOKEN; sin token el header se ignora)
+PERFILADO_MUESTREO = float(os.getenv('PERFILADO_MUESTREO', '0'))
+PERFILADO_TOKEN = os.getenv('PERFILADO_TOKEN', '')
+PERFILADO_DIR = os.getenv('PERFILADO_DIR', BASE_DIR / 'var' / 'perfiles')
+PERFILADO_MAX_ARCHIVOS = int(os.getenv('PERFILADO_MAX_ARCHIVOS', '500'))
+
+# -------------------------
+# Snapshot de datos de referencia
+# -------------------------
+# Cursos, grupos, personas y membresías en MessagePack (ver api_app/snapshot.py).
+# Cada worker lo carga al arrancar para calentar sus cachés y, si Firestore no
+# responde, los endpoints de horarios y cursos lo usan durante
+# SNAPSHOT_DEGRADADO_SEGUNDOS tras el último fallo
+SNAPSHOT_RUTA = os.getenv('SNAPSHOT_RUTA', BASE_DIR / 'var' / 'snapshot.msgpack')
+# Segundos entre regeneraciones automáticas (0 = solo con manage.py generar_snapshot)
+SNAPSHOT_INTERVALO = int(os.getenv('SNAPSHOT_INTERVALO', '0'))
+SNAPSHOT_CARGAR_AL_INICIAR = os.getenv('SNAPSHOT_CARGAR_AL_INICIAR', 'True') == 'True'
+SNAPSHOT_DEGRADADO_SEGUNDOS = int(os.getenv('SNAPSHOT_DEGRADADO_SEGUNDOS', '30'))
+
+# -------------------------
+# Plazos y lecturas cubiertas
+# -------------------------
+# Tiempo total de cada petición para sus llamadas a Firestore (ver
+# api_app/deadlines.py); menor que el proxy_read_timeout de nginx (60 s).
+# 0 desactiva el plazo y con él los duplicados
+PLAZO_PETICION_SEGUNDOS = float(os.getenv('PLAZO_PETICION_SEGUNDOS', '20'))
+# Lecturas cubiertas: se lanza un duplicado cuando la lectura pasa el percentil
+# COBERTURA_PERCENTIL de las últimas COBERTURA_VENTANA latencias del método
+# (desde COBERTURA_MIN_MUESTRAS muestras y nunca antes de COBERTURA_MIN_MS)
+COBERTURA_ACTIVA = os.getenv('COBERTURA_ACTIVA', 'True') == 'True'
+COBERTURA_PERCENTIL = float(os.getenv('COBERTURA_PERCENTIL', '95'))
+COBERTURA_VENTANA = int(os.getenv('COBERTURA_VENTANA', '500'))
+COBERTURA_MIN_MUESTRAS = int(os.getenv('COBERTURA_MIN_MUESTRAS', '50'))
+COBERTURA_MIN_MS = float(os.getenv('COBERTURA_MIN_MS', '10'))
+# Hilos para las lecturas con plazo (primera llamada y duplicado)
+COBERTURA_HILOS = int(os.getenv('COBERTURA_HILOS', '16'))
+
 # -------------------------
 # Passwords
 # -------------------------
@@ -14,10 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path,include
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/',include('api_app.urls'))
-]
\ No newline at end of file
+]
+
+# El perfil 'api' sin base de datos real no instala el admin
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urlpatterns.append(path('admin/', admin.site.urls))